@@ -0,0 +1,110 @@
+"""
+Microbenchmark: server-side decode cost per audio uplink stream.
+
+Encodes a few seconds of synthetic speech-band audio to Opus (20 ms packets, as the browser's
+WebCodecs encoder sends them) and times `speaksee.audio_codec` decoding it back to 16 kHz PCM16.
+
+    python benchmarks/bench_audio_decode.py [--seconds 30] [--bitrate 24000]
+
+Prints one JSON line per format so results can be compared across commits.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from speaksee.audio_codec import available_formats, create_decoder  # noqa: E402
+
+SAMPLE_RATE = 16000
+FRAME_MS = 20
+
+
+def _synthetic_pcm16(seconds: float) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    # A few formant-ish tones with a syllable-rate envelope plus a little noise.
+    x = sum(np.sin(2 * np.pi * f * t) for f in (180.0, 720.0, 1240.0, 2600.0)) / 4.0
+    x *= 0.5 + 0.5 * np.sin(2 * np.pi * 4.0 * t) ** 2
+    x += 0.02 * rng.standard_normal(t.size)
+    return (np.clip(x * 0.4, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def _frames(pcm: np.ndarray) -> list[bytes]:
+    n = SAMPLE_RATE * FRAME_MS // 1000
+    return [pcm[i : i + n].tobytes() for i in range(0, pcm.size - n + 1, n)]
+
+
+def _opus_packets(pcm: np.ndarray, bitrate: int) -> list[bytes]:
+    import av
+
+    enc = av.codec.CodecContext.create("libopus", "w")
+    enc.sample_rate = SAMPLE_RATE
+    enc.layout = "mono"
+    enc.format = "s16"
+    enc.bit_rate = bitrate
+    enc.options = {"frame_duration": str(FRAME_MS)}
+    enc.open()
+
+    packets: list[bytes] = []
+    pts = 0
+    for raw in _frames(pcm):
+        samples = np.frombuffer(raw, dtype=np.int16)
+        frame = av.AudioFrame.from_ndarray(samples.reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = SAMPLE_RATE
+        frame.pts = pts
+        pts += samples.size
+        packets.extend(bytes(p) for p in enc.encode(frame))
+    packets.extend(bytes(p) for p in enc.encode(None))
+    return packets
+
+
+def _bench(fmt: str, frames: list[bytes], seconds: float, repeats: int) -> dict[str, object]:
+    best = float("inf")
+    out_samples = 0
+    for _ in range(repeats):
+        dec = create_decoder(fmt, SAMPLE_RATE)
+        t0 = time.perf_counter()
+        out = bytearray()
+        for f in frames:
+            out += dec.decode(f)
+        out += dec.flush()
+        best = min(best, time.perf_counter() - t0)
+        out_samples = len(out) // 2
+    return {
+        "format": fmt,
+        "audio_s": round(seconds, 3),
+        "uplink_bytes_per_s": round(sum(len(f) for f in frames) / seconds, 1),
+        "decode_s": round(best, 6),
+        "us_per_frame": round(best / max(1, len(frames)) * 1e6, 2),
+        "realtime_factor": round(best / seconds, 6),
+        "streams_per_core": int(seconds / best) if best > 0 else None,
+        "decoded_samples": out_samples,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--seconds", type=float, default=30.0)
+    ap.add_argument("--bitrate", type=int, default=24000)
+    ap.add_argument("--repeats", type=int, default=5)
+    args = ap.parse_args()
+
+    pcm = _synthetic_pcm16(args.seconds)
+    inputs = {"pcm16": _frames(pcm)}
+    if "opus" in available_formats():
+        inputs["opus"] = _opus_packets(pcm, args.bitrate)
+
+    for fmt, frames in inputs.items():
+        print(json.dumps(_bench(fmt, frames, args.seconds, args.repeats)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Startup benchmark: how long until a fresh server process answers its first client.
+
+Each repeat runs in a new interpreter (imports are only slow once per process) and times:
+
+- import_s: `import speaksee.server`
+- create_app_s: building the app and its (not yet loaded) models
+- startup_s: the app's startup (lifespan) hooks
+- first_connect_s: first `/ws` connection -> its `models` message, while the hardware probe may
+  still be running in the background
+- connect_s: a later connection, once the probe is done
+- heavy_modules: torch / diffusers / faster_whisper / ... already imported by `import speaksee.server`
+
+    python benchmarks/bench_startup.py [--repeats 5] [--device auto]
+        [--max-import-s 1.5] [--max-first-connect-s 0.5]
+
+Prints one JSON document (median and max per phase) so results can be compared across commits, and
+exits non-zero when a heavy module is imported up front or a `--max-*` budget is exceeded.
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HEAVY = ("torch", "diffusers", "transformers", "faster_whisper", "ctranslate2", "av", "pyttsx3")
+PHASES = ("import_s", "create_app_s", "startup_s", "first_connect_s", "connect_s", "total_s")
+
+
+def _child(device: str) -> dict[str, Any]:
+    t0 = time.perf_counter()
+    from speaksee.config import load_config
+    from speaksee.server import create_app
+
+    t1 = time.perf_counter()
+    heavy = sorted(m for m in HEAVY if m in sys.modules)
+
+    from fastapi.testclient import TestClient
+
+    from speaksee.hardware import probe
+
+    tmp = Path(tempfile.mkdtemp(prefix="speaksee-bench-"))
+    cfg = dataclasses.replace(
+        load_config(),
+        data_dir=tmp,
+        gallery_dir=tmp / "gallery",
+        saved_dir=tmp / "saved",
+        device_preference=device,
+    )
+    cfg.gallery_dir.mkdir()
+    cfg.saved_dir.mkdir()
+    t2 = time.perf_counter()
+    app = create_app(cfg)
+    t3 = time.perf_counter()
+
+    def connect() -> float:
+        start = time.perf_counter()
+        with client.websocket_connect("/ws") as ws:
+            while ws.receive_json().get("type") != "models":
+                pass
+        return time.perf_counter() - start
+
+    with TestClient(app) as client:
+        t4 = time.perf_counter()
+        first = connect()
+        probe()
+        later = connect()
+    return {
+        "import_s": t1 - t0,
+        "create_app_s": t3 - t2,
+        "startup_s": t4 - t3,
+        "first_connect_s": first,
+        "connect_s": later,
+        "heavy_modules": heavy,
+    }
+
+
+def _run_once(device: str) -> dict[str, Any]:
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", "--device", device],
+        capture_output=True,
+        text=True,
+        check=False,
+        env={**os.environ, "SPEAKSEE_OFFLINE": "1"},
+    )
+    total = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise SystemExit(f"startup run failed:\n{proc.stderr}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result["total_s"] = total
+    return result
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--repeats", type=int, default=5)
+    ap.add_argument("--device", default="auto", choices=("auto", "cpu", "mps", "cuda"))
+    ap.add_argument("--max-import-s", type=float, help="fail when the median import time is above this")
+    ap.add_argument("--max-first-connect-s", type=float, help="fail when the median first connection is slower")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        print(json.dumps(_child(args.device)))
+        return
+
+    runs = [_run_once(args.device) for _ in range(max(1, args.repeats))]
+    results: dict[str, Any] = {
+        "device": args.device,
+        "repeats": len(runs),
+        "phases": {
+            p: {
+                "median": round(statistics.median(r[p] for r in runs), 4),
+                "max": round(max(r[p] for r in runs), 4),
+            }
+            for p in PHASES
+        },
+        "heavy_modules": sorted({m for r in runs for m in r["heavy_modules"]}),
+    }
+    print(json.dumps(results, indent=2))
+
+    failures = []
+    if results["heavy_modules"]:
+        failures.append(f"imported at startup: {', '.join(results['heavy_modules'])}")
+    for phase, limit in (("import_s", args.max_import_s), ("first_connect_s", args.max_first_connect_s)):
+        median = results["phases"][phase]["median"]
+        if limit is not None and median > limit:
+            failures.append(f"{phase} {median:.3f}s > {limit:.3f}s")
+    if failures:
+        sys.exit("startup regression: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
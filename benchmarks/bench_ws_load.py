@@ -0,0 +1,332 @@
+"""
+Load benchmark: N concurrent simulated clients driving `/ws` end to end.
+
+Each client repeatedly streams a WAV file as real-time PCM16 frames between `audio_start` and
+`audio_stop`, sends `generate` with the transcript (or `--prompt` when nothing was recognized), and
+optionally actions such as `save_image`. Per utterance it records:
+
+- time_to_partial: `audio_start` -> first `transcript_partial`
+- time_to_final: `audio_stop` -> `transcript_final`
+- time_to_preview: `generate` -> `gen_preview` (two-pass only)
+- time_to_result: `generate` -> full `gen_result`
+- speak_to_image: `audio_stop` -> full `gen_result`
+
+By default a server is started in-process on CPU with tiny models (the same tiny pipeline as
+tests/test_smoke_ws.py); `--url` targets a running server instead.
+
+    python benchmarks/bench_ws_load.py [--clients 4] [--iterations 3] [--wav a.wav ...]
+        [--url ws://127.0.0.1:7860/ws] [--out results.json]
+
+Prints one JSON document (p50/p95/p99 per metric, plus commit and settings) so results can be
+compared across commits.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import math
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+
+FRAME_MS = 20
+TINY_SD = "hf-internal-testing/tiny-stable-diffusion-pipe"
+TINY_WHISPER = "Systran/faster-whisper-tiny"
+METRICS = ("time_to_partial", "time_to_final", "time_to_preview", "time_to_result", "speak_to_image")
+
+
+@dataclasses.dataclass(frozen=True)
+class Utterance:
+    name: str
+    pcm16: bytes  # mono
+    sample_rate: int
+
+    @property
+    def seconds(self) -> float:
+        return len(self.pcm16) / 2 / self.sample_rate
+
+
+def _read_wav(path: Path) -> Utterance:
+    with wave.open(str(path), "rb") as w:
+        if w.getsampwidth() != 2:
+            raise SystemExit(f"{path}: only 16-bit PCM WAV files are supported")
+        channels, rate = w.getnchannels(), w.getframerate()
+        raw = w.readframes(w.getnframes())
+    a = np.frombuffer(raw, dtype=np.int16)
+    if channels > 1:
+        a = a.reshape(-1, channels).mean(axis=1).astype(np.int16)
+    return Utterance(path.name, a.tobytes(), rate)
+
+
+def _synthetic_utterance(seconds: float = 3.0, rate: int = 48000) -> Utterance:
+    # Speech-band tones with a syllable-rate envelope: exercises the audio path and the decoder,
+    # though Whisper will rarely recognize words in it (then --prompt is used).
+    rng = np.random.default_rng(0)
+    t = np.arange(int(rate * seconds)) / rate
+    x = sum(np.sin(2 * np.pi * f * t) for f in (180.0, 720.0, 1240.0, 2600.0)) / 4.0
+    x *= 0.5 + 0.5 * np.sin(2 * np.pi * 4.0 * t) ** 2
+    x += 0.02 * rng.standard_normal(t.size)
+    return Utterance("synthetic", (np.clip(x * 0.4, -1.0, 1.0) * 32767).astype(np.int16).tobytes(), rate)
+
+
+def _percentile(values: list[float], q: float) -> float:
+    s = sorted(values)
+    k = (len(s) - 1) * q
+    lo, hi = math.floor(k), math.ceil(k)
+    return s[lo] + (s[hi] - s[lo]) * (k - lo)
+
+
+def _summary(values: list[float]) -> dict[str, Any]:
+    if not values:
+        return {"n": 0}
+    return {
+        "n": len(values),
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(_percentile(values, 0.50), 4),
+        "p95": round(_percentile(values, 0.95), 4),
+        "p99": round(_percentile(values, 0.99), 4),
+        "max": round(max(values), 4),
+    }
+
+
+class _Client:
+    def __init__(self, idx: int, url: str, args: argparse.Namespace, utterances: list[Utterance]):
+        self.idx = idx
+        self.url = url
+        self.args = args
+        self.utterances = utterances
+        self.samples: dict[str, list[float]] = {m: [] for m in METRICS}
+        self.errors: list[str] = []
+        self._inbox: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self._first_partial: Optional[float] = None
+
+    async def _reader(self, ws: Any) -> None:
+        async for raw in ws:
+            msg = json.loads(raw)
+            if msg.get("type") == "transcript_partial" and self._first_partial is None:
+                self._first_partial = time.perf_counter()
+            await self._inbox.put(msg)
+
+    async def _until(self, *types: str) -> tuple[dict[str, Any], float]:
+        deadline = time.perf_counter() + self.args.timeout
+        while True:
+            msg = await asyncio.wait_for(self._inbox.get(), max(0.01, deadline - time.perf_counter()))
+            mtype = msg.get("type")
+            if mtype == "error":
+                raise RuntimeError(f"{msg.get('message')}: {msg.get('detail', '')}")
+            if mtype in types:
+                return msg, time.perf_counter()
+
+    async def _stream(self, ws: Any, utt: Utterance) -> None:
+        frame_bytes = utt.sample_rate * FRAME_MS // 1000 * 2
+        t0 = time.perf_counter()
+        for n, i in enumerate(range(0, len(utt.pcm16), frame_bytes)):
+            await ws.send(utt.pcm16[i : i + frame_bytes])
+            # Real time: frame n is due n * 20 ms after the first one.
+            delay = t0 + (n + 1) * FRAME_MS / 1000 - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _iteration(self, ws: Any, utt: Utterance) -> None:
+        self._first_partial = None
+        t_start = time.perf_counter()
+        await ws.send(json.dumps({"type": "audio_start", "format": "pcm16", "sample_rate": utt.sample_rate}))
+        await self._stream(ws, utt)
+        t_stop = time.perf_counter()
+        await ws.send(json.dumps({"type": "audio_stop"}))
+        final, t_final = await self._until("transcript_final")
+        if self._first_partial is not None:
+            self.samples["time_to_partial"].append(self._first_partial - t_start)
+        self.samples["time_to_final"].append(t_final - t_stop)
+        if final.get("command"):
+            return  # the server ran a voice command; nothing to generate
+
+        prompt = (final.get("text") or "").strip() or self.args.prompt
+        msg: dict[str, Any] = {"type": "generate", "prompt": prompt}
+        if final.get("trace_id"):
+            msg["trace_id"] = final["trace_id"]
+        t_gen = time.perf_counter()
+        await ws.send(json.dumps(msg))
+        result, t_result = await self._until("gen_preview", "gen_result")
+        if result.get("type") == "gen_preview":
+            self.samples["time_to_preview"].append(t_result - t_gen)
+            result, t_result = await self._until("gen_result")
+        self.samples["time_to_result"].append(t_result - t_gen)
+        self.samples["speak_to_image"].append(t_result - t_stop)
+
+        for action in self.args.action:
+            await ws.send(json.dumps({"type": "action", "name": action}))
+            if action == "save_image":
+                await self._until("saved")
+            else:
+                await self._until("gen_result")
+
+    async def run(self) -> None:
+        import websockets
+
+        # Stagger connections a little so clients don't all speak in lockstep.
+        await asyncio.sleep(self.idx * self.args.stagger)
+        async with websockets.connect(self.url, max_size=None) as ws:
+            reader = asyncio.create_task(self._reader(ws))
+            try:
+                await ws.send(json.dumps({"type": "hello", "ui_version": "1", "client": "bench"}))
+                for i in range(self.args.iterations):
+                    utt = self.utterances[(self.idx + i) % len(self.utterances)]
+                    try:
+                        await self._iteration(ws, utt)
+                    except Exception as e:
+                        self.errors.append(f"{type(e).__name__}: {e}")
+                        self._inbox = asyncio.Queue()
+            finally:
+                reader.cancel()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+def _start_server(args: argparse.Namespace) -> tuple[str, Any]:
+    import uvicorn
+
+    from speaksee.config import load_config
+    from speaksee.server import _set_privacy_env_defaults, create_app
+
+    tmp = Path(tempfile.mkdtemp(prefix="speaksee-bench-"))
+    for d in ("gallery", "saved"):
+        (tmp / d).mkdir()
+    # Keep the configured model cache (HF_HOME) but write images to a scratch directory.
+    cfg = dataclasses.replace(
+        load_config(),
+        host="127.0.0.1",
+        port=_free_port(),
+        data_dir=tmp,
+        gallery_dir=tmp / "gallery",
+        saved_dir=tmp / "saved",
+        sd_model=args.sd_model,
+        sd_models=(),
+        whisper_model=args.whisper_model,
+        steps=args.steps,
+        width=args.size,
+        height=args.size,
+        device_preference=args.device,
+    )
+    _set_privacy_env_defaults(cfg)
+    server = uvicorn.Server(uvicorn.Config(create_app(cfg), host=cfg.host, port=cfg.port, log_level="warning"))
+    threading.Thread(target=server.run, name="bench-server", daemon=True).start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise SystemExit("server did not start")
+        time.sleep(0.05)
+    return f"ws://{cfg.host}:{cfg.port}/ws", server
+
+
+async def _warm_up(url: str, args: argparse.Namespace) -> None:
+    # Load both models before timing anything: one utterance + one generation, not recorded.
+    warm = argparse.Namespace(**{**vars(args), "iterations": 1, "action": [], "stagger": 0.0})
+    client = _Client(0, url, warm, [_synthetic_utterance(1.5)])
+    await client.run()
+    if client.errors:
+        raise SystemExit(f"warm-up failed: {client.errors[0]}")
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return ""
+
+
+async def _run(args: argparse.Namespace, url: str, utterances: list[Utterance]) -> dict[str, Any]:
+    if not args.no_warmup:
+        await _warm_up(url, args)
+    clients = [_Client(i, url, args, utterances) for i in range(args.clients)]
+    t0 = time.perf_counter()
+    await asyncio.gather(*(c.run() for c in clients))
+    wall_s = time.perf_counter() - t0
+
+    samples = {m: [v for c in clients for v in c.samples[m]] for m in METRICS}
+    errors = [e for c in clients for e in c.errors]
+    return {
+        "benchmark": "ws_load",
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "settings": {
+            "clients": args.clients,
+            "iterations": args.iterations,
+            "utterances": [{"name": u.name, "seconds": round(u.seconds, 2)} for u in utterances],
+            "actions": args.action,
+            "server": args.url or "in-process",
+            "sd_model": None if args.url else args.sd_model,
+            "whisper_model": None if args.url else args.whisper_model,
+            "steps": None if args.url else args.steps,
+            "size": None if args.url else args.size,
+        },
+        "wall_s": round(wall_s, 3),
+        "utterances_per_min": round(len(samples["time_to_final"]) / wall_s * 60, 2) if wall_s else None,
+        "errors": len(errors),
+        "first_errors": errors[:5],
+        "metrics": {m: _summary(v) for m, v in samples.items()},
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--clients", type=int, default=4)
+    ap.add_argument("--iterations", type=int, default=3, help="utterances per client")
+    ap.add_argument("--wav", type=Path, nargs="*", default=[], help="16-bit PCM WAV files (default: synthetic)")
+    ap.add_argument("--prompt", default="a lighthouse on a cliff at sunrise", help="used when nothing is recognized")
+    ap.add_argument("--action", action="append", default=[], choices=("save_image", "regenerate"))
+    ap.add_argument("--url", help="benchmark a running server instead of starting one")
+    ap.add_argument("--sd-model", default=TINY_SD)
+    ap.add_argument("--whisper-model", default=TINY_WHISPER)
+    ap.add_argument("--steps", type=int, default=1)
+    ap.add_argument("--size", type=int, default=64)
+    ap.add_argument("--device", default="cpu", choices=("auto", "cpu", "mps", "cuda"))
+    ap.add_argument("--stagger", type=float, default=0.25, help="seconds between client connects")
+    ap.add_argument("--timeout", type=float, default=300.0, help="per-step timeout in seconds")
+    ap.add_argument("--no-warmup", action="store_true")
+    ap.add_argument("--out", type=Path, help="also write the results here")
+    args = ap.parse_args()
+
+    utterances = [_read_wav(p) for p in args.wav] or [_synthetic_utterance()]
+    if args.url:
+        url, server = args.url, None
+    else:
+        url, server = _start_server(args)
+    try:
+        results = asyncio.run(_run(args, url, utterances))
+    finally:
+        if server is not None:
+            server.should_exit = True
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.out:
+        args.out.write_text(text + "\n", encoding="utf-8")
+    if results["errors"] and not any(s.get("n") for s in results["metrics"].values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
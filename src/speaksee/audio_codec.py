@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import io
+import wave
+from functools import lru_cache
+from typing import Protocol
+
+import numpy as np
+
+from .resample import StreamingResampler
+
+
+class UnsupportedAudioFormat(ValueError):
+    pass
+
+
+class AudioDecoder(Protocol):
+    def decode(self, data: bytes) -> bytes: ...
+
+    def flush(self) -> bytes: ...
+
+
+class Pcm16Decoder:
+    """Raw little-endian PCM16 mono: frames are already in the session buffer format."""
+
+    def decode(self, data: bytes) -> bytes:
+        return data
+
+    def flush(self) -> bytes:
+        return b""
+
+
+class ResamplingPcm16Decoder:
+    """
+    Raw PCM16 at the client's device rate (and channel count), converted to mono at `target_rate`
+    incrementally as frames arrive.
+    """
+
+    def __init__(self, sample_rate: int, target_rate: int, channels: int = 1):
+        self._channels = max(1, int(channels))
+        self._resampler = StreamingResampler(sample_rate, target_rate)
+        self._carry = b""
+
+    def _downmix(self, data: bytes) -> bytes:
+        if self._channels == 1:
+            return data
+        data = self._carry + data
+        frame_bytes = 2 * self._channels
+        usable = len(data) - (len(data) % frame_bytes)
+        self._carry = data[usable:]
+        a = np.frombuffer(data[:usable], dtype=np.int16).reshape(-1, self._channels)
+        return a.mean(axis=1).astype(np.int16).tobytes()
+
+    def decode(self, data: bytes) -> bytes:
+        return self._resampler.process(self._downmix(data))
+
+    def flush(self) -> bytes:
+        return self._resampler.flush()
+
+
+class OpusDecoder:
+    """
+    Decodes raw Opus packets (one packet per WebSocket binary frame, as emitted by the browser's
+    WebCodecs `AudioEncoder`) into PCM16 mono at `sample_rate`.
+    """
+
+    def __init__(self, sample_rate: int = 16000, channels: int = 1):
+        import av  # ships with faster-whisper; keep lazy
+
+        self._av = av
+        self._ctx = av.codec.CodecContext.create("opus", "r")
+        # Opus always decodes at 48kHz internally; the resampler converts to the session rate.
+        self._ctx.sample_rate = 48000
+        self._ctx.layout = "stereo" if channels == 2 else "mono"
+        self._resampler = av.AudioResampler(format="s16", layout="mono", rate=int(sample_rate))
+
+    def _pcm(self, frames) -> bytes:
+        out = bytearray()
+        for frame in frames:
+            for f in self._resampler.resample(frame):
+                out += f.to_ndarray().tobytes()
+        return bytes(out)
+
+    def decode(self, data: bytes) -> bytes:
+        if not data:
+            return b""
+        return self._pcm(self._ctx.decode(self._av.Packet(data)))
+
+    def flush(self) -> bytes:
+        out = bytearray()
+        for f in self._resampler.resample(None):
+            out += f.to_ndarray().tobytes()
+        return bytes(out)
+
+
+@lru_cache(maxsize=1)
+def available_formats() -> tuple[str, ...]:
+    formats = ["pcm16"]
+    try:
+        import av
+
+        av.codec.Codec("opus", "r")
+        formats.append("opus")
+    except Exception:
+        pass
+    return tuple(formats)
+
+
+def create_decoder(
+    fmt: str, sample_rate: int, channels: int = 1, target_rate: int | None = None
+) -> AudioDecoder:
+    """
+    Decoder for one utterance. Output is PCM16 mono at `target_rate` (defaults to `sample_rate`),
+    whatever rate and channel count the client streams.
+    """
+    fmt = (fmt or "pcm16").strip().lower()
+    if fmt not in available_formats():
+        raise UnsupportedAudioFormat(fmt)
+    target_rate = int(target_rate or sample_rate)
+    if fmt == "opus":
+        return OpusDecoder(sample_rate=target_rate, channels=channels)
+    if sample_rate == target_rate and channels == 1:
+        return Pcm16Decoder()
+    return ResamplingPcm16Decoder(sample_rate, target_rate, channels=channels)
+
+
+def decode_audio_file(data: bytes, sample_rate: int) -> bytes:
+    """
+    A whole audio file (WAV, FLAC, MP3, Ogg/Opus, WebM, ...) as PCM16 mono at `sample_rate`.
+    PCM16 WAV is read directly; anything else goes through PyAV.
+    """
+    if data[:4] == b"RIFF":
+        try:
+            with wave.open(io.BytesIO(data), "rb") as w:
+                if w.getsampwidth() == 2:
+                    dec = create_decoder("pcm16", w.getframerate(), w.getnchannels(), target_rate=sample_rate)
+                    return dec.decode(w.readframes(w.getnframes())) + dec.flush()
+        except (wave.Error, EOFError):
+            pass  # e.g. float WAV
+
+    try:
+        import av  # ships with faster-whisper; keep lazy
+    except ImportError as e:
+        raise UnsupportedAudioFormat("only PCM16 WAV without PyAV") from e
+
+    out = bytearray()
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=int(sample_rate))
+    try:
+        with av.open(io.BytesIO(data)) as container:
+            for frame in container.decode(audio=0):
+                for f in resampler.resample(frame):
+                    out += f.to_ndarray().tobytes()
+    except av.error.FFmpegError as e:
+        raise UnsupportedAudioFormat(str(e)) from e
+    for f in resampler.resample(None):
+        out += f.to_ndarray().tobytes()
+    return bytes(out)
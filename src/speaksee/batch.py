@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import zlib
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+from .audio_codec import decode_audio_file
+from .config import Config, load_config
+from .gallery import save_generated_image
+from .stt_whisper import WHISPER_SAMPLE_RATE
+
+
+log = logging.getLogger(__name__)
+
+AUDIO_SUFFIXES = frozenset({".wav", ".flac", ".mp3", ".m4a", ".ogg", ".opus", ".webm"})
+STYLES = ("none", "realistic", "abstract")
+
+# Manifest statuses that a resumed run does not redo ("error" is retried).
+_FINISHED = frozenset({"ok", "empty"})
+
+
+@dataclass(frozen=True)
+class BatchInput:
+    key: str  # stable across runs: the audio file path, or "<prompt file>:<line number>"
+    source: str
+    prompt: Optional[str] = None
+    audio: Optional[Path] = None
+
+
+@dataclass(frozen=True)
+class _Job:
+    item: BatchInput
+    prompt: str
+    stt_s: float = 0.0
+    error: Optional[str] = None
+
+
+_DONE = object()
+
+
+def iter_inputs(paths: Iterable[Path]) -> Iterator[BatchInput]:
+    """
+    Audio files (directly or in a directory, in name order) and prompt files (one prompt per line,
+    blank lines and `#` comments skipped). Lazy: audio is only read when it is transcribed.
+    """
+    for path in paths:
+        if path.is_dir():
+            for name in sorted(os.listdir(path)):
+                p = path / name
+                if p.suffix.lower() in AUDIO_SUFFIXES and p.is_file():
+                    yield BatchInput(key=str(p), source=str(p), audio=p)
+        elif path.suffix.lower() in AUDIO_SUFFIXES:
+            yield BatchInput(key=str(path), source=str(path), audio=path)
+        else:
+            with path.open(encoding="utf-8") as f:
+                for n, line in enumerate(f, 1):
+                    line = line.strip()
+                    if line and not line.startswith("#"):
+                        yield BatchInput(key=f"{path}:{n}", source=str(path), prompt=line)
+
+
+def read_audio(path: Path, sample_rate: int = WHISPER_SAMPLE_RATE) -> bytes:
+    return decode_audio_file(path.read_bytes(), sample_rate)
+
+
+def finished_keys(manifest: Path) -> set[str]:
+    """Inputs a previous run already handled, so an interrupted batch picks up where it stopped."""
+    done: set[str] = set()
+    if not manifest.exists():
+        return done
+    with manifest.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # last line cut short by the interruption
+            if entry.get("status") in _FINISHED:
+                done.add(entry.get("key"))
+    return done
+
+
+def _open_manifest(manifest: Path):
+    manifest.parent.mkdir(parents=True, exist_ok=True)
+    cut_short = False
+    if manifest.exists() and manifest.stat().st_size:
+        with manifest.open("rb") as f:
+            f.seek(-1, os.SEEK_END)
+            cut_short = f.read(1) != b"\n"
+    f = manifest.open("a", encoding="utf-8")
+    if cut_short:
+        f.write("\n")  # don't glue the first new entry onto a line an interruption cut short
+    return f
+
+
+def _put(q: "queue.Queue[Any]", item: Any, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.2)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _transcribe_all(items: Iterable[BatchInput], stt: Any, jobs: "queue.Queue[Any]", stop: threading.Event) -> None:
+    """Producer thread: transcribes audio inputs (CPU) while the consumer keeps the GPU busy."""
+    try:
+        for item in items:
+            if item.audio is None:
+                job = _Job(item, item.prompt or "")
+            else:
+                t0 = time.perf_counter()
+                try:
+                    text = stt.transcribe_final(read_audio(item.audio), WHISPER_SAMPLE_RATE).text
+                    job = _Job(item, text.strip(), stt_s=time.perf_counter() - t0)
+                except Exception as e:
+                    log.warning("transcription failed for %s: %s", item.source, e)
+                    job = _Job(item, "", stt_s=time.perf_counter() - t0, error=f"stt: {e}")
+            if not _put(jobs, job, stop):
+                return
+    except Exception as e:
+        _put(jobs, e, stop)  # e.g. an unreadable prompt file; raised in the consumer
+    finally:
+        _put(jobs, _DONE, stop)
+
+
+def _seed_for(key: str, base: Optional[int]) -> int:
+    if base is None:
+        return random.randint(0, 2**31 - 1)
+    # Same input, same seed: reruns (and resumed runs) reproduce the images.
+    return (base + zlib.crc32(key.encode("utf-8"))) % 2**31
+
+
+def run_batch(
+    cfg: Config,
+    items: Iterable[BatchInput],
+    manifest: Path,
+    *,
+    stt: Any,
+    models: Any,
+    batch_size: int = 4,
+    model_id: Optional[str] = None,
+    style: str = "none",
+    seed: Optional[int] = None,
+    prefetch: int = 16,
+) -> dict[str, Any]:
+    """
+    Transcribe and generate every input not already finished in `manifest`, appending one JSON
+    line per input. Transcription runs in a producer thread up to `prefetch` inputs ahead; the
+    calling thread renders whatever is ready, up to `batch_size` prompts per pipeline call, and
+    saves the images to `cfg.gallery_dir`.
+    """
+    model_id = models.resolve(model_id)
+    spec = cfg.sd_model_spec(model_id)
+    steps = max(1, int(spec.steps or cfg.steps))
+    negative = cfg.styled_prompt("", style)[1]
+
+    done = finished_keys(manifest)
+    counts = {"ok": 0, "empty": 0, "error": 0, "skipped": 0}
+
+    def pending() -> Iterator[BatchInput]:
+        for item in items:
+            if item.key in done:
+                counts["skipped"] += 1
+            else:
+                yield item
+
+    jobs: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, prefetch))
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_transcribe_all, args=(pending(), stt, jobs, stop), name="speaksee-batch-stt", daemon=True
+    )
+    t_start = time.perf_counter()
+    cfg.gallery_dir.mkdir(parents=True, exist_ok=True)
+    producer.start()
+    try:
+        with _open_manifest(manifest) as out:
+
+            def write(job: _Job, status: str, **fields: Any) -> None:
+                counts[status] += 1
+                entry = {"key": job.item.key, "source": job.item.source, "status": status, "prompt": job.prompt}
+                if job.item.audio is not None:
+                    entry["stt_s"] = round(job.stt_s, 3)
+                entry.update(fields)
+                out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                out.flush()
+
+            finished = False
+            while not finished:
+                batch: list[_Job] = []
+                nxt = jobs.get()
+                while True:
+                    if nxt is _DONE:
+                        finished = True
+                        break
+                    if isinstance(nxt, Exception):
+                        raise nxt
+                    if nxt.error:
+                        write(nxt, "error", error=nxt.error)
+                    elif not nxt.prompt:
+                        write(nxt, "empty")
+                    else:
+                        batch.append(nxt)
+                    # Render as soon as anything is ready; batches fill up when STT runs ahead.
+                    if len(batch) >= batch_size:
+                        break
+                    try:
+                        nxt = jobs.get_nowait()
+                    except queue.Empty:
+                        if batch:
+                            break
+                        nxt = jobs.get()
+                if not batch:
+                    continue
+
+                seeds = [_seed_for(j.item.key, seed) for j in batch]
+                t0 = time.perf_counter()
+                try:
+                    results = models.generate_batch(
+                        model_id=model_id,
+                        prompts=[cfg.styled_prompt(j.prompt, style)[0] for j in batch],
+                        negative_prompt=negative,
+                        steps=steps,
+                        width=cfg.width,
+                        height=cfg.height,
+                        seeds=seeds,
+                        guidance_scale=spec.guidance_scale,
+                    )
+                except Exception as e:
+                    log.warning("generation failed for a batch of %d: %s", len(batch), e)
+                    for j in batch:
+                        write(j, "error", error=f"generate: {e}")
+                    continue
+                gen_s = time.perf_counter() - t0
+                for j, result in zip(batch, results):
+                    meta = save_generated_image(
+                        cfg,
+                        result.image,
+                        prompt=j.prompt,
+                        negative_prompt=negative,
+                        seed=result.seed,
+                        steps=steps,
+                        style=style,
+                        model_id=result.model_id,
+                        device=result.device,
+                        extra={"source": j.item.source, "batch_size": len(batch)},
+                    )
+                    write(
+                        j,
+                        "ok",
+                        id=meta["id"],
+                        file=str(cfg.gallery_dir / meta["file"]),
+                        seed=result.seed,
+                        model=result.model_id,
+                        device=result.device,
+                        gen_s=round(gen_s / len(batch), 3),
+                    )
+    finally:
+        stop.set()
+        producer.join(timeout=5)
+
+    elapsed = time.perf_counter() - t_start
+    return {**counts, "elapsed_s": round(elapsed, 2), "images_per_s": round(counts["ok"] / elapsed, 3) if elapsed else 0.0}
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="speaksee-batch",
+        description="Turn recorded voice prompts (audio files or directories) and prompt files into images.",
+    )
+    parser.add_argument("inputs", nargs="+", type=Path, help="audio files, directories of audio files, or prompt files")
+    parser.add_argument("--out", type=Path, help="image directory (default: data/batch)")
+    parser.add_argument("--manifest", type=Path, help="JSONL manifest, also used to resume (default: <out>/manifest.jsonl)")
+    parser.add_argument("--batch-size", type=int, default=4, help="prompts per pipeline call")
+    parser.add_argument("--model", help="image model (default: SPEAKSEE_SD_MODEL)")
+    parser.add_argument("--style", choices=STYLES, default="none")
+    parser.add_argument("--seed", type=int, help="base seed; each input gets a stable seed derived from it")
+    parser.add_argument("--prefetch", type=int, default=16, help="inputs transcribed ahead of generation")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    cfg = load_config()
+    os.environ.setdefault("HF_HUB_DISABLE_TELEMETRY", "1")
+    os.environ.setdefault("HF_HOME", str(cfg.hf_home))
+    out_dir = args.out or cfg.data_dir / "batch"
+    cfg = replace(cfg, gallery_dir=out_dir)
+    manifest = args.manifest or out_dir / "manifest.jsonl"
+
+    from .image_models import ImageModels, UnknownModel
+    from .stt_whisper import SpeechToText
+
+    try:
+        summary = run_batch(
+            cfg,
+            iter_inputs(args.inputs),
+            manifest,
+            stt=SpeechToText(cfg),
+            models=ImageModels(cfg),
+            batch_size=max(1, args.batch_size),
+            model_id=args.model,
+            style=args.style,
+            seed=args.seed,
+            prefetch=args.prefetch,
+        )
+    except UnknownModel as e:
+        print(f"unknown model {e}; configured: SPEAKSEE_SD_MODEL / SPEAKSEE_SD_MODELS")
+        return 2
+    except KeyboardInterrupt:
+        print(f"interrupted; run the same command again to resume from {manifest}")
+        return 130
+    print(json.dumps({"manifest": str(manifest), **summary}))
+    return 1 if summary["error"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -7,16 +7,54 @@ from typing import Literal, Optional
 
 Style = Literal["none", "realistic", "abstract"]
 CommandName = Literal["regenerate", "save_image", "set_style"]
+VoiceCommandName = Literal["regenerate", "more_realistic", "more_abstract", "save_image"]
 
 
 @dataclass(frozen=True)
 class ParsedVoiceCommand:
-    name: Literal["regenerate", "more_realistic", "more_abstract", "save_image"]
+    name: VoiceCommandName
 
 
 _PUNCT_RE = re.compile(r"[^a-z0-9\s]")
 _WS_RE = re.compile(r"\s+")
 
+# Command grammar: every spoken form a command accepts, keyed by command name.
+_COMMAND_PHRASES: dict[str, tuple[str, ...]] = {
+    "regenerate": ("regenerate",),
+    "more_realistic": ("more realistic",),
+    "more_abstract": ("more abstract",),
+    "save_image": ("save image", "save the image"),
+}
+
+_LEADING_FILLER = r"(?:please|hey|ok|okay)"
+_TRAILING_FILLER = r"(?:please|thanks|thank you)"
+_LEADING_FILLER_RE = re.compile(rf"^{_LEADING_FILLER}\s+")
+_TRAILING_FILLER_RE = re.compile(rf"\s+{_TRAILING_FILLER}$")
+
+# The whole grammar compiled into one alternation; the named group that matched is the command.
+_COMMAND_RE = re.compile(
+    rf"(?:{_LEADING_FILLER}\s+)?"
+    + "(?:"
+    + "|".join(
+        f"(?P<{name}>{'|'.join(re.escape(p) for p in phrases)})"
+        for name, phrases in _COMMAND_PHRASES.items()
+    )
+    + ")"
+    + rf"(?:\s+{_TRAILING_FILLER})?"
+)
+
+# Known mis-hearings of whole command phrases, accepted when near misses are.
+_MISHEARD: dict[str, str] = {
+    "regenerated": "regenerate",
+    "re generate": "regenerate",
+    "safe image": "save_image",
+    "safe the image": "save_image",
+}
+# Otherwise a near miss is the same number of words, each spelled the same except for one substituted
+# letter (not the first) in words of at least this length: "more realistik", not "more abstracts",
+# "degenerate" or "wave image".
+_FUZZY_MIN_WORD_LEN = 8
+
 
 def normalize_text(text: str) -> str:
     t = text.strip().lower()
@@ -25,27 +63,50 @@ def normalize_text(text: str) -> str:
     return t
 
 
-def parse_voice_command(text: str) -> Optional[ParsedVoiceCommand]:
+def _near_word(word: str, target: str) -> bool:
+    if word == target:
+        return True
+    if len(target) < _FUZZY_MIN_WORD_LEN or len(word) != len(target) or word[0] != target[0]:
+        return False
+    return sum(a != b for a, b in zip(word, target)) <= 1
+
+
+def _fuzzy_match(n: str) -> Optional[str]:
+    n = _LEADING_FILLER_RE.sub("", n).strip()
+    n = _TRAILING_FILLER_RE.sub("", n).strip()
+    if not n:
+        return None
+    if n in _MISHEARD:
+        return _MISHEARD[n]
+    words = n.split(" ")
+    for name, phrases in _COMMAND_PHRASES.items():
+        for phrase in phrases:
+            targets = phrase.split(" ")
+            if len(targets) == len(words) and all(_near_word(w, t) for w, t in zip(words, targets)):
+                return name
+    return None
+
+
+def parse_voice_command(text: str, *, fuzzy: bool = True) -> Optional[ParsedVoiceCommand]:
     """
     Interpret voice commands only when spoken as a standalone command (plus optional polite words),
     so regular prompts containing these phrases won't accidentally trigger actions.
+
+    With `fuzzy`, known mis-hearings and near misses of a command phrase (same words, one letter
+    off in a long word) also match; a prompt that merely starts like a command never does.
     """
     n = normalize_text(text)
     if not n:
         return None
 
-    # Strip common filler/polite words.
-    n = re.sub(r"^(please|hey|ok|okay)\s+", "", n).strip()
-    n = re.sub(r"\s+(please|thanks|thank you)$", "", n).strip()
-
-    if re.fullmatch(r"regenerate", n):
-        return ParsedVoiceCommand("regenerate")
-    if re.fullmatch(r"more realistic", n):
-        return ParsedVoiceCommand("more_realistic")
-    if re.fullmatch(r"more abstract", n):
-        return ParsedVoiceCommand("more_abstract")
-    if re.fullmatch(r"save (the )?image", n):
-        return ParsedVoiceCommand("save_image")
+    m = _COMMAND_RE.fullmatch(n)
+    if m is not None and m.lastgroup:
+        return ParsedVoiceCommand(m.lastgroup)  # type: ignore[arg-type]
+
+    if fuzzy:
+        name = _fuzzy_match(n)
+        if name is not None:
+            return ParsedVoiceCommand(name)  # type: ignore[arg-type]
     return None
 
 
@@ -3,6 +3,7 @@ from __future__ import annotations
 import os
 from dataclasses import dataclass
 from pathlib import Path
+from typing import Optional
 
 
 def _env_str(name: str, default: str) -> str:
@@ -20,6 +21,48 @@ def _env_int(name: str, default: int) -> int:
         return default
 
 
+def _env_float(name: str, default: float) -> float:
+    v = os.getenv(name)
+    if v is None or v.strip() == "":
+        return default
+    try:
+        return float(v)
+    except ValueError:
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    v = os.getenv(name)
+    if v is None or v.strip() == "":
+        return default
+    return v.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class SdModelSpec:
+    model_id: str
+    steps: Optional[int] = None  # overrides Config.steps for this model
+    guidance_scale: Optional[float] = None  # default 0.0 (turbo models)
+
+
+def parse_sd_model_spec(text: str) -> SdModelSpec:
+    """
+    `model_id`, `model_id@steps` or `model_id@steps:guidance`, e.g.
+    `runwayml/stable-diffusion-v1-5@25:7.5` for a non-turbo model.
+    """
+    text = text.strip()
+    model_id, sep, opts = text.rpartition("@")
+    if not sep or not model_id:
+        return SdModelSpec(text)
+    steps_s, _, guidance_s = opts.partition(":")
+    try:
+        steps = int(steps_s) if steps_s.strip() else None
+        guidance = float(guidance_s) if guidance_s.strip() else None
+    except ValueError:
+        return SdModelSpec(text)
+    return SdModelSpec(model_id.strip(), steps, guidance)
+
+
 @dataclass(frozen=True)
 class Config:
     root_dir: Path
@@ -41,11 +84,22 @@ class Config:
 
     device_preference: str  # "cpu" | "mps" | "cuda" | "auto"
 
+    # Extra selectable diffusion models (the `model` field of `generate`); `sd_model` is the default.
+    # Up to `sd_max_resident` stay on the accelerator and `sd_max_loaded` in memory (LRU).
+    sd_models: tuple[SdModelSpec, ...] = ()
+    sd_max_resident: int = 1
+    sd_max_loaded: int = 2
+
     stt_partial_interval_s: float = 0.8
     stt_partial_window_s: float = 8.0
 
     autogen_delay_s: float = 1.2
 
+    # Voice command fast path: act on a stable command partial (or a cheap decode of a short
+    # utterance) instead of waiting for the full final decode.
+    command_fast_path: bool = True
+    command_max_utterance_s: float = 2.5
+
     realistic_prompt_suffix: str = (
         "photorealistic, natural lighting, high detail, 35mm, realistic"
     )
@@ -54,6 +108,105 @@ class Config:
     abstract_prompt_suffix: str = "abstract, painterly, expressive, textured, modern art"
     abstract_negative: str = "photorealistic, realistic"
 
+    # Adaptive quality, opt-in: with `latency_target_s` > 0, steps/width/height above are the
+    # ceiling and each image gets the best settings predicted to arrive within it (0, the default,
+    # always uses them as configured). Final-quality re-renders refine a smaller preview at
+    # `final_strength` (img2img).
+    latency_target_s: float = 0.0
+    quality_min_side: int = 256
+    final_strength: float = 0.6
+
+    # Two-pass generation: unless the full image is predicted to meet `latency_target_s`, a
+    # one-step preview (longest side `preview_side`) is sent first as `gen_preview`, then refined
+    # to full quality in the background; a new prompt preempts the refine.
+    two_pass: bool = False
+    preview_side: int = 256
+
+    # img2img: "more realistic"/"more abstract" re-noise the last image to this strength instead of
+    # starting from scratch. Regenerate does the same when its strength is > 0 (0 = fresh image).
+    refine_strength: float = 0.55
+    regenerate_strength: float = 0.0
+
+    # Device OOM recovery: free cache -> CPU offload/VAE tiling -> smaller image (if allowed) -> CPU.
+    # Degraded modes are undone after `oom_cooldown_s` without another OOM.
+    oom_allow_downscale: bool = True
+    oom_min_side: int = 256
+    oom_cooldown_s: float = 300.0
+
+    # Per-connection outbound queue: clients this many messages behind (after dropping progress
+    # updates), or whose socket write stalls for `ws_send_timeout_s`, are disconnected.
+    ws_max_queue: int = 256
+    ws_send_timeout_s: float = 10.0
+
+    # Memory manager: budgets in MB (0 = unlimited); idle models are parked in host RAM after
+    # `idle_offload_s` and dropped after `idle_unload_s` (0 = never).
+    gpu_budget_mb: int = 0
+    host_budget_mb: int = 0
+    idle_offload_s: float = 900.0
+    idle_unload_s: float = 0.0
+    memory_sweep_interval_s: float = 15.0
+
+    # Utterance tracing: the last `trace_buffer` spans are kept for /api/trace (0 = tracing off);
+    # `trace_log` also appends every span to data/logs/traces.jsonl.
+    trace_buffer: int = 5000
+    trace_log: bool = False
+
+    # Record every WebSocket session (audio frames and all messages, with timings) to
+    # data/logs/sessions/ for `speaksee-replay`. Off by default: recordings contain raw audio.
+    session_record: bool = False
+
+    # HTTP job API (/api/generate, /api/transcribe): at most `job_queue_max` jobs wait per kind
+    # (more get 429), and the last `job_history` finished jobs (and their idempotency keys) are kept.
+    job_queue_max: int = 32
+    job_history: int = 200
+
+    # Gallery retention, enforced by a background cleanup every `gallery_gc_interval_s`: images
+    # older than `gallery_max_age_days` are deleted, then the oldest ones while the gallery is
+    # larger than `gallery_max_mb` (0 = no limit). Images copied to `saved_dir` are always kept.
+    gallery_max_age_days: float = 0.0
+    gallery_max_mb: int = 0
+    gallery_gc_interval_s: float = 60.0
+
+    # Web workers (uvicorn processes). With more than one, the models move to a separate model
+    # server process that all workers share; `model_server` is its socket path ("" = models
+    # in-process, unless `web_workers` > 1 starts one).
+    web_workers: int = 1
+    model_server: str = ""
+
+    # Generation workers on other machines / GPUs (`speaksee-worker`). When `worker_listen`
+    # ("host:port") is set, images are rendered by the workers that connected there with
+    # `worker_key`, not in this process. A generation whose worker is lost is retried on another
+    # one up to `worker_retries` times; one that finds no worker for its model fails after
+    # `worker_wait_s`.
+    worker_listen: str = ""
+    worker_key: str = ""
+    worker_retries: int = 2
+    worker_wait_s: float = 30.0
+
+    # Spoken feedback ("Saved", "More realistic", ...): "off", "speaker" (this machine's speakers)
+    # or "browser" (audio sent over the WebSocket and played by the client).
+    tts: str = "off"
+
+    @property
+    def sd_model_ids(self) -> tuple[str, ...]:
+        ids = [self.sd_model]
+        ids.extend(m.model_id for m in self.sd_models if m.model_id not in ids)
+        return tuple(ids)
+
+    def sd_model_spec(self, model_id: str) -> SdModelSpec:
+        for m in self.sd_models:
+            if m.model_id == model_id:
+                return m
+        return SdModelSpec(model_id)
+
+    def styled_prompt(self, prompt: str, style: str) -> tuple[str, str]:
+        """(prompt with the style's suffix, negative prompt) for "none" | "realistic" | "abstract"."""
+        if style == "realistic":
+            return f"{prompt}, {self.realistic_prompt_suffix}", self.realistic_negative
+        if style == "abstract":
+            return f"{prompt}, {self.abstract_prompt_suffix}", self.abstract_negative
+        return prompt, ""
+
 
 def load_config() -> Config:
     root_dir = Path(__file__).resolve().parents[2]
@@ -69,10 +222,57 @@ def load_config() -> Config:
     sd_model = _env_str("SPEAKSEE_SD_MODEL", "stabilityai/sd-turbo")
     whisper_model = _env_str("SPEAKSEE_WHISPER_MODEL", "Systran/faster-whisper-base")
 
+    sd_models = tuple(
+        parse_sd_model_spec(v) for v in _env_str("SPEAKSEE_SD_MODELS", "").split(",") if v.strip()
+    )
+    sd_max_resident = max(1, _env_int("SPEAKSEE_SD_MAX_RESIDENT", 1))
+    sd_max_loaded = max(sd_max_resident, _env_int("SPEAKSEE_SD_MAX_LOADED", 2))
+
     steps = _env_int("SPEAKSEE_STEPS", 4)
     width = _env_int("SPEAKSEE_WIDTH", 512)
     height = _env_int("SPEAKSEE_HEIGHT", 512)
 
+    latency_target_s = max(0.0, _env_float("SPEAKSEE_LATENCY_TARGET_S", 0.0))
+    quality_min_side = max(64, _env_int("SPEAKSEE_QUALITY_MIN_SIDE", 256))
+    final_strength = min(1.0, max(0.05, _env_float("SPEAKSEE_FINAL_STRENGTH", 0.6)))
+    two_pass = _env_bool("SPEAKSEE_TWO_PASS", False)
+    preview_side = max(64, _env_int("SPEAKSEE_PREVIEW_SIDE", 256))
+
+    refine_strength = min(1.0, max(0.0, _env_float("SPEAKSEE_REFINE_STRENGTH", 0.55)))
+    regenerate_strength = min(1.0, max(0.0, _env_float("SPEAKSEE_REGENERATE_STRENGTH", 0.0)))
+
+    oom_allow_downscale = _env_bool("SPEAKSEE_OOM_DOWNSCALE", True)
+    oom_cooldown_s = max(0.0, _env_float("SPEAKSEE_OOM_COOLDOWN_S", 300.0))
+
+    gpu_budget_mb = max(0, _env_int("SPEAKSEE_GPU_BUDGET_MB", 0))
+    host_budget_mb = max(0, _env_int("SPEAKSEE_HOST_BUDGET_MB", 0))
+    idle_offload_s = max(0.0, _env_float("SPEAKSEE_IDLE_OFFLOAD_S", 900.0))
+    idle_unload_s = max(0.0, _env_float("SPEAKSEE_IDLE_UNLOAD_S", 0.0))
+
+    ws_max_queue = max(8, _env_int("SPEAKSEE_WS_MAX_QUEUE", 256))
+    ws_send_timeout_s = max(0.5, _env_float("SPEAKSEE_WS_SEND_TIMEOUT_S", 10.0))
+
+    trace_buffer = max(0, _env_int("SPEAKSEE_TRACE_BUFFER", 5000))
+    trace_log = _env_bool("SPEAKSEE_TRACE_LOG", False)
+    session_record = _env_bool("SPEAKSEE_SESSION_RECORD", False)
+    job_queue_max = max(1, _env_int("SPEAKSEE_JOB_QUEUE_MAX", 32))
+    job_history = max(1, _env_int("SPEAKSEE_JOB_HISTORY", 200))
+    gallery_max_age_days = max(0.0, _env_float("SPEAKSEE_GALLERY_MAX_AGE_DAYS", 0.0))
+    gallery_max_mb = max(0, _env_int("SPEAKSEE_GALLERY_MAX_MB", 0))
+    gallery_gc_interval_s = max(1.0, _env_float("SPEAKSEE_GALLERY_GC_INTERVAL_S", 60.0))
+    web_workers = max(1, _env_int("SPEAKSEE_WEB_WORKERS", 1))
+    model_server = _env_str("SPEAKSEE_MODEL_SERVER", "")
+    worker_listen = _env_str("SPEAKSEE_WORKER_LISTEN", "")
+    worker_key = _env_str("SPEAKSEE_WORKER_KEY", "")
+    worker_retries = max(0, _env_int("SPEAKSEE_WORKER_RETRIES", 2))
+    worker_wait_s = max(0.0, _env_float("SPEAKSEE_WORKER_WAIT_S", 30.0))
+
+    tts = _env_str("SPEAKSEE_TTS", "off").lower()
+    if tts in ("1", "true", "yes", "on"):
+        tts = "speaker"
+    if tts not in ("speaker", "browser"):
+        tts = "off"
+
     device_preference = _env_str("SPEAKSEE_DEVICE", "auto").lower()
     if device_preference not in ("auto", "cpu", "mps", "cuda"):
         device_preference = "auto"
@@ -93,9 +293,42 @@ def load_config() -> Config:
         hf_home=hf_home,
         sd_model=sd_model,
         whisper_model=whisper_model,
+        sd_models=sd_models,
+        sd_max_resident=sd_max_resident,
+        sd_max_loaded=sd_max_loaded,
         steps=steps,
         width=width,
         height=height,
         device_preference=device_preference,
+        latency_target_s=latency_target_s,
+        quality_min_side=quality_min_side,
+        final_strength=final_strength,
+        two_pass=two_pass,
+        preview_side=preview_side,
+        refine_strength=refine_strength,
+        regenerate_strength=regenerate_strength,
+        oom_allow_downscale=oom_allow_downscale,
+        oom_cooldown_s=oom_cooldown_s,
+        gpu_budget_mb=gpu_budget_mb,
+        host_budget_mb=host_budget_mb,
+        idle_offload_s=idle_offload_s,
+        idle_unload_s=idle_unload_s,
+        ws_max_queue=ws_max_queue,
+        ws_send_timeout_s=ws_send_timeout_s,
+        trace_buffer=trace_buffer,
+        trace_log=trace_log,
+        session_record=session_record,
+        job_queue_max=job_queue_max,
+        job_history=job_history,
+        gallery_max_age_days=gallery_max_age_days,
+        gallery_max_mb=gallery_max_mb,
+        gallery_gc_interval_s=gallery_gc_interval_s,
+        web_workers=web_workers,
+        model_server=model_server,
+        worker_listen=worker_listen,
+        worker_key=worker_key,
+        worker_retries=worker_retries,
+        worker_wait_s=worker_wait_s,
+        tts=tts,
     )
 
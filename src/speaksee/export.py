@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import tarfile
+import time
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .gallery import ExportItem
+
+
+FORMATS = {"zip": "application/zip", "tar": "application/x-tar"}
+_CHUNK = 256 * 1024
+
+
+class _Pipe:
+    """Write-only file object whose bytes are handed out by `drain()` (no seeking, no temp file)."""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._pos = 0
+
+    def write(self, b: bytes) -> int:
+        if b:
+            self._chunks.append(bytes(b))
+            self._pos += len(b)
+        return len(b)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> Iterator[bytes]:
+        chunks, self._chunks = self._chunks, []
+        yield from chunks
+
+
+def _members(item: ExportItem) -> Iterator[tuple[str, Path]]:
+    yield f"{item.arcname}.png", item.png
+    if item.meta is not None:
+        yield f"{item.arcname}.json", item.meta
+
+
+def stream_archive(items: Iterable[ExportItem], fmt: str) -> Iterator[bytes]:
+    """
+    The archive of `items` as a stream of chunks, built as it is read: memory use is bounded by
+    one chunk (zip) or one file (tar), whatever the size of the export. Files that disappear
+    meanwhile (gallery cleanup) are skipped.
+    """
+    pipe = _Pipe()
+    if fmt == "zip":
+        with zipfile.ZipFile(pipe, "w") as zf:  # type: ignore[arg-type]
+            for item in items:
+                for arcname, path in _members(item):
+                    try:
+                        src = open(path, "rb")
+                    except FileNotFoundError:
+                        continue
+                    with src:
+                        info = zipfile.ZipInfo(arcname, time.localtime(path.stat().st_mtime)[:6])
+                        # PNGs are compressed already; the JSON sidecars are tiny.
+                        info.compress_type = zipfile.ZIP_DEFLATED if arcname.endswith(".json") else zipfile.ZIP_STORED
+                        with zf.open(info, "w") as dst:
+                            while chunk := src.read(_CHUNK):
+                                dst.write(chunk)
+                                yield from pipe.drain()
+                    yield from pipe.drain()
+        yield from pipe.drain()
+    elif fmt == "tar":
+        with tarfile.open(fileobj=pipe, mode="w|") as tf:  # type: ignore[arg-type]
+            for item in items:
+                for arcname, path in _members(item):
+                    try:
+                        with open(path, "rb") as src:
+                            info = tf.gettarinfo(fileobj=src, arcname=arcname)
+                            info.uname = info.gname = ""
+                            tf.addfile(info, src)
+                    except FileNotFoundError:
+                        continue
+                    yield from pipe.drain()
+        yield from pipe.drain()
+    else:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+
+def export_filename(fmt: str) -> str:
+    return f"speaksee-{datetime.now().strftime('%Y-%m-%d')}.{fmt}"
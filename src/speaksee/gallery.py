@@ -1,15 +1,34 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
+import os
+import re
 import shutil
-from dataclasses import asdict
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Iterable
+from typing import Any, Iterable, Iterator, Optional
 
 from PIL import Image
 
 from .config import Config
+from .metrics import GALLERY_BYTES, GALLERY_LIST_SECONDS, IMAGE_ENCODE_SECONDS
+from .tracing import TRACER, span
+
+
+log = logging.getLogger(__name__)
+
+# Images live in <gallery>/<YYYY-MM-DD>/<xx>/<id>.png (+ .json): one directory per day, split into
+# up to 256 buckets by a hash of the id, so no directory grows past a few thousand entries. Older
+# versions wrote everything straight into <gallery>/; GalleryJanitor moves those files over.
+_DAY_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_UNDATED = "undated"
+_MB = 1024 * 1024
 
 
 def _now_ts() -> tuple[str, str]:
@@ -24,6 +43,25 @@ def _write_json(path: Path, payload: dict[str, Any]) -> None:
     path.write_text(json.dumps(payload, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
 
 
+def _day_of(image_id: str) -> str:
+    return image_id[:10] if _DAY_RE.fullmatch(image_id[:10]) else _UNDATED
+
+
+def shard_dir(image_id: str) -> str:
+    """Directory of `image_id`, relative to the gallery."""
+    return f"{_day_of(image_id)}/{zlib.crc32(image_id.encode('utf-8')) & 0xFF:02x}"
+
+
+def image_path(cfg: Config, image_id: str) -> Path:
+    """PNG of `image_id`: in its shard, or in the flat layout if not migrated yet."""
+    path = cfg.gallery_dir / shard_dir(image_id) / f"{image_id}.png"
+    if not path.exists():
+        flat = cfg.gallery_dir / f"{image_id}.png"
+        if flat.exists():
+            return flat
+    return path
+
+
 def save_generated_image(
     cfg: Config,
     image: Image.Image,
@@ -35,17 +73,23 @@ def save_generated_image(
     style: str,
     model_id: str,
     device: str,
+    extra: Optional[dict[str, Any]] = None,
 ) -> dict[str, Any]:
     ts, fid = _now_ts()
     image_id = f"{fid}_seed{seed}"
+    # Refinements reuse their parent's seed; never overwrite an image saved in the same second.
+    n = 1
+    while image_path(cfg, image_id).exists():
+        image_id = f"{fid}_seed{seed}-{n}"
+        n += 1
 
-    png_name = f"{image_id}.png"
-    json_name = f"{image_id}.json"
-
+    png_name = f"{shard_dir(image_id)}/{image_id}.png"
     png_path = cfg.gallery_dir / png_name
-    json_path = cfg.gallery_dir / json_name
+    json_path = png_path.with_suffix(".json")
+    png_path.parent.mkdir(parents=True, exist_ok=True)
 
-    image.save(png_path, format="PNG")
+    with IMAGE_ENCODE_SECONDS.time(kind="png"), span("gallery.save_png"):
+        image.save(png_path, format="PNG")
     meta = {
         "id": image_id,
         "ts": ts,
@@ -58,15 +102,57 @@ def save_generated_image(
         "device": device,
         "file": png_name,
     }
+    if extra:
+        meta.update({k: v for k, v in extra.items() if k not in meta})
     _write_json(json_path, meta)
     return meta
 
 
+def _scan(path: Path) -> list[os.DirEntry]:
+    try:
+        with os.scandir(path) as it:
+            return list(it)
+    except FileNotFoundError:
+        return []
+
+
+def _day_pngs(cfg: Config, day: str) -> list[tuple[str, Path]]:
+    """(file name, path) of every PNG of one day's shards."""
+    out: list[tuple[str, Path]] = []
+    for bucket in _scan(cfg.gallery_dir / day):
+        if bucket.is_dir():
+            out.extend((e.name, Path(e.path)) for e in _scan(Path(bucket.path)) if e.name.endswith(".png"))
+    return out
+
+
+def _layout(cfg: Config) -> tuple[list[str], dict[str, list[tuple[str, Path]]]]:
+    """Day directories, oldest first, and the not yet migrated flat PNGs by day."""
+    days: set[str] = set()
+    flat: dict[str, list[tuple[str, Path]]] = {}
+    for e in _scan(cfg.gallery_dir):
+        if e.name.startswith("."):
+            continue
+        if e.is_dir():
+            if _DAY_RE.fullmatch(e.name) or e.name == _UNDATED:
+                days.add(e.name)
+        elif e.name.endswith(".png"):
+            day = _day_of(e.name)
+            days.add(day)
+            flat.setdefault(day, []).append((e.name, Path(e.path)))
+    # Undated images sort before every day: they are the oldest as far as anyone can tell.
+    return sorted(days, key=lambda d: "" if d == _UNDATED else d), flat
+
+
 def list_gallery(cfg: Config, limit: int = 200) -> list[dict[str, str]]:
+    t0 = time.perf_counter()
+    # Newest days first; stop reading directories once `limit` images are found.
+    days, flat = _layout(cfg)
     items: list[tuple[str, Path]] = []
-    for p in cfg.gallery_dir.glob("*.png"):
-        items.append((p.name, p))
-    items.sort(key=lambda t: t[0], reverse=True)
+    for day in reversed(days):
+        found = flat.get(day, []) + (_day_pngs(cfg, day) if (cfg.gallery_dir / day).is_dir() else [])
+        items.extend(sorted(found, key=lambda t: t[0], reverse=True))
+        if len(items) >= limit:
+            break
 
     out: list[dict[str, str]] = []
     for name, p in items[:limit]:
@@ -78,15 +164,302 @@ def list_gallery(cfg: Config, limit: int = 200) -> list[dict[str, str]]:
                 ts = json.loads(meta_path.read_text(encoding="utf-8")).get("ts", "")
             except Exception:
                 ts = ""
-        out.append({"id": image_id, "url": f"/images/{name}", "ts": ts})
+        url = p.relative_to(cfg.gallery_dir).as_posix()
+        out.append({"id": image_id, "url": f"/images/{url}", "ts": ts})
+    t1 = time.perf_counter()
+    GALLERY_LIST_SECONDS.observe(t1 - t0)
+    TRACER.add("gallery.list", t0, t1, items=len(out))
     return out
 
 
+@dataclass(frozen=True)
+class ExportItem:
+    image_id: str
+    png: Path
+    meta: Optional[Path]  # sidecar, if it still exists
+
+    @property
+    def arcname(self) -> str:
+        return f"{_day_of(self.image_id)}/{self.image_id}"
+
+
+def _style_of(meta: Optional[Path]) -> str:
+    if meta is None:
+        return ""
+    try:
+        return str(json.loads(meta.read_text(encoding="utf-8")).get("style", ""))
+    except (OSError, ValueError):
+        return ""
+
+
+def iter_export(
+    cfg: Config,
+    *,
+    since: str = "",
+    until: str = "",
+    style: str = "",
+    saved_only: bool = False,
+) -> Iterator[ExportItem]:
+    """
+    Gallery images (or, with `saved_only`, saved ones) whose day is within [since, until]
+    (YYYY-MM-DD, inclusive, either may be empty) and whose style is `style` (if given), oldest
+    first. Only the days in range are read.
+    """
+
+    def in_range(day: str) -> bool:
+        return (not since or day >= since) and (not until or day <= until)
+
+    def keep(image_id: str, png: Path) -> Optional[ExportItem]:
+        meta = image_path(cfg, image_id).with_suffix(".json")
+        item = ExportItem(image_id, png, meta if meta.exists() else None)
+        if style and _style_of(item.meta) != style:
+            return None
+        return item
+
+    if saved_only:
+        pngs = sorted(p for p in cfg.saved_dir.glob("*.png") if in_range(_day_of(p.stem)))
+        for png in pngs:
+            item = keep(png.stem, png)
+            if item is not None:
+                yield item
+        return
+
+    days, flat = _layout(cfg)
+    for day in days:
+        if not in_range(day):
+            continue
+        for name, png in sorted(flat.get(day, []) + _day_pngs(cfg, day)):
+            item = keep(name[:-4], png)
+            if item is not None:
+                yield item
+
+
+def _clone(src: Path, dst: Path) -> bool:
+    """Copy-on-write clone (Linux FICLONE: btrfs, XFS, bcachefs...). False if unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    FICLONE = 0x40049409
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        return True
+    except OSError:
+        dst.unlink(missing_ok=True)
+        return False
+
+
+def link_or_copy(src: Path, dst: Path) -> str:
+    """
+    Put `src`'s bytes at `dst` without duplicating them where the filesystem allows: a hardlink,
+    else a reflink, else a plain copy. Returns which one it was. Gallery images are never
+    modified in place, so sharing the data is safe (and deleting the gallery copy keeps this one).
+    """
+    if dst.exists():
+        if dst.samefile(src):
+            return "link"
+        dst.unlink()
+    try:
+        os.link(src, dst)
+        return "link"
+    except OSError:  # other filesystem, or no hardlinks (FAT, some network shares)
+        pass
+    if _clone(src, dst):
+        return "clone"
+    shutil.copyfile(src, dst)
+    return "copy"
+
+
 def copy_to_saved(cfg: Config, image_id: str) -> Path:
-    src = cfg.gallery_dir / f"{image_id}.png"
+    src = image_path(cfg, image_id)
     if not src.exists():
         raise FileNotFoundError(f"Image not found: {src}")
     dst = cfg.saved_dir / f"{image_id}.png"
-    shutil.copyfile(src, dst)
+    link_or_copy(src, dst)
     return dst
 
+
+def _id_time(image_id: str, path: Path) -> float:
+    try:
+        return datetime.strptime(image_id[:19], "%Y-%m-%dT%H-%M-%S").timestamp()
+    except ValueError:
+        return path.stat().st_mtime
+
+
+class GalleryJanitor:
+    """
+    Background upkeep of the gallery, a bounded amount of work (`max_files` files) per `step()`:
+    first moves images from the flat layout into their shards, then enforces the retention policy
+    (`gallery_max_age_days`, `gallery_max_mb`) by deleting the oldest images. Images that were
+    saved (`saved_dir`) are never deleted, nor counted against `gallery_max_mb`. Of several
+    processes sharing a gallery, only one works on it at a time.
+    """
+
+    def __init__(self, cfg: Config, *, max_files: int = 500):
+        self._cfg = cfg
+        self._max_files = max_files
+        # Bytes per day directory. Days before yesterday only change when this deletes from them,
+        # so they are measured once; more recent ones are measured again every step.
+        self._day_bytes: dict[str, int] = {}
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[bool]:
+        try:
+            import fcntl
+        except ImportError:  # not POSIX: assume a single process
+            yield True
+            return
+        # Not in the gallery: that directory is served at /images.
+        path = self._cfg.data_dir / "run" / "gallery-janitor.lock"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a") as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def step(self) -> dict[str, int]:
+        stats = {"migrated": 0, "deleted": 0, "freed_bytes": 0}
+        with self._exclusive() as ours:
+            if not ours:
+                return stats
+            stats["migrated"] = self._migrate()
+            if stats["migrated"] < self._max_files:
+                stats["deleted"], stats["freed_bytes"] = self._collect()
+        if stats["migrated"] or stats["deleted"]:
+            log.info(
+                "gallery: migrated %d, deleted %d (%.1f MB)",
+                stats["migrated"], stats["deleted"], stats["freed_bytes"] / _MB,
+            )
+        return stats
+
+    async def run(self, interval_s: Optional[float] = None) -> None:
+        """Background loop; each step runs in a worker thread."""
+        interval = float(interval_s or self._cfg.gallery_gc_interval_s)
+        while True:
+            try:
+                stats = await asyncio.to_thread(self.step)
+            except Exception as e:
+                log.warning("gallery: cleanup failed: %s", e)
+                stats = {}
+            # Keep going without a pause while there is a backlog (e.g. a large migration).
+            busy = stats.get("migrated", 0) + stats.get("deleted", 0) >= self._max_files
+            await asyncio.sleep(0.1 if busy else interval)
+
+    def _migrate(self) -> int:
+        moved = 0
+        with os.scandir(self._cfg.gallery_dir) as it:
+            for e in it:
+                if moved >= self._max_files:
+                    break
+                if e.name.startswith(".") or not e.name.endswith(".png") or not e.is_file():
+                    continue
+                image_id = e.name[:-4]
+                dest = self._cfg.gallery_dir / shard_dir(image_id)
+                dest.mkdir(parents=True, exist_ok=True)
+                meta_src = Path(e.path).with_suffix(".json")
+                if meta_src.exists():
+                    try:
+                        meta = json.loads(meta_src.read_text(encoding="utf-8"))
+                        meta["file"] = f"{shard_dir(image_id)}/{e.name}"
+                        _write_json(meta_src, meta)
+                    except (OSError, ValueError) as err:
+                        log.warning("gallery: could not update %s: %s", meta_src.name, err)
+                    os.replace(meta_src, dest / meta_src.name)
+                os.replace(e.path, dest / e.name)
+                moved += 1
+        return moved
+
+    def _measure(self, day: str) -> int:
+        total = 0
+        for bucket in _scan(self._cfg.gallery_dir / day):
+            if bucket.is_dir():
+                for f in _scan(Path(bucket.path)):
+                    try:
+                        total += f.stat().st_size
+                    except FileNotFoundError:
+                        pass
+        return total
+
+    def _collect(self) -> tuple[int, int]:
+        cfg = self._cfg
+        days, _ = _layout(cfg)
+        recent = datetime.fromtimestamp(time.time() - 86400).strftime("%Y-%m-%d")
+        for day in list(self._day_bytes):
+            if day not in days:
+                del self._day_bytes[day]
+        for day in days:
+            if day not in self._day_bytes or (day != _UNDATED and day >= recent):
+                self._day_bytes[day] = self._measure(day)
+        total = sum(self._day_bytes.values())
+        GALLERY_BYTES.set(total)
+
+        budget = cfg.gallery_max_mb * _MB if cfg.gallery_max_mb > 0 else None
+        if budget is not None:
+            # Saved images are never deleted, so only the rest counts against the budget: else
+            # saved images alone over it would make this delete every other one, the newest too.
+            budget += self._saved_bytes()
+        cutoff = time.time() - cfg.gallery_max_age_days * 86400 if cfg.gallery_max_age_days > 0 else None
+        deleted = freed = 0
+        for day in days:  # oldest first
+            for name, png in sorted(_day_pngs(cfg, day)):
+                if deleted >= self._max_files:
+                    return deleted, freed
+                image_id = name[:-4]
+                over = budget is not None and total > budget
+                try:
+                    expired = cutoff is not None and _id_time(image_id, png) < cutoff
+                except FileNotFoundError:
+                    continue
+                if not over and not expired:
+                    GALLERY_BYTES.set(total)
+                    return deleted, freed  # everything after this is newer
+                if (cfg.saved_dir / name).exists():
+                    continue
+                size = 0
+                for f in (png, png.with_suffix(".json")):
+                    try:
+                        size += f.stat().st_size
+                        f.unlink()
+                    except FileNotFoundError:
+                        pass
+                deleted += 1
+                freed += size
+                total -= size
+                self._day_bytes[day] = self._day_bytes.get(day, 0) - size
+            if day < recent:  # recent shards may be about to receive a new image
+                self._remove_empty(day)
+        GALLERY_BYTES.set(total)
+        return deleted, freed
+
+    def _saved_bytes(self) -> int:
+        """Gallery bytes of the images that were saved."""
+        total = 0
+        for e in _scan(self._cfg.saved_dir):
+            if not e.name.endswith(".png"):
+                continue
+            png = image_path(self._cfg, e.name[:-4])
+            for f in (png, png.with_suffix(".json")):
+                try:
+                    total += f.stat().st_size
+                except FileNotFoundError:
+                    pass
+        return total
+
+    def _remove_empty(self, day: str) -> None:
+        day_dir = self._cfg.gallery_dir / day
+        for bucket in _scan(day_dir):
+            try:
+                os.rmdir(bucket.path)
+            except OSError:
+                pass  # not empty
+        try:
+            day_dir.rmdir()
+        except OSError:
+            pass
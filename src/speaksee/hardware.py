@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Hardware:
+    torch: bool = False  # importable; without it everything runs on the CPU
+    cuda: bool = False
+    mps: bool = False
+
+    def has(self, device: str) -> bool:
+        return device == "cpu" or bool(getattr(self, device, False))
+
+
+_lock = threading.Lock()
+_cached: Optional[Hardware] = None
+
+
+def _probe() -> Hardware:
+    try:
+        import torch
+    except Exception as e:
+        log.info("torch unavailable (%s): using the CPU", e)
+        return Hardware()
+    cuda = mps = False
+    try:
+        cuda = bool(torch.cuda.is_available())
+    except Exception:
+        pass
+    try:
+        mps = bool(getattr(torch.backends, "mps", None) and torch.backends.mps.is_available())
+    except Exception:
+        pass
+    return Hardware(torch=True, cuda=cuda, mps=mps)
+
+
+def probe() -> Hardware:
+    """
+    The accelerators of this machine, probed once per process: the first call imports torch
+    (seconds), later ones return the cached result. Concurrent first calls share one probe.
+    """
+    global _cached
+    if _cached is not None:
+        return _cached
+    with _lock:
+        if _cached is None:
+            t0 = time.perf_counter()
+            hw = _probe()
+            log.info(
+                "hardware: cuda=%s mps=%s (probed in %.2fs)", hw.cuda, hw.mps, time.perf_counter() - t0
+            )
+            _cached = hw
+        return _cached
+
+
+def probed() -> Optional[Hardware]:
+    """The probe result if it is already known; never waits for (or starts) the probe."""
+    return _cached
+
+
+def probe_in_background(preference: str) -> None:
+    """Start the probe at startup so no request pays for it (nothing to probe for "cpu")."""
+    if preference == "cpu" or _cached is not None:
+        return
+    threading.Thread(target=probe, name="hardware-probe", daemon=True).start()
+
+
+def select_device(preference: str, supported: tuple[str, ...] = ("cuda", "mps")) -> str:
+    """
+    The device for `preference` ("auto" | "cpu" | "cuda" | "mps"): the preferred accelerator
+    (the first available of `supported` for "auto") if this machine has it, else "cpu".
+    """
+    if preference == "cpu":
+        return "cpu"
+    candidates = supported if preference == "auto" else tuple(d for d in supported if d == preference)
+    if not candidates:
+        return "cpu"
+    hw = probe()
+    for device in candidates:
+        if hw.has(device):
+            return device
+    return "cpu"
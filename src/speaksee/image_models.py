@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from .config import Config
+from .image_sd import ImageGenerator, ImageGenResult, SharedComponents
+from .metrics import GEN_QUEUE_WAIT_SECONDS
+from .tracing import TRACER
+
+
+log = logging.getLogger(__name__)
+
+
+class UnknownModel(ValueError):
+    pass
+
+
+class ImageModels:
+    """
+    All selectable diffusion models (`Config.sd_model_ids`) behind one LRU.
+
+    The `sd_max_resident` most recently used pipelines stay on the accelerator, up to
+    `sd_max_loaded` in total stay loaded (the rest parked in host RAM for a fast swap-in), and older
+    ones are unloaded. Pipelines whose VAE / text encoders are byte-identical share one copy.
+    Implements the memory manager's ManagedModel interface for all of them together.
+    """
+
+    def __init__(self, cfg: Config):
+        self._cfg = cfg
+        # One generation at a time across every model: they share the accelerator (and modules).
+        self._lock = threading.RLock()
+        self._shared = SharedComponents()
+        self._gens: "OrderedDict[str, ImageGenerator]" = OrderedDict()  # least recently used first
+        self._default = self._get(cfg.sd_model)
+
+    @property
+    def model_ids(self) -> tuple[str, ...]:
+        return self._cfg.sd_model_ids
+
+    def resolve(self, model_id: Optional[str]) -> str:
+        model_id = (model_id or "").strip() or self._cfg.sd_model
+        if model_id not in self.model_ids:
+            raise UnknownModel(model_id)
+        return model_id
+
+    def _get(self, model_id: str) -> ImageGenerator:
+        gen = self._gens.get(model_id)
+        if gen is None:
+            gen = ImageGenerator(self._cfg, model_id, lock=self._lock, shared=self._shared)
+            self._gens[model_id] = gen
+        return gen
+
+    def _current(self) -> ImageGenerator:
+        # Most recently used loaded pipeline; the default model before anything ran. Lock-free
+        # (reporting), so it walks a snapshot: generations reorder `_gens` on other threads.
+        for gen in reversed(list(self._gens.values())):
+            if gen.residency != "unloaded":
+                return gen
+        return self._default
+
+    def _make_room(self, keep: ImageGenerator) -> None:
+        others = [g for g in self._gens.values() if g is not keep]  # LRU order
+        resident = [g for g in others if g.residency == "device"]
+        for g in resident[: max(0, len(resident) - (self._cfg.sd_max_resident - 1))]:
+            if g.park():
+                log.info("swapped out %s (parked in host RAM)", g.model_id)
+        loaded = [g for g in others if g.residency != "unloaded"]
+        for g in loaded[: max(0, len(loaded) - (self._cfg.sd_max_loaded - 1))]:
+            if g.unload():
+                log.info("unloaded %s", g.model_id)
+
+    def generator(self, model_id: Optional[str] = None) -> ImageGenerator:
+        with self._lock:
+            gen = self._get(self.resolve(model_id))
+            self._gens.move_to_end(gen.model_id)
+            return gen
+
+    def generate(self, *, model_id: Optional[str] = None, **kwargs: Any) -> ImageGenResult:
+        t0 = time.perf_counter()
+        with self._lock:
+            t1 = time.perf_counter()
+            GEN_QUEUE_WAIT_SECONDS.observe(t1 - t0)
+            TRACER.add("gen.queue_wait", t0, t1)
+            gen = self.generator(model_id)
+            self._make_room(keep=gen)
+            return gen.generate(**kwargs)
+
+    def generate_batch(self, *, model_id: Optional[str] = None, **kwargs: Any) -> list[ImageGenResult]:
+        """See `ImageGenerator.generate_batch`."""
+        with self._lock:
+            gen = self.generator(model_id)
+            self._make_room(keep=gen)
+            return gen.generate_batch(**kwargs)
+
+    # --- reporting (for the most recently used model) -----------------------------------------
+
+    @property
+    def device(self) -> str:
+        return self._current().device
+
+    @property
+    def memory_mode(self) -> str:
+        return self._current().memory_mode
+
+    @property
+    def last_recovery(self) -> tuple[str, ...]:
+        return self._current().last_recovery
+
+    def loaded(self) -> dict[str, str]:
+        return {m: g.residency for m, g in list(self._gens.items())}
+
+    def devices(self) -> dict[str, str]:
+        """Device of every loaded model. Lock-free, so it never waits on a running generation."""
+        return {m: g.device for m, g in list(self._gens.items()) if g.residency != "unloaded"}
+
+    # --- memory manager hooks (see memory.ManagedModel) --------------------------------------
+
+    @property
+    def residency(self) -> str:
+        states = {g.residency for g in list(self._gens.values())}
+        for r in ("device", "host"):
+            if r in states:
+                return r
+        return "unloaded"
+
+    @property
+    def last_used(self) -> float:
+        return max((g.last_used for g in list(self._gens.values())), default=0.0)
+
+    def footprint(self) -> tuple[int, int]:
+        seen: set[int] = set()  # shared components count once
+        device_bytes = host_bytes = 0
+        for g in list(self._gens.values()):
+            d, h = g.footprint(seen)
+            device_bytes += d
+            host_bytes += h
+        return device_bytes, host_bytes
+
+    def park(self) -> bool:
+        parked = False
+        for g in list(self._gens.values()):
+            if g.residency == "device":
+                parked = g.park() or parked
+        return parked
+
+    def unload(self) -> bool:
+        unloaded = False
+        for g in list(self._gens.values()):
+            if g.residency != "unloaded":
+                unloaded = g.unload() or unloaded
+        return unloaded
+
+    def warm(self) -> None:
+        gen = self._current()
+        with self._lock:
+            self._make_room(keep=gen)
+            gen.warm()
+            self._gens.move_to_end(gen.model_id)
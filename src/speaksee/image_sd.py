@@ -1,95 +1,290 @@
 from __future__ import annotations
 
+import gc
+import hashlib
+import logging
 import math
 import random
+import threading
+import time
 import traceback
+import weakref
 from dataclasses import dataclass
-from typing import Callable, Optional
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Optional
 
 from PIL import Image
 
 from .config import Config
+from .hardware import probed, select_device
+from .metrics import GEN_SECONDS, GEN_STEP_SECONDS, MODEL_LOAD_SECONDS
+from .model_store import ModelEntry, ModelStore
+from .tracing import TRACER, span
 
 
+log = logging.getLogger(__name__)
+
 ProgressCb = Callable[[int, int], None]
 
+# OOM recovery tiers, cheapest first. "offload" and "cpu" stick until the cooldown expires;
+# "free_cache" and "downscale" only apply to the request that hit the OOM.
+OOM_STEPS = ("free_cache", "offload", "downscale", "cpu")
+
+
+class GenerationCancelled(Exception):
+    """Raised from inside a generation when its `should_cancel` callback returns True."""
+
 
 @dataclass(frozen=True)
 class ImageGenResult:
     image: Image.Image
     seed: int
     device: str
+    width: int = 0
+    height: int = 0
+    recovery: tuple[str, ...] = ()  # OOM recovery steps taken for this image, in order
+    model_id: str = ""
+    steps_run: int = 0  # denoising steps actually run (img2img runs a fraction of `steps`)
+    elapsed_s: float = 0.0  # pipeline time, excluding model loading and lock waits
+
+
+# Components that are commonly byte-identical across models of one family (e.g. SD 2.x turbo vs base).
+_SHAREABLE_COMPONENTS = ("vae", "text_encoder", "text_encoder_2", "tokenizer", "tokenizer_2")
+
+
+def _local_snapshot(model_id: str, cache_dir: str) -> Optional[Path]:
+    p = Path(model_id)
+    if p.is_dir():
+        return p
+    try:
+        from huggingface_hub import snapshot_download
+
+        return Path(snapshot_download(model_id, cache_dir=cache_dir, local_files_only=True))
+    except Exception:
+        return None
+
+
+def _file_identity(path: Path) -> str:
+    # HF cache snapshots symlink to content-addressed blobs: the blob name is the file's hash.
+    try:
+        if path.is_symlink():
+            return path.resolve().name
+    except OSError:
+        pass
+    size = path.stat().st_size
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        h.update(f.read(1 << 20))
+        if size > 2 << 20:
+            f.seek(size - (1 << 20))
+            h.update(f.read(1 << 20))
+    return f"{size}:{h.hexdigest()}"
+
+
+@lru_cache(maxsize=128)
+def _component_fingerprint(snapshot: str, component: str) -> Optional[str]:
+    d = Path(snapshot) / component
+    if not d.is_dir():
+        return None
+    files = sorted(f for f in d.iterdir() if f.is_file())
+    if not files:
+        return None
+    h = hashlib.sha256()
+    for f in files:
+        h.update(f.name.encode("utf-8"))
+        h.update(_file_identity(f).encode("utf-8"))
+    return h.hexdigest()
+
+
+class SharedComponents:
+    """
+    Loaded pipeline components keyed by their on-disk identity (plus dtype/variant), so models built
+    on the same VAE / text encoder weights load and hold a single copy. Entries are weak: a component
+    is freed once no loaded pipeline uses it.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._modules: "weakref.WeakValueDictionary[tuple[str, str, str, str], Any]" = (
+            weakref.WeakValueDictionary()
+        )
+
+    @staticmethod
+    def _keys(model_id: str, cache_dir: str, dtype: Any, variant: str) -> dict[str, tuple[str, str, str, str]]:
+        snap = _local_snapshot(model_id, cache_dir)
+        if snap is None:
+            return {}
+        keys: dict[str, tuple[str, str, str, str]] = {}
+        for comp in _SHAREABLE_COMPONENTS:
+            fp = _component_fingerprint(str(snap.resolve()), comp)
+            if fp:
+                keys[comp] = (comp, fp, str(dtype), variant)
+        return keys
+
+    def lookup(self, model_id: str, cache_dir: str, dtype: Any, variant: str) -> dict[str, Any]:
+        out: dict[str, Any] = {}
+        with self._lock:
+            for comp, key in self._keys(model_id, cache_dir, dtype, variant).items():
+                mod = self._modules.get(key)
+                if mod is not None:
+                    out[comp] = mod
+        return out
+
+    def register(self, model_id: str, cache_dir: str, dtype: Any, variant: str, pipe: Any) -> None:
+        with self._lock:
+            for comp, key in self._keys(model_id, cache_dir, dtype, variant).items():
+                mod = getattr(pipe, comp, None)
+                if mod is None or key in self._modules:
+                    continue
+                try:
+                    self._modules[key] = mod
+                except TypeError:
+                    pass  # not weak-referenceable
+
+
+def _is_oom(e: BaseException) -> bool:
+    return "out of memory" in str(e).lower()
+
+
+def _enable_vae_memory_savers(pipe) -> None:
+    # These reduce memory without triggering the MPS attention slicing issue.
+    try:
+        vae = getattr(pipe, "vae", None)
+        if vae is not None and hasattr(vae, "enable_slicing"):
+            vae.enable_slicing()
+        elif hasattr(pipe, "enable_vae_slicing"):
+            pipe.enable_vae_slicing()
+
+        if vae is not None and hasattr(vae, "enable_tiling"):
+            vae.enable_tiling()
+        elif hasattr(pipe, "enable_vae_tiling"):
+            pipe.enable_vae_tiling()
+    except Exception:
+        pass
 
 
 class ImageGenerator:
-    def __init__(self, cfg: Config):
+    def __init__(
+        self,
+        cfg: Config,
+        model_id: Optional[str] = None,
+        *,
+        lock: Optional[threading.RLock] = None,
+        shared: Optional[SharedComponents] = None,
+        store: Optional[ModelStore] = None,
+    ):
         self._cfg = cfg
+        self.model_id = model_id or cfg.sd_model
+        self._shared = shared
+        self._store = store or ModelStore(cfg)
         self._pipe = None
+        self._img2img_pipe = None
         self._device = None
+        self._home_device = None  # device chosen at load; OOM fallbacks return here after cooldown
         self._dtype = None
 
+        self._offloaded = False
+        self._last_oom_at = 0.0
+        self._last_recovery: tuple[str, ...] = ()
+
+        # Shared by all connections (and by all models in an ImageModels pool): one generation at a
+        # time. The memory manager only parks/unloads when it can take the lock without waiting.
+        self._lock = lock or threading.RLock()
+        self._parked = False  # weights moved to host RAM by the memory manager
+        self._last_used = 0.0
+
     def _select_device(self) -> str:
-        pref = self._cfg.device_preference
-        try:
-            import torch
-        except Exception:
-            return "cpu"
+        return select_device(self._cfg.device_preference)
 
-        if pref == "cpu":
-            return "cpu"
-        if pref == "cuda":
-            return "cuda" if torch.cuda.is_available() else "cpu"
-        if pref == "mps":
-            return "mps" if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available() else "cpu"
-
-        # auto
-        if torch.cuda.is_available():
-            return "cuda"
-        if getattr(torch.backends, "mps", None) and torch.backends.mps.is_available():
-            return "mps"
-        return "cpu"
+    @staticmethod
+    def _dtype_for(device: str) -> Any:
+        import torch
+
+        # Use float16 on CUDA/MPS for performance. On MPS we avoid fp16 *variants* (see attempts below)
+        # because some fp16 variant weights can yield all-black images.
+        return torch.float16 if device in ("cuda", "mps") else torch.float32
+
+    def _variants(self, device: str) -> list[str]:
+        return ["fp16", ""] if device == "cuda" else [""]
+
+    def prefetch(self) -> ModelEntry:
+        """Download the snapshot this machine would load (without loading it) and record it."""
+        from diffusers import DiffusionPipeline
+
+        device = self._select_device()
+        dtype = self._dtype_for(device)
+        last_err: Exception | None = None
+        for variant in self._variants(device):
+            kwargs: dict[str, Any] = {"cache_dir": str(self._cfg.hf_home), "torch_dtype": dtype}
+            if variant:
+                kwargs["variant"] = variant
+            try:
+                path = (
+                    self.model_id
+                    if Path(self.model_id).is_dir()
+                    else DiffusionPipeline.download(self.model_id, **kwargs)
+                )
+            except Exception as e:
+                last_err = e
+                continue
+            return self._store.record(
+                "sd", self.model_id, path, variant=variant, dtype=str(dtype), device=device
+            )
+        raise RuntimeError(f"Failed to fetch SD pipeline for {self.model_id}: {last_err}")
 
     def _ensure_pipe(self) -> None:
         if self._pipe is not None:
             return
+        t_load = time.perf_counter()
 
-        import torch
         from diffusers import AutoPipelineForText2Image
 
         device = self._select_device()
-        # Use float16 on CUDA/MPS for performance. On MPS we avoid fp16 *variants* (see attempts below)
-        # because some fp16 variant weights can yield all-black images.
-        dtype = torch.float16 if device in ("cuda", "mps") else torch.float32
+        dtype = self._dtype_for(device)
 
         # Prefer local-only first; fall back to download. Cache dir is HF_HOME (already set by run script).
-        model_id = self._cfg.sd_model
+        model_id = self.model_id
         cache_dir = str(self._cfg.hf_home)
 
         last_err: Exception | None = None
 
-        attempts: list[dict[str, object]] = []
+        attempts: list[dict[str, Any]] = []
+        # 0) The snapshot that loaded last time (model store manifest): a plain local directory, so no
+        #    hub resolution at all. Weights are safetensors, memory-mapped by the loader.
+        entry = self._store.get("sd", model_id)
+        if entry is not None and entry.dtype == str(dtype):
+            attempts.append({"path": entry.path, "local_files_only": True, "variant": entry.variant})
         # 1) Local-only, fp16 variant (if applicable)
-        attempts.append({"local_files_only": True, "use_variant_fp16": device == "cuda"})
+        attempts.append({"local_files_only": True, "variant": self._variants(device)[0]})
         # 2) Allow download, fp16 variant (if applicable)
-        attempts.append({"local_files_only": False, "use_variant_fp16": device == "cuda"})
+        attempts.append({"local_files_only": False, "variant": self._variants(device)[0]})
         # 3) Allow download, no variant (more compatible)
-        attempts.append({"local_files_only": False, "use_variant_fp16": False})
+        attempts.append({"local_files_only": False, "variant": ""})
 
         for attempt in attempts:
             try:
-                local_only = bool(attempt["local_files_only"])
-                use_fp16_variant = bool(attempt["use_variant_fp16"])
+                source = str(attempt.get("path") or model_id)
+                variant = str(attempt["variant"])
 
-                kwargs = dict(
+                kwargs: dict[str, Any] = dict(
                     torch_dtype=dtype,
                     cache_dir=cache_dir,
-                    local_files_only=local_only,
+                    local_files_only=bool(attempt["local_files_only"]),
                 )
-                if use_fp16_variant:
-                    kwargs["variant"] = "fp16"
+                if variant:
+                    kwargs["variant"] = variant
+
+                shared: dict[str, Any] = {}
+                if self._shared is not None:
+                    shared = self._shared.lookup(source, cache_dir, dtype, variant)
+                    if shared:
+                        log.info("%s: reusing loaded %s", model_id, ", ".join(sorted(shared)))
 
-                pipe = AutoPipelineForText2Image.from_pretrained(model_id, **kwargs)
+                t0 = time.perf_counter()
+                pipe = AutoPipelineForText2Image.from_pretrained(source, **kwargs, **shared)
                 pipe.set_progress_bar_config(disable=True)
+                log.info("%s: loaded from %s in %.1fs", model_id, source, time.perf_counter() - t0)
 
                 # Disable safety checker to avoid extra weights and latency for a fully local app.
                 try:
@@ -109,31 +304,59 @@ class ImageGenerator:
                     except Exception:
                         pass
                 else:
-                    try:
-                        # These reduce memory without triggering the MPS attention slicing issue.
-                        vae = getattr(pipe, "vae", None)
-                        if vae is not None and hasattr(vae, "enable_slicing"):
-                            vae.enable_slicing()
-                        elif hasattr(pipe, "enable_vae_slicing"):
-                            pipe.enable_vae_slicing()
-
-                        if vae is not None and hasattr(vae, "enable_tiling"):
-                            vae.enable_tiling()
-                        elif hasattr(pipe, "enable_vae_tiling"):
-                            pipe.enable_vae_tiling()
-                    except Exception:
-                        pass
+                    _enable_vae_memory_savers(pipe)
                 self._pipe = pipe
                 self._device = device
+                self._home_device = device
                 self._dtype = dtype
+                if self._shared is not None:
+                    self._shared.register(source, cache_dir, dtype, variant, pipe)
+                if "path" not in attempt:
+                    self._record_snapshot(variant, dtype, device)
+                t_done = time.perf_counter()
+                MODEL_LOAD_SECONDS.observe(t_done - t_load, model=f"sd:{model_id}")
+                TRACER.add("sd.load", t_load, t_done, model=model_id)
                 return
             except Exception as e:
                 last_err = e
+                if "path" in attempt:
+                    log.warning("%s: recorded snapshot failed to load (%s); resolving again", model_id, e)
+                    self._store.forget("sd", model_id)
                 continue
 
         raise RuntimeError(f"Failed to load SD pipeline for {model_id}: {last_err}")
 
-    def generate(
+    def _record_snapshot(self, variant: str, dtype: Any, device: str) -> None:
+        # Best-effort: a manifest problem must never fail a load that worked.
+        try:
+            snapshot = _local_snapshot(self.model_id, str(self._cfg.hf_home))
+            if snapshot is not None:
+                self._store.record(
+                    "sd", self.model_id, snapshot, variant=variant, dtype=str(dtype), device=device
+                )
+        except Exception as e:
+            log.warning("%s: could not record snapshot: %s", self.model_id, e)
+
+    def _ensure_img2img_pipe(self):
+        self._ensure_pipe()
+        if self._img2img_pipe is None:
+            from diffusers import AutoPipelineForImage2Image
+
+            # Built from the loaded text2img pipe: same modules, no extra weights or device copies.
+            pipe = AutoPipelineForImage2Image.from_pipe(self._pipe)
+            pipe.set_progress_bar_config(disable=True)
+            self._img2img_pipe = pipe
+        return self._img2img_pipe
+
+    def generate(self, **kwargs) -> ImageGenResult:
+        """See `_generate`. Serialized across callers; marks the model as used for the memory manager."""
+        with self._lock:
+            try:
+                return self._generate(**kwargs)
+            finally:
+                self._last_used = time.monotonic()
+
+    def _generate(
         self,
         *,
         prompt: str,
@@ -143,26 +366,59 @@ class ImageGenerator:
         height: int,
         seed: Optional[int] = None,
         on_progress: Optional[ProgressCb] = None,
+        init_image: Optional[Image.Image] = None,
+        strength: float = 1.0,
+        guidance_scale: Optional[float] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        _recovery: tuple[str, ...] = (),
     ) -> ImageGenResult:
+        """
+        Text-to-image, or img2img refinement of `init_image` when given: the previous result is
+        re-noised to `strength` and only that fraction of `steps` is run.
+
+        `should_cancel` is polled before starting and after every step; when it returns True the
+        generation stops with GenerationCancelled (e.g. a background refine preempted by a new
+        prompt).
+
+        On device OOM, recovery escalates through OOM_STEPS and retries.
+        """
+        if should_cancel is not None and should_cancel():
+            raise GenerationCancelled()
         self._ensure_pipe()
+        self._unpark()
         import torch
 
+        if not _recovery:
+            self._maybe_promote()
+
         assert self._pipe is not None
         device = str(self._device or "cpu")
+        refine = init_image is not None
+        pipe = self._ensure_img2img_pipe() if refine else self._pipe
+        t0 = time.perf_counter()
+        step_marks: list[float] = []
 
         if seed is None:
             seed = random.randint(0, 2**31 - 1)
 
         def _progress(step_idx: int, total: int) -> None:
-            if on_progress is None:
-                return
-            try:
-                on_progress(step_idx, total)
-            except Exception:
-                pass
+            step_marks.append(time.perf_counter())
+            if on_progress is not None:
+                try:
+                    on_progress(step_idx, total)
+                except Exception:
+                    pass
+            if should_cancel is not None and should_cancel():
+                raise GenerationCancelled()
 
         # Diffusers callback APIs vary; implement both best-effort.
         total_steps = max(1, int(steps))
+        run_steps = total_steps
+        if refine:
+            strength = min(1.0, max(0.05, float(strength)))
+            # img2img runs int(steps * strength) steps; make sure that is at least one.
+            total_steps = max(total_steps, math.ceil(1.0 / strength))
+            run_steps = max(1, int(total_steps * strength))
 
         def callback_on_step_end(*args, **kwargs):
             # Common signatures:
@@ -171,7 +427,7 @@ class ImageGenerator:
                 step_index = int(args[1]) if len(args) > 1 else int(kwargs.get("step_index", 0))
             except Exception:
                 step_index = 0
-            _progress(step_index + 1, total_steps)
+            _progress(step_index + 1, run_steps)
             # return callback_kwargs if present
             if len(args) >= 4:
                 return args[3]
@@ -183,14 +439,15 @@ class ImageGenerator:
         gen = torch.Generator(device=gen_device).manual_seed(int(seed))
 
         # SD Turbo models often work best with low guidance.
-        guidance_scale = 0.0
+        if guidance_scale is None:
+            guidance_scale = 0.0
 
         # Be defensive: pipelines vary in accepted kwargs across model types / diffusers versions.
         import inspect
 
         params = {}
         try:
-            params = dict(inspect.signature(self._pipe.__call__).parameters)
+            params = dict(inspect.signature(pipe.__call__).parameters)
         except Exception:
             params = {}
 
@@ -202,10 +459,14 @@ class ImageGenerator:
             kwargs["num_inference_steps"] = total_steps
         if "guidance_scale" in params or not params:
             kwargs["guidance_scale"] = guidance_scale
-        if ("width" in params or not params) and width:
-            kwargs["width"] = int(width)
-        if ("height" in params or not params) and height:
-            kwargs["height"] = int(height)
+        if refine:
+            kwargs["image"] = init_image
+            kwargs["strength"] = strength
+        else:
+            if ("width" in params or not params) and width:
+                kwargs["width"] = int(width)
+            if ("height" in params or not params) and height:
+                kwargs["height"] = int(height)
         if "generator" in params or not params:
             kwargs["generator"] = gen
 
@@ -213,37 +474,377 @@ class ImageGenerator:
         if "callback_on_step_end" in params:
             kwargs["callback_on_step_end"] = callback_on_step_end
         elif "callback" in params:
-            kwargs["callback"] = lambda i, t, latents: _progress(i + 1, total_steps)
+            kwargs["callback"] = lambda i, t, latents: _progress(i + 1, run_steps)
             if "callback_steps" in params:
                 kwargs["callback_steps"] = 1
 
         try:
-            result = self._pipe(**kwargs)
+            with span("sd.pipeline", mode="img2img" if refine else "txt2img", steps=run_steps, device=device):
+                result = pipe(**kwargs)
         except RuntimeError as e:
-            # Device OOM fallback.
-            if "out of memory" in str(e).lower() and device in ("cuda", "mps"):
-                try:
-                    self._pipe = self._pipe.to("cpu")
-                    self._device = "cpu"
-                    return self.generate(
-                        prompt=prompt,
-                        negative_prompt=negative_prompt,
-                        steps=steps,
-                        width=width,
-                        height=height,
-                        seed=seed,
-                        on_progress=on_progress,
-                    )
-                except Exception:
-                    raise
-            raise
+            if not _is_oom(e) or device not in ("cuda", "mps"):
+                raise
+            step = self._next_oom_step(_recovery, width, height, refine)
+            if step is None:
+                raise
+            self._apply_oom_step(step)
+            if step == "downscale":
+                width, height = self._downscaled(width, height)
+                log.warning("OOM recovery: retrying at %dx%d", width, height)
+            return self._generate(
+                prompt=prompt,
+                negative_prompt=negative_prompt,
+                steps=steps,
+                width=width,
+                height=height,
+                seed=seed,
+                on_progress=on_progress,
+                init_image=init_image,
+                strength=strength,
+                guidance_scale=guidance_scale,
+                should_cancel=should_cancel,
+                _recovery=_recovery + (step,),
+            )
 
         image = result.images[0]
-        return ImageGenResult(image=image, seed=int(seed), device=device)
+        if _recovery:
+            self._last_recovery = _recovery
+        elapsed_s = time.perf_counter() - t0
+        mode = "img2img" if refine else "txt2img"
+        GEN_SECONDS.observe(elapsed_s, mode=mode, device=device)
+        if len(step_marks) >= 2:
+            step_s = (step_marks[-1] - step_marks[0]) / (len(step_marks) - 1)
+        else:
+            step_s = elapsed_s / run_steps
+        GEN_STEP_SECONDS.observe(step_s, mode=mode, device=device)
+        return ImageGenResult(
+            image=image,
+            seed=int(seed),
+            device=device,
+            width=image.width,
+            height=image.height,
+            recovery=_recovery,
+            model_id=self.model_id,
+            steps_run=run_steps,
+            elapsed_s=elapsed_s,
+        )
+
+    def generate_batch(
+        self,
+        *,
+        prompts: list[str],
+        negative_prompt: str,
+        steps: int,
+        width: int,
+        height: int,
+        seeds: list[int],
+        guidance_scale: Optional[float] = None,
+    ) -> list[ImageGenResult]:
+        """
+        Text-to-image for several prompts in one pipeline call. Every image gets its own generator,
+        so each matches what `generate` renders for the same prompt and seed. A batch that does not
+        fit on the device is rendered one image at a time instead (with the usual OOM recovery).
+        """
+        if len(prompts) != len(seeds):
+            raise ValueError("one seed per prompt")
+        with self._lock:
+            try:
+                return self._generate_batch(
+                    prompts=prompts,
+                    negative_prompt=negative_prompt,
+                    steps=steps,
+                    width=width,
+                    height=height,
+                    seeds=seeds,
+                    guidance_scale=guidance_scale,
+                )
+            finally:
+                self._last_used = time.monotonic()
+
+    def _generate_batch(
+        self,
+        *,
+        prompts: list[str],
+        negative_prompt: str,
+        steps: int,
+        width: int,
+        height: int,
+        seeds: list[int],
+        guidance_scale: Optional[float],
+    ) -> list[ImageGenResult]:
+        def one_by_one() -> list[ImageGenResult]:
+            return [
+                self._generate(
+                    prompt=p,
+                    negative_prompt=negative_prompt,
+                    steps=steps,
+                    width=width,
+                    height=height,
+                    seed=s,
+                    guidance_scale=guidance_scale,
+                )
+                for p, s in zip(prompts, seeds)
+            ]
+
+        if len(prompts) <= 1:
+            return one_by_one()
+        self._ensure_pipe()
+        self._unpark()
+        self._maybe_promote()
+        import torch
+
+        assert self._pipe is not None
+        pipe = self._pipe
+        device = str(self._device or "cpu")
+        gen_device = "cpu" if device == "mps" else device  # see _generate
+        n = len(prompts)
+        steps = max(1, int(steps))
+        kwargs: dict[str, Any] = {
+            "prompt": list(prompts),
+            "num_inference_steps": steps,
+            "guidance_scale": 0.0 if guidance_scale is None else guidance_scale,
+            "width": int(width),
+            "height": int(height),
+            "generator": [torch.Generator(device=gen_device).manual_seed(int(s)) for s in seeds],
+        }
+        if negative_prompt:
+            kwargs["negative_prompt"] = [negative_prompt] * n
+
+        t0 = time.perf_counter()
+        try:
+            with span("sd.pipeline", mode="batch", steps=steps, device=device, batch=n):
+                result = pipe(**kwargs)
+        except RuntimeError as e:
+            if not _is_oom(e) or device not in ("cuda", "mps"):
+                raise
+            log.warning("batch of %d images does not fit on %s; rendering them one at a time", n, device)
+            self._last_oom_at = time.monotonic()
+            self._free_device_memory()
+            return one_by_one()
+        elapsed_s = time.perf_counter() - t0
+        GEN_SECONDS.observe(elapsed_s, mode="batch", device=device)
+        GEN_STEP_SECONDS.observe(elapsed_s / steps, mode="batch", device=device)
+        return [
+            ImageGenResult(
+                image=image,
+                seed=int(seed),
+                device=device,
+                width=image.width,
+                height=image.height,
+                model_id=self.model_id,
+                steps_run=steps,
+                elapsed_s=elapsed_s / n,
+            )
+            for image, seed in zip(result.images, seeds)
+        ]
+
+    # --- OOM recovery -------------------------------------------------------------------------
+
+    def _next_oom_step(
+        self, taken: tuple[str, ...], width: int, height: int, refine: bool
+    ) -> Optional[str]:
+        if "free_cache" not in taken:
+            return "free_cache"
+        if not self._offloaded and self._device != "cpu":
+            return "offload"
+        if (
+            self._cfg.oom_allow_downscale
+            and not refine  # img2img keeps the size of its input image
+            and min(self._downscaled(width, height)) >= self._cfg.oom_min_side
+        ):
+            return "downscale"
+        if self._device != "cpu":
+            return "cpu"
+        return None
+
+    @staticmethod
+    def _downscaled(width: int, height: int) -> tuple[int, int]:
+        # 3/4 per step, kept to multiples of 8 (latent stride).
+        return max(8, int(width * 0.75) // 8 * 8), max(8, int(height * 0.75) // 8 * 8)
+
+    def _free_device_memory(self) -> None:
+        gc.collect()
+        try:
+            import torch
+
+            if self._home_device == "cuda" and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            elif self._home_device == "mps" and hasattr(torch, "mps"):
+                torch.mps.empty_cache()
+        except Exception:
+            pass
+
+    def _apply_oom_step(self, step: str) -> None:
+        assert self._pipe is not None
+        self._last_oom_at = time.monotonic()
+        self._free_device_memory()
+        if step == "offload":
+            _enable_vae_memory_savers(self._pipe)
+            if self._device == "cuda":
+                try:
+                    # Keeps only the active sub-model (text encoder / UNet / VAE) on the GPU.
+                    self._pipe.enable_model_cpu_offload(device=self._device)
+                except Exception as e:
+                    log.warning("OOM recovery: model CPU offload unavailable: %s", e)
+            self._offloaded = True
+            self._img2img_pipe = None  # rebuilt from the offloaded pipe on next use
+        elif step == "cpu":
+            self._disable_offload()
+            self._pipe = self._pipe.to("cpu")
+            self._device = "cpu"
+            self._img2img_pipe = None
+            self._free_device_memory()
+        log.warning("OOM recovery on %s: %s (memory mode now %s)", self._home_device, step, self.memory_mode)
+
+    def _disable_offload(self) -> None:
+        if not self._offloaded or self._pipe is None:
+            return
+        try:
+            if hasattr(self._pipe, "remove_all_hooks"):
+                self._pipe.remove_all_hooks()
+        except Exception:
+            pass
+        self._offloaded = False
+
+    def _maybe_promote(self) -> None:
+        """After `oom_cooldown_s` without an OOM, move back to the home device at full speed."""
+        if self.memory_mode == "normal":
+            return
+        if time.monotonic() - self._last_oom_at < self._cfg.oom_cooldown_s:
+            return
+        assert self._pipe is not None
+        try:
+            self._disable_offload()
+            self._pipe = self._pipe.to(self._home_device)
+            self._device = self._home_device
+            self._img2img_pipe = None
+            self._last_recovery = ()
+            log.warning("OOM cooldown elapsed: promoted back to %s", self._home_device)
+        except Exception as e:
+            # Still doesn't fit; stay degraded and try again after another cooldown.
+            self._last_oom_at = time.monotonic()
+            log.warning("Promotion back to %s failed: %s", self._home_device, e)
+
+    # --- memory manager hooks (see memory.ManagedModel) --------------------------------------
+
+    def _unpark(self) -> None:
+        if self._pipe is None or self._offloaded:
+            return
+        # Also catches shared components that another pipeline in the pool parked.
+        if self._parked or not self._on_device():
+            self._pipe = self._pipe.to(self._device)
+            self._parked = False
+
+    def _on_device(self) -> bool:
+        for comp in getattr(self._pipe, "components", {}).values():
+            params = getattr(comp, "parameters", None)
+            if not callable(params):
+                continue
+            try:
+                t = next(iter(params()), None)
+            except Exception:
+                continue
+            if t is not None and t.device.type != self._device:
+                return False
+        return True
+
+    @property
+    def residency(self) -> str:
+        if self._pipe is None:
+            return "unloaded"
+        if self._parked or self._device == "cpu":
+            return "host"
+        return "device"
+
+    @property
+    def last_used(self) -> float:
+        return self._last_used
+
+    def tensors(self):
+        """Every parameter/buffer of the loaded pipeline (shared components included)."""
+        pipe = self._pipe
+        if pipe is None:
+            return
+        for comp in getattr(pipe, "components", {}).values():
+            for attr in ("parameters", "buffers"):
+                fn = getattr(comp, attr, None)
+                if callable(fn):
+                    try:
+                        yield from fn()
+                    except Exception:
+                        pass
+
+    def footprint(self, seen: Optional[set[int]] = None) -> tuple[int, int]:
+        """(accelerator bytes, host bytes); tensors already in `seen` are not counted again."""
+        seen = set() if seen is None else seen
+        device_bytes = host_bytes = 0
+        for t in self.tensors():
+            if id(t) in seen:
+                continue
+            seen.add(id(t))
+            n = t.numel() * t.element_size()
+            if t.device.type == "cpu":
+                host_bytes += n
+            else:
+                device_bytes += n
+        return device_bytes, host_bytes
+
+    def park(self) -> bool:
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self._pipe is None or self._parked or self._offloaded or self._device == "cpu":
+                return False
+            self._pipe = self._pipe.to("cpu")
+            self._img2img_pipe = None
+            self._parked = True
+            self._free_device_memory()
+            return True
+        finally:
+            self._lock.release()
+
+    def unload(self) -> bool:
+        if not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self._pipe is None:
+                return False
+            self._disable_offload()
+            self._pipe = None
+            self._img2img_pipe = None
+            self._parked = False
+            self._last_recovery = ()
+            self._free_device_memory()
+            return True
+        finally:
+            self._lock.release()
+
+    def warm(self) -> None:
+        with self._lock:
+            self._ensure_pipe()
+            self._unpark()
+            self._last_used = time.monotonic()
+
+    @property
+    def memory_mode(self) -> str:
+        """ "normal" | "offload" (CPU offload / VAE tiling on the GPU) | "cpu" (OOM fallback)."""
+        if self._pipe is None:
+            return "normal"
+        if self._device == "cpu" and self._home_device != "cpu":
+            return "cpu"
+        if self._offloaded:
+            return "offload"
+        return "normal"
+
+    @property
+    def last_recovery(self) -> tuple[str, ...]:
+        return self._last_recovery
 
     @property
     def device(self) -> str:
-        # Don't force model load just to report the planned device.
+        # Don't force model load just to report the planned device, nor wait for the hardware
+        # probe (still running right after startup): until then, report the preference.
         if self._pipe is None:
-            return self._select_device()
+            pref = self._cfg.device_preference
+            return self._select_device() if probed() is not None or pref == "cpu" else pref
         return str(self._device or "cpu")
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from .config import Config
+
+
+log = logging.getLogger(__name__)
+
+# Terminal events: the SSE stream ends after one of these.
+TERMINAL_EVENTS = ("result", "error")
+
+Runner = Callable[["Job"], Awaitable[dict[str, Any]]]
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class IdempotencyConflict(Exception):
+    """The idempotency key was already used for a request with different parameters."""
+
+
+def fingerprint(*parts: Any) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else json.dumps(part, sort_keys=True).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str  # "generate" | "transcribe"
+    fingerprint: str
+    idempotency_key: Optional[str] = None
+    status: str = "queued"  # "queued" | "running" | "done" | "error"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: Optional[dict[str, Any]] = None
+    result: Optional[dict[str, Any]] = None
+    error: Optional[str] = None
+    events: list[dict[str, Any]] = field(default_factory=list)
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    _loop: Optional[asyncio.AbstractEventLoop] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "error")
+
+    def emit(self, event: str, data: dict[str, Any]) -> None:
+        """Record an event and wake every SSE stream. Event loop thread only."""
+        if event == "progress":
+            self.progress = data
+        self.events.append({"id": len(self.events), "event": event, "data": data})
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def emit_threadsafe(self, event: str, data: dict[str, Any]) -> None:
+        """`emit` from a worker thread (e.g. a diffusion progress callback)."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.emit, event, data)
+
+    def as_dict(self) -> dict[str, Any]:
+        out: dict[str, Any] = {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.progress is not None:
+            out["progress"] = self.progress
+        if self.result is not None:
+            out["result"] = self.result
+        if self.error is not None:
+            out["error"] = self.error
+        return out
+
+
+class JobQueue:
+    """
+    Jobs submitted over HTTP (`/api/generate`, `/api/transcribe`). Each kind runs one job at a time
+    in submission order (the models serialize anyway; this keeps a queue position meaningful), and
+    shares the loaded models with WebSocket sessions.
+
+    A request carrying an `Idempotency-Key` that was already seen returns the original job instead
+    of running the work again, as long as that job is still kept (the last `cfg.job_history`
+    finished ones).
+    """
+
+    def __init__(self, cfg: Config, *, concurrency: Optional[dict[str, int]] = None):
+        self._cfg = cfg
+        self._concurrency = concurrency or {"generate": 1, "transcribe": 1}
+        self._slots: dict[str, asyncio.Semaphore] = {}
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()  # oldest first
+        self._by_key: dict[str, str] = {}
+        self._tasks: set[asyncio.Task[Any]] = set()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def queued(self, kind: str) -> list[Job]:
+        return [j for j in self._jobs.values() if j.kind == kind and j.status == "queued"]
+
+    def describe(self, job: Job) -> dict[str, Any]:
+        out = job.as_dict()
+        if job.status == "queued":
+            out["queue_position"] = next(
+                (i for i, j in enumerate(self.queued(job.kind)) if j is job), 0
+            )
+        return out
+
+    def submit(
+        self, kind: str, fp: str, runner: Runner, *, idempotency_key: Optional[str] = None
+    ) -> tuple[Job, bool]:
+        """(job, created). Must be called on the event loop."""
+        if idempotency_key:
+            existing = self._jobs.get(self._by_key.get(idempotency_key, ""))
+            if existing is not None:
+                if existing.kind != kind or existing.fingerprint != fp:
+                    raise IdempotencyConflict(idempotency_key)
+                return existing, False
+        if len(self.queued(kind)) >= self._cfg.job_queue_max:
+            raise JobQueueFull(kind)
+
+        job = Job(id=uuid.uuid4().hex, kind=kind, fingerprint=fp, idempotency_key=idempotency_key)
+        job._loop = asyncio.get_running_loop()
+        self._jobs[job.id] = job
+        if idempotency_key:
+            self._by_key[idempotency_key] = job.id
+        job.emit("queued", {"queue_position": len(self.queued(kind)) - 1})
+        task = asyncio.create_task(self._run(job, runner))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        self._prune()
+        return job, True
+
+    async def _run(self, job: Job, runner: Runner) -> None:
+        slot = self._slots.setdefault(job.kind, asyncio.Semaphore(self._concurrency.get(job.kind, 1)))
+        async with slot:
+            job.status = "running"
+            job.started_at = time.time()
+            job.emit("started", {})
+            try:
+                result = await runner(job)
+            except asyncio.CancelledError:
+                self._finish(job, error="cancelled (server shutting down)")
+                raise
+            except Exception as e:
+                log.warning("%s job %s failed: %s", job.kind, job.id, e)
+                self._finish(job, error=str(e) or type(e).__name__)
+            else:
+                self._finish(job, result=result)
+        self._prune()
+
+    def _finish(self, job: Job, *, result: Optional[dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        job.finished_at = time.time()
+        if error is not None:
+            job.status, job.error = "error", error
+            job.emit("error", {"error": error})
+        else:
+            job.status, job.result = "done", result or {}
+            job.emit("result", job.result)
+
+    def _prune(self) -> None:
+        finished = [j for j in self._jobs.values() if j.finished]
+        for job in finished[: max(0, len(finished) - self._cfg.job_history)]:
+            del self._jobs[job.id]
+            if job.idempotency_key and self._by_key.get(job.idempotency_key) == job.id:
+                del self._by_key[job.idempotency_key]
+
+    async def stream(
+        self, job: Job, after: int = -1, keepalive_s: float = 15.0
+    ) -> AsyncIterator[Optional[dict[str, Any]]]:
+        """
+        Events with id > `after` (for SSE `Last-Event-ID` resumption), then new ones as they
+        happen, until the job finishes. Yields None after `keepalive_s` without an event.
+        """
+        sent = after + 1
+        while True:
+            changed = job._changed
+            while sent < len(job.events):
+                event = job.events[sent]
+                sent += 1
+                yield event
+                if event["event"] in TERMINAL_EVENTS:
+                    return
+            if job.finished:
+                return
+            try:
+                await asyncio.wait_for(changed.wait(), keepalive_s)
+            except asyncio.TimeoutError:
+                yield None
+
+    async def close(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def sse_format(event: Optional[dict[str, Any]]) -> str:
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
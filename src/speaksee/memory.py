@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Literal, Optional, Protocol
+
+from .config import Config
+
+
+log = logging.getLogger(__name__)
+
+Residency = Literal["device", "host", "unloaded"]
+
+_MB = 1024 * 1024
+
+
+class ManagedModel(Protocol):
+    """What the memory manager needs from a model wrapper (SpeechToText, ImageGenerator)."""
+
+    @property
+    def residency(self) -> Residency: ...
+
+    @property
+    def last_used(self) -> float: ...  # time.monotonic() of the last use
+
+    def footprint(self) -> tuple[int, int]: ...  # (accelerator bytes, host bytes)
+
+    def park(self) -> bool: ...  # accelerator -> host RAM; False if busy / not applicable
+
+    def unload(self) -> bool: ...  # drop weights entirely; False if busy
+
+    def warm(self) -> None: ...  # load and move to the accelerator ahead of use
+
+
+@dataclass(frozen=True)
+class ModelUsage:
+    name: str
+    residency: Residency
+    device_bytes: int
+    host_bytes: int
+    idle_s: float
+
+
+class MemoryManager:
+    """
+    Tracks the footprint of every registered model and gives memory back:
+
+    - models idle for `idle_offload_s` are parked in host RAM, idle for `idle_unload_s` unloaded;
+    - accelerator / host usage above `gpu_budget_mb` / `host_budget_mb` evicts least recently used
+      models first (park, then unload);
+    - `prepare()` reloads models ahead of use (e.g. when a session starts recording).
+    """
+
+    def __init__(self, cfg: Config):
+        self._cfg = cfg
+        self._models: dict[str, ManagedModel] = {}
+        # Last measured accelerator footprint per model, to make room before reloading it.
+        self._known_device_bytes: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, model: ManagedModel) -> None:
+        self._models[name] = model
+
+    @property
+    def gpu_budget_bytes(self) -> int:
+        return max(0, int(self._cfg.gpu_budget_mb)) * _MB
+
+    @property
+    def host_budget_bytes(self) -> int:
+        return max(0, int(self._cfg.host_budget_mb)) * _MB
+
+    def usage(self) -> list[ModelUsage]:
+        now = time.monotonic()
+        out: list[ModelUsage] = []
+        for name, m in self._models.items():
+            dev, host = m.footprint()
+            if dev:
+                self._known_device_bytes[name] = dev
+            idle = now - m.last_used if m.last_used else 0.0
+            out.append(ModelUsage(name, m.residency, dev, host, round(idle, 1)))
+        return out
+
+    def snapshot(self) -> dict[str, Any]:
+        models = self.usage()
+        snap: dict[str, Any] = {
+            "models": [m.__dict__ for m in models],
+            "device_bytes": sum(m.device_bytes for m in models),
+            "host_bytes": sum(m.host_bytes for m in models),
+            "gpu_budget_bytes": self.gpu_budget_bytes,
+            "host_budget_bytes": self.host_budget_bytes,
+        }
+        snap.update(_accelerator_info())
+        return snap
+
+    def _lru(self, exclude: tuple[str, ...] = ()) -> list[tuple[str, ManagedModel]]:
+        items = [(n, m) for n, m in self._models.items() if n not in exclude]
+        return sorted(items, key=lambda t: t[1].last_used)
+
+    def _enforce_budgets(self, protect: tuple[str, ...] = ()) -> list[str]:
+        actions: list[str] = []
+        if self.gpu_budget_bytes:
+            for name, m in self._lru(protect):
+                used = sum(u.device_bytes for u in self.usage())
+                if used <= self.gpu_budget_bytes:
+                    break
+                if m.residency == "device" and m.footprint()[0] and m.park():
+                    actions.append(f"park:{name}")
+        if self.host_budget_bytes:
+            for name, m in self._lru(protect):
+                used = sum(u.host_bytes for u in self.usage())
+                if used <= self.host_budget_bytes:
+                    break
+                if m.residency != "unloaded" and m.footprint()[1] and m.unload():
+                    actions.append(f"unload:{name}")
+        return actions
+
+    def sweep(self) -> list[str]:
+        """Apply idle timeouts and budgets once. Returns the actions taken (for logs/tests)."""
+        with self._lock:
+            now = time.monotonic()
+            actions: list[str] = []
+            for name, m in self._lru():
+                if not m.last_used or m.residency == "unloaded":
+                    continue
+                idle = now - m.last_used
+                if self._cfg.idle_unload_s > 0 and idle >= self._cfg.idle_unload_s:
+                    if m.unload():
+                        actions.append(f"unload:{name}")
+                elif self._cfg.idle_offload_s > 0 and idle >= self._cfg.idle_offload_s:
+                    if m.residency == "device" and m.park():
+                        actions.append(f"park:{name}")
+            actions.extend(self._enforce_budgets())
+        for a in actions:
+            log.info("memory: %s", a)
+        return actions
+
+    def prepare(self, *names: str) -> list[str]:
+        """Load/unpark `names` ahead of use, evicting other models first if over budget."""
+        with self._lock:
+            actions: list[str] = []
+            wanted = tuple(n for n in names if n in self._models)
+            if self.gpu_budget_bytes:
+                incoming = sum(
+                    self._known_device_bytes.get(n, 0)
+                    for n in wanted
+                    if self._models[n].residency != "device"
+                )
+                for name, m in self._lru(wanted):
+                    used = sum(u.device_bytes for u in self.usage())
+                    if used + incoming <= self.gpu_budget_bytes:
+                        break
+                    if m.residency == "device" and m.park():
+                        actions.append(f"park:{name}")
+            for name in wanted:
+                try:
+                    self._models[name].warm()
+                    actions.append(f"warm:{name}")
+                except Exception as e:
+                    log.warning("memory: failed to warm %s: %s", name, e)
+            actions.extend(self._enforce_budgets(protect=wanted))
+        for a in actions:
+            log.info("memory: %s", a)
+        return actions
+
+    async def run(self, interval_s: Optional[float] = None) -> None:
+        """Background sweep loop; runs the (possibly blocking) sweep in a worker thread."""
+        interval = float(interval_s or self._cfg.memory_sweep_interval_s)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                log.warning("memory: sweep failed: %s", e)
+
+
+def _accelerator_info() -> dict[str, Any]:
+    # Only report what is already initialized; never import torch / init CUDA just for stats.
+    import sys
+
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return {}
+    try:
+        if torch.cuda.is_available() and torch.cuda.is_initialized():
+            free, total = torch.cuda.mem_get_info()
+            return {
+                "cuda_free_bytes": int(free),
+                "cuda_total_bytes": int(total),
+                "cuda_allocated_bytes": int(torch.cuda.memory_allocated()),
+                "cuda_reserved_bytes": int(torch.cuda.memory_reserved()),
+            }
+    except Exception:
+        pass
+    return {}
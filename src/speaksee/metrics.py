@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import abc
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+
+# Seconds, from a fast partial decode up to a CPU-only image.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# STT real-time factor: processing time / audio duration (< 1 = faster than real time).
+RTF_BUCKETS = (0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 4.0)
+
+LabelValues = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, object]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    @abc.abstractmethod
+    def _samples(self) -> list[str]: ...
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels_text(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_labels_text(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        # Per label set: [count per bucket (non-cumulative) ..., +Inf], sum
+        self._counts: dict[LabelValues, list[int]] = {}
+        self._sums: dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        i = 0
+        while i < len(self.buckets) and value > self.buckets[i]:
+            i += 1
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[i] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def count(self, **labels: object) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((k, list(c), self._sums[k]) for k, c in self._counts.items())
+        out: list[str] = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = _labels_text(self.labelnames, key, f'le="{_fmt(bound)}"')
+                out.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _labels_text(self.labelnames, key)
+            out.append(f"{self.name}_sum{labels} {_fmt(total)}")
+            out.append(f"{self.name}_count{labels} {cumulative}")
+        return out
+
+
+class Registry:
+    """Process-wide metrics, rendered in the Prometheus text exposition format (version 0.0.4)."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labelnames))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))  # type: ignore[return-value]
+
+    def on_collect(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """Run `fn` before every render, to refresh gauges that mirror current state."""
+        self._collectors.append(fn)
+        return fn
+
+    def remove_collector(self, fn: Callable[[], None]) -> None:
+        try:
+            self._collectors.remove(fn)
+        except ValueError:
+            pass
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self, *, only: Optional[Iterable[str]] = None, skip: Iterable[str] = ()) -> str:
+        """Text exposition of every metric, or just those named in `only`, minus `skip`."""
+        for fn in list(self._collectors):
+            try:
+                fn()
+            except Exception:
+                pass
+        wanted = set(only) if only is not None else None
+        skipped = set(skip)
+        return "\n".join(
+            m.render()
+            for name, m in self._metrics.items()
+            if (wanted is None or name in wanted) and name not in skipped
+        ) + "\n"
+
+
+REGISTRY = Registry()
+
+# --- speaksee metrics ------------------------------------------------------------------------
+
+STT_SECONDS = REGISTRY.histogram(
+    "speaksee_stt_seconds", "Speech-to-text decode time (excluding lock wait).", ("kind",)
+)
+STT_RTF = REGISTRY.histogram(
+    "speaksee_stt_realtime_factor", "Decode time divided by audio duration.", ("kind",), RTF_BUCKETS
+)
+AUDIO_RECEIVED_BYTES = REGISTRY.counter(
+    "speaksee_audio_received_bytes_total", "Audio payload bytes received from clients.", ("format",)
+)
+GEN_QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "speaksee_generation_queue_wait_seconds", "Time a generation waited for the shared pipeline."
+)
+GEN_SECONDS = REGISTRY.histogram(
+    "speaksee_generation_seconds", "Pipeline time per image.", ("mode", "device")
+)
+GEN_STEP_SECONDS = REGISTRY.histogram(
+    "speaksee_generation_step_seconds", "Pipeline time per denoising step.", ("mode", "device")
+)
+GENERATIONS = REGISTRY.counter(
+    "speaksee_generations_total", "Generations by quality mode and outcome.", ("quality", "outcome")
+)
+IMAGE_ENCODE_SECONDS = REGISTRY.histogram(
+    "speaksee_image_encode_seconds", "Image encode (and write) time.", ("kind",)
+)
+GALLERY_LIST_SECONDS = REGISTRY.histogram("speaksee_gallery_list_seconds", "list_gallery() time.")
+GALLERY_BYTES = REGISTRY.gauge("speaksee_gallery_bytes", "Size of the gallery as of the last cleanup pass.")
+ACTIVE_SESSIONS = REGISTRY.gauge("speaksee_active_sessions", "Open WebSocket sessions.")
+MODEL_LOAD_SECONDS = REGISTRY.histogram(
+    "speaksee_model_load_seconds", "Model load time.", ("model",)
+)
+DEVICE_INFO = REGISTRY.gauge(
+    "speaksee_device_info", "Device each loaded model runs on (value is always 1).", ("model", "device")
+)
+GEN_WORKERS_BUSY = REGISTRY.gauge(
+    "speaksee_generation_worker_busy", "Generations in flight per connected speaksee-worker.", ("worker", "device")
+)
+WS_DROPPED = REGISTRY.counter(
+    "speaksee_ws_messages_dropped_total", "Outbound messages not sent to a slow client.", ("reason",)
+)
+
+# Recorded where the models run: by the model server process when there is one (see model_server).
+MODEL_METRICS = tuple(
+    m.name
+    for m in (
+        STT_SECONDS,
+        STT_RTF,
+        GEN_QUEUE_WAIT_SECONDS,
+        GEN_SECONDS,
+        GEN_STEP_SECONDS,
+        MODEL_LOAD_SECONDS,
+        GEN_WORKERS_BUSY,
+    )
+)
@@ -0,0 +1,612 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import itertools
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from multiprocessing import AuthenticationError, resource_tracker, shared_memory
+from multiprocessing.connection import Client, Connection, Listener
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from PIL import Image
+
+from .config import Config, load_config
+from .image_models import UnknownModel
+from .image_sd import GenerationCancelled, ImageGenResult
+from .metrics import MODEL_METRICS, REGISTRY
+from .profiling import Profiler, ProfilerBusy
+from .stt_whisper import SttResult
+from .tracing import TRACER, current_trace, set_trace
+
+
+log = logging.getLogger(__name__)
+
+# Errors that cross the process boundary as themselves; anything else arrives as RuntimeError.
+_ERRORS: dict[str, type[Exception]] = {
+    "GenerationCancelled": GenerationCancelled,
+    "UnknownModel": UnknownModel,
+    "ProfilerBusy": ProfilerBusy,
+    "ValueError": ValueError,
+}
+
+
+def default_address(cfg: Config) -> str:
+    path = cfg.data_dir / "run" / "models.sock"
+    if len(str(path)) > 100:  # sun_path is ~104 bytes on macOS
+        digest = hashlib.sha1(str(cfg.data_dir).encode("utf-8")).hexdigest()[:10]
+        path = Path(tempfile.gettempdir()) / f"speaksee-{digest}.sock"
+    return str(path)
+
+
+def check_platform() -> None:
+    """The model server listens on a Unix domain socket, which `multiprocessing` lacks on Windows."""
+    if sys.platform == "win32":
+        raise SystemExit(
+            "SPEAKSEE_WEB_WORKERS > 1 and SPEAKSEE_MODEL_SERVER need Unix domain sockets, which are not "
+            "available on Windows: run a single web worker (SPEAKSEE_WEB_WORKERS=1)"
+        )
+
+
+def _key_path(address: str) -> Path:
+    return Path(address + ".key")
+
+
+# --- shared memory -----------------------------------------------------------------------------
+# Audio and images travel as shared memory segments; only their names go over the socket. The
+# sender creates a segment, the receiver copies it out and unlinks it. When the exchange fails
+# before that (error reply, lost connection), the sender unlinks it (`_drop_shm`).
+
+
+def _put_shm(data: bytes) -> Optional[tuple[str, int]]:
+    if not data:
+        return None
+    shm = shared_memory.SharedMemory(create=True, size=len(data))
+    try:
+        shm.buf[: len(data)] = data
+    finally:
+        shm.close()
+    # The receiver owns it now: don't let this process's resource tracker unlink it at exit.
+    resource_tracker.unregister(getattr(shm, "_name", shm.name), "shared_memory")
+    return shm.name, len(data)
+
+
+def _take_shm(ref: Optional[tuple[str, int]]) -> bytes:
+    if ref is None:
+        return b""
+    name, size = ref
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(shm.buf[:size])
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _drop_shm(ref: Optional[tuple[str, int]]) -> None:
+    if ref is None:
+        return
+    try:
+        shm = shared_memory.SharedMemory(name=ref[0])
+    except FileNotFoundError:
+        return  # the receiver took it
+    shm.close()
+    shm.unlink()
+
+
+def _put_image(image: Optional[Image.Image]) -> Optional[dict[str, Any]]:
+    if image is None:
+        return None
+    return {"mode": image.mode, "size": image.size, "shm": _put_shm(image.tobytes())}
+
+
+def _take_image(ref: Optional[dict[str, Any]]) -> Optional[Image.Image]:
+    if ref is None:
+        return None
+    return Image.frombytes(ref["mode"], tuple(ref["size"]), _take_shm(ref["shm"]))
+
+
+def _drop_image(ref: Optional[dict[str, Any]]) -> None:
+    if ref is not None:
+        _drop_shm(ref["shm"])
+
+
+# --- server ------------------------------------------------------------------------------------
+
+
+class ModelServer:
+    """
+    Owns the one resident copy of the models (STT, image pipelines, memory manager, profiler) and
+    serves any number of web workers over a local socket (see `ModelClient`). Each request runs
+    in a worker thread; the models serialize themselves exactly as they do in-process.
+    """
+
+    def __init__(
+        self,
+        cfg: Config,
+        *,
+        stt: Any = None,
+        gen: Any = None,
+        memory: Any = None,
+        profiler: Optional[Profiler] = None,
+    ):
+        self._cfg = cfg
+        if stt is None or gen is None or memory is None:
+            from .memory import MemoryManager
+            from .runtime import create_image_models
+            from .stt_whisper import SpeechToText
+
+            stt = stt or SpeechToText(cfg)
+            gen = gen or create_image_models(cfg)
+            if memory is None:
+                memory = MemoryManager(cfg)
+                memory.register("stt", stt)
+                memory.register("sd", gen)
+        self.stt = stt
+        self.gen = gen
+        self.memory = memory
+        self.profiler = profiler or Profiler(cfg)
+        self._pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="model-server")
+        self._running: set[tuple[int, int]] = set()  # (connection, request) in flight
+        self._cancelled: set[tuple[int, int]] = set()
+        self._listener: Optional[Listener] = None
+        self._closed = threading.Event()
+
+    # Methods callable by clients; arguments and return values are plain (picklable) data.
+    def _methods(self) -> dict[str, Callable[..., Any]]:
+        return {
+            "ping": lambda: "pong",
+            "stt.transcribe_final": self._transcribe("final"),
+            "stt.transcribe_partial": self._transcribe("partial"),
+            "stt.loaded_device": lambda: self.stt.loaded_device,
+            "gen.generate": self._generate,
+            "gen.status": self._gen_status,
+            "gen.devices": lambda: self.gen.devices(),
+            "memory.prepare": lambda *names: self.memory.prepare(*names),
+            "memory.snapshot": lambda: self.memory.snapshot(),
+            "profiler.arm": lambda **kw: self.profiler.arm(**kw),
+            "profiler.status": lambda: self.profiler.status(),
+            "metrics": lambda: REGISTRY.render(only=MODEL_METRICS),
+        }
+
+    def _transcribe(self, kind: str) -> Callable[..., Any]:
+        def run(audio: Optional[tuple[str, int]], sample_rate: int) -> str:
+            pcm16 = _take_shm(audio)
+            fn = self.stt.transcribe_final if kind == "final" else self.stt.transcribe_partial
+            return self.profiler.wrap("stt", fn)(pcm16, sample_rate).text
+
+        return run
+
+    def _gen_status(self) -> dict[str, Any]:
+        return {
+            "device": self.gen.device,
+            "memory_mode": self.gen.memory_mode,
+            "last_recovery": tuple(self.gen.last_recovery),
+        }
+
+    def _generate(self, *, _progress: Callable[[int, int], None], _cancelled: Callable[[], bool], **kwargs: Any):
+        kwargs["init_image"] = _take_image(kwargs.get("init_image"))
+        result = self.profiler.wrap("generate", self.gen.generate)(
+            on_progress=_progress, should_cancel=_cancelled, **kwargs
+        )
+        status = self._gen_status()
+        return {
+            "image": _put_image(result.image),
+            "status": status,
+            "seed": result.seed,
+            "device": result.device,
+            "width": result.width,
+            "height": result.height,
+            "recovery": tuple(result.recovery),
+            "model_id": result.model_id,
+            "steps_run": result.steps_run,
+            "elapsed_s": result.elapsed_s,
+        }
+
+    def serve_forever(self, address: str) -> None:
+        Path(address).parent.mkdir(parents=True, exist_ok=True)
+        if os.path.exists(address):
+            os.unlink(address)  # stale socket from a previous run
+        authkey = secrets.token_bytes(32)
+        key_path = _key_path(address)
+        key_path.write_bytes(b"")
+        key_path.chmod(0o600)
+        key_path.write_bytes(authkey)
+        self._listener = Listener(address, family="AF_UNIX", authkey=authkey)
+        os.chmod(address, 0o600)
+        sweeper = threading.Thread(target=self._sweep_loop, name="memory-sweep", daemon=True)
+        sweeper.start()
+        log.info("model server listening on %s", address)
+        conn_ids = itertools.count()
+        try:
+            while not self._closed.is_set():
+                try:
+                    conn = self._listener.accept()
+                except OSError:
+                    if self._closed.is_set():
+                        break
+                    raise
+                except Exception as e:  # failed authentication
+                    log.warning("rejected model server connection: %s", e)
+                    continue
+                threading.Thread(
+                    target=self._serve_conn, args=(conn, next(conn_ids)), name="model-server-conn", daemon=True
+                ).start()
+        finally:
+            for p in (address, str(key_path)):
+                try:
+                    os.unlink(p)
+                except OSError:
+                    pass
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._listener is not None:
+            self._listener.close()
+
+    def _sweep_loop(self) -> None:
+        while not self._closed.wait(self._cfg.memory_sweep_interval_s):
+            try:
+                self.memory.sweep()
+            except Exception:
+                log.exception("memory sweep failed")
+
+    def _serve_conn(self, conn: Connection, conn_id: int) -> None:
+        send_lock = threading.Lock()
+        methods = self._methods()
+
+        def send(msg: tuple[Any, ...]) -> bool:
+            with send_lock:
+                try:
+                    conn.send(msg)
+                    return True
+                except (OSError, EOFError):
+                    return False  # client went away; its pending replies are moot
+
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            if msg[0] == "cancel":
+                if (conn_id, msg[1]) in self._running:
+                    self._cancelled.add((conn_id, msg[1]))
+                continue
+            _, req_id, method, args, kwargs, trace_id = msg
+            self._pool.submit(self._call, send, conn_id, req_id, methods.get(method), method, args, kwargs, trace_id)
+        conn.close()
+
+    def _call(
+        self,
+        send: Callable[[tuple[Any, ...]], bool],
+        conn_id: int,
+        req_id: int,
+        fn: Optional[Callable[..., Any]],
+        method: str,
+        args: tuple[Any, ...],
+        kwargs: dict[str, Any],
+        trace_id: Optional[str],
+    ) -> None:
+        set_trace(trace_id)
+        t0 = time.perf_counter()
+        self._running.add((conn_id, req_id))
+        if method == "gen.generate":
+            kwargs = {
+                **kwargs,
+                "_progress": lambda step, total: send(("progress", req_id, step, total)),
+                "_cancelled": lambda: (conn_id, req_id) in self._cancelled,
+            }
+        try:
+            if fn is None:
+                raise ValueError(f"unknown method {method}")
+            value = fn(*args, **kwargs)
+            reply: tuple[Any, ...] = ("ok", req_id, value)
+        except Exception as e:
+            if type(e).__name__ not in _ERRORS:
+                log.exception("%s failed", method)
+            reply = ("err", req_id, type(e).__name__, str(e))
+        finally:
+            self._running.discard((conn_id, req_id))
+            self._cancelled.discard((conn_id, req_id))
+        spans = TRACER.export(trace_id, since=t0) if trace_id else []
+        if not send(reply + (spans,)) and reply[0] == "ok" and method == "gen.generate":
+            _drop_image(reply[2]["image"])  # nobody will take it
+
+
+# --- client ------------------------------------------------------------------------------------
+
+
+class ModelClient:
+    """
+    One web worker's connection to the model server. Thread-safe: calls block the calling thread
+    (run them via asyncio.to_thread, like the in-process models) and replies are routed back by id.
+    """
+
+    def __init__(self, address: str, *, connect_timeout_s: float = 30.0):
+        self.address = address
+        self._connect_timeout_s = connect_timeout_s
+        self._conn: Optional[Connection] = None
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending: dict[int, tuple[Future, Optional[Callable[[int, int], None]]]] = {}
+
+    def _connect(self) -> Connection:
+        with self._lock:
+            if self._conn is not None and not self._conn.closed:
+                return self._conn
+            deadline = time.monotonic() + self._connect_timeout_s
+            while True:
+                try:
+                    conn = Client(self.address, family="AF_UNIX", authkey=_key_path(self.address).read_bytes())
+                    break
+                except (OSError, EOFError, AuthenticationError):  # not up yet, or a stale key file
+                    if time.monotonic() > deadline:
+                        raise ConnectionError(f"model server not reachable at {self.address}") from None
+                    time.sleep(0.2)
+            self._conn = conn
+            threading.Thread(target=self._read_loop, args=(conn,), name="model-client", daemon=True).start()
+            return conn
+
+    def _read_loop(self, conn: Connection) -> None:
+        while True:
+            try:
+                msg = conn.recv()
+            except (EOFError, OSError):
+                break
+            kind, req_id = msg[0], msg[1]
+            entry = self._pending.get(req_id)
+            if entry is None:
+                continue
+            fut, on_progress = entry
+            if kind == "progress":
+                if on_progress is not None:
+                    try:
+                        on_progress(msg[2], msg[3])
+                    except Exception:
+                        pass
+                continue
+            self._pending.pop(req_id, None)
+            fut.set_result(msg)
+        # Connection lost: fail whatever was in flight; the next call reconnects.
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+        for req_id in list(self._pending):
+            fut, _ = self._pending.pop(req_id)
+            if not fut.done():
+                fut.set_exception(ConnectionError("model server connection lost"))
+
+    def call(
+        self,
+        method: str,
+        *args: Any,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        **kwargs: Any,
+    ) -> Any:
+        conn = self._connect()
+        req_id = next(self._ids)
+        fut: Future = Future()
+        self._pending[req_id] = (fut, on_progress)
+        trace_id = current_trace()
+        try:
+            with self._send_lock:
+                conn.send(("call", req_id, method, args, kwargs, trace_id))
+        except BaseException:  # e.g. unpicklable arguments, a broken connection
+            self._pending.pop(req_id, None)
+            raise
+        cancel_sent = False
+        while True:
+            try:
+                msg = fut.result(timeout=0.1 if should_cancel is not None else None)
+                break
+            except FutureTimeout:
+                if not cancel_sent and should_cancel is not None and should_cancel():
+                    with self._send_lock:
+                        conn.send(("cancel", req_id))
+                    cancel_sent = True
+        spans = msg[-1]
+        if spans and trace_id:
+            TRACER.merge(spans, trace_id=trace_id, thread_prefix="model-server/")
+        if msg[0] == "ok":
+            return msg[2]
+        raise _ERRORS.get(msg[2], RuntimeError)(msg[3])
+
+
+# --- runtime proxies: what server.py uses of SpeechToText / ImageModels / MemoryManager / Profiler
+
+
+class RemoteSpeechToText:
+    def __init__(self, client: ModelClient):
+        self._client = client
+
+    def _transcribe(self, method: str, pcm16: bytes, sample_rate: int) -> SttResult:
+        audio = _put_shm(pcm16)
+        try:
+            return SttResult(self._client.call(method, audio, sample_rate))
+        except BaseException:
+            _drop_shm(audio)
+            raise
+
+    def transcribe_final(self, pcm16: bytes, sample_rate: int) -> SttResult:
+        return self._transcribe("stt.transcribe_final", pcm16, sample_rate)
+
+    def transcribe_partial(self, pcm16: bytes, sample_rate: int) -> SttResult:
+        return self._transcribe("stt.transcribe_partial", pcm16, sample_rate)
+
+    @property
+    def loaded_device(self) -> Optional[str]:
+        return self._client.call("stt.loaded_device")
+
+
+_STATUS_TTL_S = 2.0
+
+
+class RemoteImageModels:
+    def __init__(self, cfg: Config, client: ModelClient):
+        self._cfg = cfg
+        self._client = client
+        # device / memory_mode / last_recovery: refreshed by each generation's reply, and fetched
+        # again when older than `_STATUS_TTL_S` (other web workers load, park and downgrade the
+        # shared models too), so most reads cost no round trip.
+        self._last_status: Optional[dict[str, Any]] = None
+        self._status_at = 0.0
+
+    @property
+    def model_ids(self) -> tuple[str, ...]:
+        return self._cfg.sd_model_ids
+
+    def resolve(self, model_id: Optional[str]) -> str:
+        model_id = (model_id or "").strip() or self._cfg.sd_model
+        if model_id not in self.model_ids:
+            raise UnknownModel(model_id)
+        return model_id
+
+    def generate(
+        self,
+        *,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        init_image: Optional[Image.Image] = None,
+        **kwargs: Any,
+    ) -> ImageGenResult:
+        if should_cancel is not None and should_cancel():
+            raise GenerationCancelled()
+        init_ref = _put_image(init_image)
+        try:
+            r = self._client.call(
+                "gen.generate",
+                on_progress=on_progress,
+                should_cancel=should_cancel,
+                init_image=init_ref,
+                **kwargs,
+            )
+        except BaseException:
+            _drop_image(init_ref)
+            raise
+        image = _take_image(r.pop("image"))
+        self._last_status, self._status_at = r.pop("status"), time.monotonic()
+        return ImageGenResult(image=image, **r)
+
+    def _status(self) -> dict[str, Any]:
+        status = self._last_status
+        if status is None or time.monotonic() - self._status_at > _STATUS_TTL_S:
+            status = self._last_status = self._client.call("gen.status")
+            self._status_at = time.monotonic()
+        return status
+
+    @property
+    def device(self) -> str:
+        return self._status()["device"]
+
+    @property
+    def memory_mode(self) -> str:
+        return self._status()["memory_mode"]
+
+    @property
+    def last_recovery(self) -> tuple[str, ...]:
+        return tuple(self._status()["last_recovery"])
+
+    def devices(self) -> dict[str, str]:
+        return self._client.call("gen.devices")
+
+
+class RemoteMemory:
+    """The model server sweeps its own memory; web workers only ask it to prepare / report."""
+
+    def __init__(self, client: ModelClient):
+        self._client = client
+
+    def prepare(self, *names: str) -> list[str]:
+        return self._client.call("memory.prepare", *names)
+
+    def snapshot(self) -> dict[str, Any]:
+        return self._client.call("memory.snapshot")
+
+    async def run(self, interval_s: Optional[float] = None) -> None:
+        return None
+
+
+class RemoteProfiler:
+    """
+    Generations and transcriptions are profiled inside the model server; event loop sampling
+    (`loop_s`) still profiles this web worker.
+    """
+
+    def __init__(self, cfg: Config, client: ModelClient):
+        self._client = client
+        self._local = Profiler(cfg)
+
+    def bind_event_loop(self) -> None:
+        self._local.bind_event_loop()
+
+    def wrap(self, kind: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+        return fn
+
+    def arm(self, *, generate: int = 0, stt: int = 0, loop_s: float = 0.0) -> dict[str, Any]:
+        if generate <= 0 and stt <= 0 and loop_s <= 0:
+            raise ValueError("nothing to profile: set generate, stt and/or loop_s")
+        out: dict[str, Any] = {}
+        if generate > 0 or stt > 0:
+            out["model_server"] = self._client.call("profiler.arm", generate=generate, stt=stt)
+        if loop_s > 0:
+            out.update(self._local.arm(loop_s=loop_s))
+        return out
+
+    def status(self) -> dict[str, Any]:
+        return {**self._local.status(), "model_server": self._client.call("profiler.status")}
+
+
+# --- process management ------------------------------------------------------------------------
+
+
+def spawn(cfg: Config, address: Optional[str] = None, *, timeout_s: float = 60.0) -> tuple[subprocess.Popen, str]:
+    """Start `speaksee-model-server` as a child process and wait until it accepts connections."""
+    address = address or default_address(cfg)
+    proc = subprocess.Popen([sys.executable, "-m", "speaksee.model_server", "--address", address])
+    try:
+        ModelClient(address, connect_timeout_s=timeout_s).call("ping")
+    except Exception:
+        proc.terminate()
+        raise
+    return proc, address
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="speaksee-model-server",
+        description="Hold the models in one process and serve speaksee web workers over a local socket.",
+    )
+    parser.add_argument("--address", help="Unix socket path (default: data/run/models.sock)")
+    args = parser.parse_args(argv)
+    check_platform()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    cfg = load_config()
+    os.environ.setdefault("HF_HUB_DISABLE_TELEMETRY", "1")
+    os.environ.setdefault("HF_HUB_DISABLE_PROGRESS_BARS", "1")
+    os.environ.setdefault("HF_HOME", str(cfg.hf_home))
+    TRACER.configure(cfg)
+    # Stopped with SIGTERM by `speaksee.server.main`: unwind so the socket and key file go away.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    server = ModelServer(cfg)
+    try:
+        server.serve_forever(args.address or default_address(cfg))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
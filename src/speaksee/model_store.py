@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Literal, Optional
+
+from .config import Config, load_config
+
+
+log = logging.getLogger(__name__)
+
+ModelKind = Literal["sd", "stt"]
+
+MANIFEST_NAME = "speaksee-models.json"
+_MANIFEST_VERSION = 1
+
+# HF cache snapshot files are symlinks to blobs named after their content hash (sha256 for LFS files).
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+_write_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ModelEntry:
+    """A model snapshot that loaded successfully, and the options it loaded with."""
+
+    kind: ModelKind
+    model_id: str
+    path: str  # resolved local snapshot directory
+    variant: str = ""  # "fp16" or "" (diffusers weight variant)
+    dtype: str = ""  # e.g. "torch.float16" (sd) / compute type "int8" (stt)
+    device: str = ""
+    files: dict[str, int] = field(default_factory=dict)  # relative path -> size in bytes
+    resolved_at: float = 0.0
+
+    @property
+    def key(self) -> str:
+        return f"{self.kind}:{self.model_id}"
+
+
+def _snapshot_files(root: Path) -> Iterator[Path]:
+    for dirpath, _dirnames, filenames in os.walk(root, followlinks=True):
+        for name in filenames:
+            if not name.startswith("."):
+                yield Path(dirpath) / name
+
+
+def _file_sizes(root: Path) -> dict[str, int]:
+    return {f.relative_to(root).as_posix(): f.stat().st_size for f in sorted(_snapshot_files(root))}
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ModelStore:
+    """
+    Manifest of resolved model snapshots (`<HF_HOME>/speaksee-models.json`).
+
+    Loaders record the exact local path, variant and dtype that worked; later starts load straight
+    from that directory, without hub lookups or trial-and-error attempts. Entries whose directory has
+    gone (cache cleared) are ignored, and loaders fall back to resolving the model again.
+    """
+
+    def __init__(self, cfg: Config, path: Optional[Path] = None):
+        self._cfg = cfg
+        self.path = Path(path or Path(cfg.hf_home) / MANIFEST_NAME)
+
+    def _read(self) -> dict[str, dict[str, Any]]:
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            log.warning("ignoring unreadable model manifest %s: %s", self.path, e)
+            return {}
+        if not isinstance(data, dict) or data.get("version") != _MANIFEST_VERSION:
+            return {}
+        models = data.get("models")
+        return models if isinstance(models, dict) else {}
+
+    def _write(self, models: dict[str, dict[str, Any]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(
+            json.dumps({"version": _MANIFEST_VERSION, "models": models}, indent=2, sort_keys=True),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
+
+    def entries(self) -> list[ModelEntry]:
+        out: list[ModelEntry] = []
+        for raw in self._read().values():
+            try:
+                out.append(ModelEntry(**raw))
+            except TypeError:
+                continue
+        return out
+
+    def get(self, kind: ModelKind, model_id: str) -> Optional[ModelEntry]:
+        raw = self._read().get(f"{kind}:{model_id}")
+        if raw is None:
+            return None
+        try:
+            entry = ModelEntry(**raw)
+        except TypeError:
+            return None
+        return entry if Path(entry.path).is_dir() else None
+
+    def record(
+        self,
+        kind: ModelKind,
+        model_id: str,
+        path: Path | str,
+        *,
+        variant: str = "",
+        dtype: str = "",
+        device: str = "",
+    ) -> ModelEntry:
+        root = Path(path)
+        entry = ModelEntry(
+            kind=kind,
+            model_id=model_id,
+            path=str(root.resolve()),
+            variant=variant,
+            dtype=dtype,
+            device=device,
+            files=_file_sizes(root),
+            resolved_at=round(time.time(), 3),
+        )
+        raw = asdict(entry)
+        with _write_lock:
+            models = self._read()
+            old = dict(models.get(entry.key) or {})
+            old.pop("resolved_at", None)
+            if old == {k: v for k, v in raw.items() if k != "resolved_at"}:
+                return entry  # unchanged; don't rewrite on every start
+            models[entry.key] = raw
+            self._write(models)
+        return entry
+
+    def forget(self, kind: ModelKind, model_id: str) -> None:
+        with _write_lock:
+            models = self._read()
+            if models.pop(f"{kind}:{model_id}", None) is not None:
+                self._write(models)
+
+    def verify(self, entry: ModelEntry, *, deep: bool = False) -> list[str]:
+        """
+        Problems with a recorded snapshot (missing / resized files). `deep` also re-hashes files
+        whose cache blob name is a sha256, which catches corrupted downloads.
+        """
+        root = Path(entry.path)
+        if not root.is_dir():
+            return [f"missing directory {root}"]
+        problems: list[str] = []
+        for rel, size in entry.files.items():
+            f = root / rel
+            if not f.is_file():
+                problems.append(f"missing {rel}")
+                continue
+            if f.stat().st_size != size:
+                problems.append(f"size mismatch {rel}: {f.stat().st_size} != {size}")
+                continue
+            if deep and f.is_symlink():
+                blob = f.resolve().name
+                if _SHA256_RE.match(blob) and _sha256(f) != blob:
+                    problems.append(f"checksum mismatch {rel}")
+        return problems
+
+
+# --- speaksee-models CLI -------------------------------------------------------------------------
+
+
+def _cmd_prefetch(cfg: Config, store: ModelStore, args: argparse.Namespace) -> int:
+    wanted: list[tuple[ModelKind, str]] = []
+    if args.kind in ("all", "sd"):
+        wanted.extend(("sd", m) for m in cfg.sd_model_ids)
+    if args.kind in ("all", "stt"):
+        wanted.append(("stt", cfg.whisper_model))
+    failed = 0
+    for kind, model_id in wanted:
+        try:
+            if kind == "sd":
+                from .image_sd import ImageGenerator
+
+                entry = ImageGenerator(cfg, model_id, store=store).prefetch()
+            else:
+                from .stt_whisper import SpeechToText
+
+                entry = SpeechToText(cfg, store=store).prefetch()
+        except Exception as e:
+            failed += 1
+            print(f"FAIL  {kind:<3} {model_id}: {e}")
+            continue
+        size_mb = sum(entry.files.values()) / (1024 * 1024)
+        print(f"ok    {kind:<3} {model_id} -> {entry.path} ({size_mb:.0f} MB)")
+    return 1 if failed else 0
+
+
+def _cmd_verify(cfg: Config, store: ModelStore, args: argparse.Namespace) -> int:
+    entries = store.entries()
+    if not entries:
+        print(f"No models recorded in {store.path}; run `speaksee-models prefetch` first.")
+        return 1
+    recorded = {e.key for e in entries}
+    failed = 0
+    for entry in entries:
+        problems = store.verify(entry, deep=args.deep)
+        if problems:
+            failed += 1
+            print(f"FAIL  {entry.kind:<3} {entry.model_id}: " + "; ".join(problems[:5]))
+        else:
+            print(f"ok    {entry.kind:<3} {entry.model_id} ({len(entry.files)} files)")
+    configured = [f"sd:{m}" for m in cfg.sd_model_ids] + [f"stt:{cfg.whisper_model}"]
+    for key in configured:
+        if key not in recorded:
+            failed += 1
+            print(f"MISS  {key.replace(':', ' ', 1)} (configured but not prefetched)")
+    return 1 if failed else 0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="speaksee-models", description="Download and check the models speaksee loads."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("prefetch", help="download the configured models and record their snapshots")
+    p.add_argument("--kind", choices=("all", "sd", "stt"), default="all")
+    v = sub.add_parser("verify", help="check that recorded snapshots are complete")
+    v.add_argument("--deep", action="store_true", help="also re-hash weight files (slow)")
+    args = parser.parse_args(argv)
+
+    cfg = load_config()
+    os.environ.setdefault("HF_HUB_DISABLE_TELEMETRY", "1")
+    os.environ.setdefault("HF_HOME", str(cfg.hf_home))
+    store = ModelStore(cfg)
+    if args.command == "prefetch":
+        return _cmd_prefetch(cfg, store, args)
+    return _cmd_verify(cfg, store, args)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
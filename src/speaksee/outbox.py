@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Optional
+
+from .ws_protocol import dumps
+
+
+log = logging.getLogger(__name__)
+
+# Only the newest of these matters: a queued one is replaced in place by its successor.
+COALESCED_TYPES = frozenset({"gen_progress", "transcript_partial"})
+# The client's current state: a queued one is dropped when its successor is enqueued (at the back),
+# so the newest always arrives. Never dropped for backpressure.
+STATE_TYPES = frozenset({"status", "gallery", "models"})
+# Never dropped for backpressure, and sent ahead of droppable messages queued before them.
+CRITICAL_TYPES = frozenset({"gen_result", "transcript_final", "error", "saved", "gen_started"})
+# Enqueuing the key type makes queued messages of the value types obsolete.
+_SUPERSEDES = {
+    "gen_result": frozenset({"gen_progress"}),
+    "transcript_final": frozenset({"transcript_partial"}),
+}
+
+# WebSocket close code 1013: "try again later".
+CLOSE_TOO_SLOW = 1013
+
+
+class _Entry:
+    __slots__ = ("msg",)
+
+    def __init__(self, msg: dict[str, Any]):
+        self.msg = msg  # replaced in place when coalesced
+
+
+def _droppable(entry: _Entry) -> bool:
+    mtype = str(entry.msg.get("type") or "")
+    return mtype not in CRITICAL_TYPES and mtype not in STATE_TYPES
+
+
+class Outbox:
+    """
+    Per-connection writer: handlers enqueue without waiting on the socket, one task sends in order.
+
+    - `gen_progress` / `transcript_partial` are coalesced: while one is still queued, a newer one
+      replaces it in place (messages enqueued after it are never overtaken).
+    - `status` / `gallery` / `models` are state: a newer one replaces any queued one of its type.
+    - A result drops the progress still queued for it. Results, errors and the other critical
+      messages overtake the droppable ones (progress, partials, previews, speech) at the back of
+      the queue, but never each other or a state message.
+    - Past `max_queue` pending messages, droppable ones are shed (progress first); critical and
+      state messages never are. A client still that far behind, or one whose socket write takes
+      longer than `send_timeout_s`, is disconnected.
+    """
+
+    def __init__(
+        self,
+        ws: Any,
+        *,
+        max_queue: int = 256,
+        send_timeout_s: float = 10.0,
+        on_sent: Optional[Callable[[str], None]] = None,
+    ):
+        self._ws = ws
+        self._on_sent = on_sent  # e.g. a session recorder; gets each message as it goes out
+        self._max_queue = max(8, int(max_queue))
+        self._send_timeout_s = float(send_timeout_s)
+        self._queue: deque[_Entry] = deque()
+        self._pending: dict[str, _Entry] = {}  # coalesced type -> its queued entry
+        self._latest: dict[str, _Entry] = {}  # state type -> its queued entry
+        self._wakeup = asyncio.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        self.closed = False
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def send(self, msg: dict[str, Any]) -> None:
+        """Enqueue from the event loop thread. Never blocks."""
+        if self.closed:
+            return
+        mtype = str(msg.get("type") or "")
+        if mtype in COALESCED_TYPES:
+            entry = self._pending.get(mtype)
+            if entry is not None:
+                entry.msg = msg
+                self.coalesced += 1
+                return
+        for obsolete in _SUPERSEDES.get(mtype, ()):
+            entry = self._pending.pop(obsolete, None)
+            if entry is not None:
+                self._queue.remove(entry)
+                self.coalesced += 1
+        if mtype in STATE_TYPES:
+            entry = self._latest.pop(mtype, None)
+            if entry is not None:
+                self._queue.remove(entry)
+                self.coalesced += 1
+        entry = _Entry(msg)
+        if mtype in CRITICAL_TYPES:
+            at = len(self._queue)
+            while at and _droppable(self._queue[at - 1]):
+                at -= 1
+            self._queue.insert(at, entry)
+        else:
+            self._queue.append(entry)
+        if mtype in STATE_TYPES:
+            self._latest[mtype] = entry
+        if mtype in COALESCED_TYPES:
+            self._pending[mtype] = entry
+        else:
+            # Seal: a later progress/partial must not jump ahead of this message.
+            self._pending.clear()
+        if len(self._queue) > self._max_queue:
+            self._shed()
+        self._wakeup.set()
+
+    def send_threadsafe(self, msg: dict[str, Any]) -> None:
+        """Enqueue from a worker thread (e.g. a generation progress callback)."""
+        if self._loop is None or self.closed:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self.send, msg)
+        except RuntimeError:
+            pass  # loop closed
+
+    def _shed(self) -> None:
+        for droppable in (COALESCED_TYPES, None):
+            for entry in list(self._queue):
+                if len(self._queue) <= self._max_queue:
+                    return
+                mtype = str(entry.msg.get("type") or "")
+                if not _droppable(entry) or (droppable is not None and mtype not in droppable):
+                    continue
+                self._queue.remove(entry)
+                if self._pending.get(mtype) is entry:
+                    del self._pending[mtype]
+                self.dropped += 1
+        if len(self._queue) > self._max_queue:
+            log.warning("client too far behind (%d queued messages); disconnecting", len(self._queue))
+            self._abort()
+
+    def _abort(self) -> None:
+        self.closed = True
+        self._queue.clear()
+        self._pending.clear()
+        self._latest.clear()
+        self._wakeup.set()
+        if self._loop is not None:
+            self._loop.create_task(self._close_socket())
+
+    async def _close_socket(self) -> None:
+        try:
+            await self._ws.close(code=CLOSE_TOO_SLOW)
+        except Exception:
+            pass
+
+    async def _run(self) -> None:
+        while not self.closed:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            entry = self._queue.popleft()
+            mtype = str(entry.msg.get("type") or "")
+            if self._pending.get(mtype) is entry:
+                del self._pending[mtype]
+            if self._latest.get(mtype) is entry:
+                del self._latest[mtype]
+            text = dumps(entry.msg)
+            if self._on_sent is not None:
+                self._on_sent(text)
+            try:
+                await asyncio.wait_for(self._ws.send_text(text), self._send_timeout_s)
+            except asyncio.TimeoutError:
+                log.warning("client send timed out after %.1fs; disconnecting", self._send_timeout_s)
+                self._abort()
+                return
+            except Exception:
+                # Socket gone; the receive loop notices the disconnect.
+                self.closed = True
+                return
+            self.sent += 1
+
+    async def close(self) -> None:
+        self.closed = True
+        self._wakeup.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
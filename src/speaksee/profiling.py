@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import cProfile
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Literal, Optional, TypeVar
+
+from .config import Config
+
+
+log = logging.getLogger(__name__)
+
+ProfileKind = Literal["generate", "stt"]
+PROFILE_KINDS: tuple[ProfileKind, ...] = ("generate", "stt")
+
+MAX_CAPTURES = 20
+MAX_LOOP_S = 120.0
+_LOOP_INTERVAL_S = 0.005
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+@dataclass
+class _Capture:
+    capture_id: str
+    out_dir: Path
+    remaining: dict[str, int]
+    artifacts: list[str] = field(default_factory=list)
+    runs: list[dict[str, Any]] = field(default_factory=list)
+    started_at: float = field(default_factory=time.time)
+    loop_thread: Optional[threading.Thread] = None
+
+    @property
+    def done(self) -> bool:
+        return not any(self.remaining.values()) and (self.loop_thread is None or not self.loop_thread.is_alive())
+
+
+class Profiler:
+    """
+    On-demand profiling of the hot paths of a running server.
+
+    `arm()` marks the next N generations and/or transcriptions; each one then runs under cProfile
+    (Python time, `.pstats`) and, for generations, `torch.profiler` (operator-level CPU/GPU time
+    and memory: a Chrome trace plus a `key_averages` table). Optionally the event loop thread is
+    sampled for a while into a folded-stack file (speedscope / flamegraph.pl). Artifacts and a
+    summary (`<capture id>.json`) go to `data/logs/profiles/`. While nothing is armed, `wrap()`
+    returns the function itself: no overhead.
+    """
+
+    def __init__(self, cfg: Config):
+        self._cfg = cfg
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()  # held while a call runs under the profilers
+        self._capture: Optional[_Capture] = None
+        self._loop_thread_id: Optional[int] = None
+
+    @property
+    def out_dir(self) -> Path:
+        return self._cfg.data_dir / "logs" / "profiles"
+
+    def bind_event_loop(self) -> None:
+        """Call from the event loop thread so `arm(loop_s=...)` knows which thread to sample."""
+        self._loop_thread_id = threading.get_ident()
+
+    def arm(self, *, generate: int = 0, stt: int = 0, loop_s: float = 0.0) -> dict[str, Any]:
+        counts = {
+            "generate": min(MAX_CAPTURES, max(0, int(generate))),
+            "stt": min(MAX_CAPTURES, max(0, int(stt))),
+        }
+        loop_s = min(MAX_LOOP_S, max(0.0, float(loop_s)))
+        if not any(counts.values()) and not loop_s:
+            raise ValueError("Nothing to capture.")
+        with self._lock:
+            if self._capture is not None and not self._capture.done:
+                raise ProfilerBusy(f"Capture {self._capture.capture_id} still running.")
+            self.out_dir.mkdir(parents=True, exist_ok=True)
+            capture_id = base = time.strftime("%Y%m%d-%H%M%S")
+            n = 1
+            while (self.out_dir / f"{capture_id}.json").exists():
+                n += 1
+                capture_id = f"{base}-{n}"
+            cap = _Capture(capture_id, self.out_dir, counts)
+            self._capture = cap
+            if loop_s and self._loop_thread_id is not None:
+                cap.loop_thread = threading.Thread(
+                    target=self._sample_loop, args=(cap, self._loop_thread_id, loop_s),
+                    name="speaksee-loop-sampler", daemon=True,
+                )
+                cap.loop_thread.start()
+        self._write_summary(cap)
+        log.info("profiler armed: %s (loop %.0fs) -> %s", counts, loop_s, self.out_dir)
+        return self.status()
+
+    def status(self) -> dict[str, Any]:
+        cap = self._capture
+        if cap is None:
+            return {"active": False}
+        return {
+            "active": not cap.done,
+            "capture_id": cap.capture_id,
+            "remaining": dict(cap.remaining),
+            "sampling_event_loop": cap.loop_thread is not None and cap.loop_thread.is_alive(),
+            "dir": str(cap.out_dir),
+            "artifacts": list(cap.artifacts),
+            "runs": list(cap.runs),
+        }
+
+    def wrap(self, kind: ProfileKind, fn: F) -> F:
+        """`fn`, profiled if a capture of `kind` is armed. Call right before running it."""
+        cap = self._capture
+        if cap is None or not cap.remaining.get(kind):
+            return fn
+        with self._lock:
+            if not cap.remaining.get(kind):
+                return fn
+            cap.remaining[kind] -= 1
+            n = sum(1 for r in cap.runs if r["kind"] == kind) + 1
+            run: dict[str, Any] = {"kind": kind, "n": n, "name": getattr(fn, "__name__", kind)}
+            cap.runs.append(run)
+
+        def profiled(*args: Any, **kwargs: Any) -> Any:
+            return self._run(cap, run, fn, args, kwargs)
+
+        return profiled  # type: ignore[return-value]
+
+    # --- capture ------------------------------------------------------------------------------
+
+    def _run(self, cap: _Capture, run: dict[str, Any], fn: Callable[..., Any], args: Any, kwargs: Any) -> Any:
+        # One capture at a time: Python 3.12+ refuses a second active cProfile (sys.monitoring), and
+        # a failing profiler must never fail the request itself. Overlapping calls run unprofiled.
+        if not self._run_lock.acquire(blocking=False):
+            return self._unprofiled(cap, run, "another call was being profiled", fn, args, kwargs)
+        try:
+            py_prof = cProfile.Profile()
+            try:
+                py_prof.enable()
+            except ValueError as e:  # another profiling tool is active
+                return self._unprofiled(cap, run, str(e), fn, args, kwargs)
+            py_prof.disable()
+            return self._profiled(cap, run, py_prof, fn, args, kwargs)
+        finally:
+            self._run_lock.release()
+
+    def _unprofiled(
+        self, cap: _Capture, run: dict[str, Any], reason: str, fn: Callable[..., Any], args: Any, kwargs: Any
+    ) -> Any:
+        run["skipped"] = reason
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._write_summary(cap)
+
+    def _profiled(
+        self, cap: _Capture, run: dict[str, Any], py_prof: cProfile.Profile, fn: Callable[..., Any], args: Any, kwargs: Any
+    ) -> Any:
+        # Setup and teardown are guarded step by step: only `fn` itself may raise from here.
+        torch_prof = None
+        cuda = False
+        try:
+            torch = sys.modules.get("torch")
+            cuda = torch is not None and torch.cuda.is_available() and torch.cuda.is_initialized()
+            if cuda:
+                torch.cuda.reset_peak_memory_stats()
+            if run["kind"] == "generate":
+                prof = self._torch_profiler()
+                if prof is not None:
+                    prof.__enter__()
+                    torch_prof = prof
+            py_prof.enable()
+        except Exception as e:
+            log.warning("profiler: could not start (%s); running unprofiled", e)
+            if torch_prof is not None:
+                self._stop_torch(torch_prof)
+            return self._unprofiled(cap, run, f"could not start: {e}", fn, args, kwargs)
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._finish(cap, run, py_prof, torch_prof, cuda, time.perf_counter() - t0)
+
+    def _finish(
+        self, cap: _Capture, run: dict[str, Any], py_prof: cProfile.Profile, torch_prof: Any, cuda: bool, elapsed_s: float
+    ) -> None:
+        run["elapsed_s"] = round(elapsed_s, 4)
+        try:
+            py_prof.disable()
+        except Exception as e:
+            log.warning("profiler: could not stop cProfile: %s", e)
+        if torch_prof is not None and not self._stop_torch(torch_prof):
+            torch_prof = None  # nothing to export
+        if cuda:
+            try:
+                import torch
+
+                run["cuda_peak_bytes"] = int(torch.cuda.max_memory_allocated())
+            except Exception as e:
+                log.warning("profiler: could not read CUDA peak memory: %s", e)
+        stem = cap.out_dir / f"{cap.capture_id}-{run['kind']}{run['n']}"
+        files = [self._save_pstats(py_prof, stem.with_name(stem.name + ".pstats"))]
+        if torch_prof is not None:
+            files.extend(self._save_torch(torch_prof, stem, cuda))
+        with self._lock:
+            cap.artifacts.extend(f for f in files if f)
+        self._write_summary(cap)
+
+    @staticmethod
+    def _stop_torch(prof: Any) -> bool:
+        try:
+            prof.__exit__(None, None, None)
+            return True
+        except Exception as e:
+            log.warning("profiler: could not stop the torch profiler: %s", e)
+            return False
+
+    @staticmethod
+    def _torch_profiler() -> Any:
+        try:
+            import torch
+            from torch.profiler import ProfilerActivity, profile
+        except Exception:
+            return None
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        return profile(activities=activities, profile_memory=True, record_shapes=True)
+
+    @staticmethod
+    def _save_pstats(prof: cProfile.Profile, path: Path) -> str:
+        try:
+            prof.dump_stats(str(path))
+            return path.name
+        except Exception as e:
+            log.warning("profiler: could not write %s: %s", path, e)
+            return ""
+
+    @staticmethod
+    def _save_torch(prof: Any, stem: Path, cuda: bool) -> list[str]:
+        out: list[str] = []
+        try:
+            trace = stem.with_name(stem.name + ".trace.json")
+            prof.export_chrome_trace(str(trace))
+            out.append(trace.name)
+            table = stem.with_name(stem.name + ".ops.txt")
+            sort_by = "self_cuda_time_total" if cuda else "self_cpu_time_total"
+            table.write_text(prof.key_averages().table(sort_by=sort_by, row_limit=50), encoding="utf-8")
+            out.append(table.name)
+        except Exception as e:
+            log.warning("profiler: could not export torch profile %s: %s", stem, e)
+        return out
+
+    def _sample_loop(self, cap: _Capture, thread_id: int, duration_s: float) -> None:
+        stacks: Counter[str] = Counter()
+        deadline = time.monotonic() + duration_s
+        samples = 0
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                stack = traceback.extract_stack(frame)
+                stacks[";".join(f"{Path(f.filename).name}:{f.name}:{f.lineno}" for f in stack)] += 1
+                samples += 1
+            time.sleep(_LOOP_INTERVAL_S)
+        path = cap.out_dir / f"{cap.capture_id}-loop.folded"
+        try:
+            path.write_text("".join(f"{s} {n}\n" for s, n in stacks.most_common()), encoding="utf-8")
+        except Exception as e:
+            log.warning("profiler: could not write %s: %s", path, e)
+        else:
+            with self._lock:
+                cap.artifacts.append(path.name)
+                cap.runs.append({"kind": "event_loop", "elapsed_s": duration_s, "samples": samples})
+        self._write_summary(cap)
+
+    def _write_summary(self, cap: _Capture) -> None:
+        with self._lock:
+            summary = {
+                "capture_id": cap.capture_id,
+                "started_at": cap.started_at,
+                "remaining": dict(cap.remaining),
+                "runs": list(cap.runs),
+                "artifacts": list(cap.artifacts),
+            }
+        try:
+            (cap.out_dir / f"{cap.capture_id}.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
+        except Exception as e:
+            log.warning("profiler: could not write summary: %s", e)
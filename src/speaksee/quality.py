@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import math
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator, Literal, Optional
+
+from .config import Config
+
+
+QualityMode = Literal["fixed", "adaptive", "preview", "final"]
+
+# Candidate resolutions, as fractions of the configured width/height.
+_SCALES = (1.0, 0.875, 0.75, 0.625, 0.5)
+_EWMA = 0.3
+
+
+@dataclass(frozen=True)
+class QualityChoice:
+    steps: int
+    width: int
+    height: int
+    mode: QualityMode = "fixed"
+    predicted_s: float = 0.0  # expected time to the image, queue wait included; 0 = no estimate yet
+    queue_depth: int = 0  # generations ahead of this one when it was planned
+
+    def as_meta(self) -> dict[str, Any]:
+        meta: dict[str, Any] = {
+            "quality": self.mode,
+            "steps": self.steps,
+            "width": self.width,
+            "height": self.height,
+        }
+        if self.predicted_s:
+            meta["predicted_s"] = round(self.predicted_s, 2)
+        if self.queue_depth:
+            meta["queue_depth"] = self.queue_depth
+        return meta
+
+
+@dataclass
+class _Cost:
+    step_s_per_mpx: float  # one denoising step per megapixel
+    overhead_s_per_mpx: float  # text encoding + VAE decode, per megapixel
+
+
+def _mpx(width: int, height: int) -> float:
+    return max(1, width * height) / 1e6
+
+
+def _scaled(side: int, scale: float) -> int:
+    return max(8, int(side * scale) // 8 * 8)
+
+
+class QualityController:
+    """
+    Picks steps and resolution per request so the first image arrives within
+    `Config.latency_target_s`.
+
+    Costs are learned per (model, device) from finished generations: seconds per denoising step and
+    per-image overhead, both per megapixel (EWMA). Time spent waiting behind other generations in the
+    process counts against the target. Among candidates predicted to fit, the one with the most
+    `pixels * sqrt(steps)` wins (resolution matters more than the last few steps); if none fits, the
+    cheapest. The configured SPEAKSEE_STEPS/WIDTH/HEIGHT are the ceiling, used as-is until a first
+    measurement exists and for final-quality re-renders.
+    """
+
+    def __init__(self, cfg: Config):
+        self._cfg = cfg
+        self._lock = threading.Lock()
+        self._costs: dict[tuple[str, str], _Cost] = {}
+        self._job_s = 0.0  # EWMA wall time of one generation, for the queue wait estimate
+        self._in_flight = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._cfg.latency_target_s > 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._in_flight
+
+    @contextmanager
+    def running(self) -> Iterator[None]:
+        """Wrap a generation, including its wait for the (shared) pipeline."""
+        with self._lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def predict(self, model_id: str, device: str, steps: int, width: int, height: int) -> float:
+        cost = self._costs.get((model_id, device))
+        if cost is None:
+            return 0.0
+        return _mpx(width, height) * (steps * cost.step_s_per_mpx + cost.overhead_s_per_mpx)
+
+    def _candidates(self, steps: int, width: int, height: int) -> Iterator[tuple[int, int, int]]:
+        min_side = min(width, height, max(8, int(self._cfg.quality_min_side)))
+        # Turbo models tolerate going down to a single step; many-step models do not.
+        min_steps = max(1, steps // 4)
+        for scale in _SCALES:
+            w, h = _scaled(width, scale), _scaled(height, scale)
+            if min(w, h) < min_side and scale != 1.0:
+                continue
+            for s in range(steps, min_steps - 1, -1):
+                yield s, w, h
+
+    def choose(self, model_id: str, device: str, *, steps: int, width: int, height: int) -> QualityChoice:
+        steps, width, height = max(1, int(steps)), int(width), int(height)
+        if not self.enabled:
+            return QualityChoice(steps, width, height, "fixed")
+        with self._lock:
+            ahead = self._in_flight
+            wait_s = ahead * self._job_s
+            if (model_id, device) not in self._costs:
+                return QualityChoice(steps, width, height, "adaptive", 0.0, ahead)
+            budget = self._cfg.latency_target_s - wait_s
+            best: Optional[tuple[float, int, int, int, float]] = None
+            cheapest: Optional[tuple[float, int, int, int]] = None
+            for s, w, h in self._candidates(steps, width, height):
+                t = self.predict(model_id, device, s, w, h)
+                if cheapest is None or t < cheapest[0]:
+                    cheapest = (t, s, w, h)
+                if t <= budget:
+                    score = w * h * math.sqrt(s)
+                    if best is None or score > best[0]:
+                        best = (score, s, w, h, t)
+        if best is not None:
+            _, s, w, h, t = best
+        else:
+            assert cheapest is not None
+            t, s, w, h = cheapest
+        return QualityChoice(s, w, h, "adaptive", t + wait_s, ahead)
+
+    def preview(
+        self, model_id: str, device: str, planned: QualityChoice, *, steps: int, width: int, height: int
+    ) -> Optional[QualityChoice]:
+        """
+        Settings for the cheap first pass of a two-pass generation (see Config.two_pass): one step,
+        longest side `preview_side`. None when `planned` (from `choose`) is predicted to arrive
+        within the latency target anyway, or when the preview would not cost well under the full
+        render (already at preview size and too few steps to cut).
+        """
+        if planned.mode == "adaptive" and 0 < planned.predicted_s <= self._cfg.latency_target_s:
+            return None
+        scale = min(1.0, self._cfg.preview_side / max(1, width, height))
+        w, h = _scaled(width, scale), _scaled(height, scale)
+        if w * h * 4 > width * height * max(1, int(steps)):
+            return None
+        with self._lock:
+            ahead = self._in_flight
+            wait_s = ahead * self._job_s
+            t = self.predict(model_id, device, 1, w, h)
+        return QualityChoice(1, w, h, "preview", t + wait_s if t else 0.0, ahead)
+
+    def observe(
+        self,
+        model_id: str,
+        device: str,
+        *,
+        steps_run: int,
+        width: int,
+        height: int,
+        elapsed_s: float,
+        step_s: Optional[float] = None,
+    ) -> None:
+        """
+        Record a finished generation. `step_s` is the measured mean time of one denoising step (from
+        progress callbacks); without it the whole time is attributed to the steps.
+        """
+        if elapsed_s <= 0 or steps_run <= 0:
+            return
+        mpx = _mpx(width, height)
+        if step_s is None or step_s <= 0 or step_s * steps_run > elapsed_s:
+            step_s = elapsed_s / steps_run
+        overhead_s = max(0.0, elapsed_s - step_s * steps_run)
+        sample = _Cost(step_s / mpx, overhead_s / mpx)
+        with self._lock:
+            key = (model_id, device)
+            cost = self._costs.get(key)
+            if cost is None:
+                self._costs[key] = sample
+            else:
+                cost.step_s_per_mpx += _EWMA * (sample.step_s_per_mpx - cost.step_s_per_mpx)
+                cost.overhead_s_per_mpx += _EWMA * (sample.overhead_s_per_mpx - cost.overhead_s_per_mpx)
+            self._job_s = elapsed_s if not self._job_s else self._job_s + _EWMA * (elapsed_s - self._job_s)
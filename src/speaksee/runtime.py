@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from .config import Config
+from .hardware import probe_in_background
+from .image_models import ImageModels
+from .memory import MemoryManager
+from .profiling import Profiler
+from .quality import QualityController
+from .stt_whisper import SpeechToText
+from .tts import TtsWorker, create_tts
+
+
+@dataclass
+class Runtime:
+    """Process-wide model instances, shared by every connection."""
+
+    cfg: Config
+    # In-process models, or proxies to the model server (`Config.model_server`, see model_server).
+    stt: SpeechToText
+    gen: ImageModels
+    memory: MemoryManager
+    quality: QualityController
+    profiler: Profiler
+    model_client: Any = None
+    tts: Optional[TtsWorker] = None  # spoken feedback (`Config.tts`), None when off
+
+
+def _remote_runtime(cfg: Config) -> Runtime:
+    from .model_server import (
+        ModelClient,
+        RemoteImageModels,
+        RemoteMemory,
+        RemoteProfiler,
+        RemoteSpeechToText,
+    )
+
+    client = ModelClient(cfg.model_server)
+    return Runtime(
+        cfg=cfg,
+        stt=RemoteSpeechToText(client),  # type: ignore[arg-type]
+        gen=RemoteImageModels(cfg, client),  # type: ignore[arg-type]
+        memory=RemoteMemory(client),  # type: ignore[arg-type]
+        quality=QualityController(cfg),
+        profiler=RemoteProfiler(cfg, client),  # type: ignore[arg-type]
+        model_client=client,
+        tts=create_tts(cfg),
+    )
+
+
+def create_image_models(cfg: Config) -> ImageModels:
+    """Local pipelines, or the `speaksee-worker`s that connect to `cfg.worker_listen`."""
+    if cfg.worker_listen:
+        from .workers import DistributedImageModels
+
+        return DistributedImageModels(cfg)  # type: ignore[return-value]
+    probe_in_background(cfg.device_preference)
+    return ImageModels(cfg)
+
+
+def create_runtime(cfg: Config) -> Runtime:
+    if cfg.model_server:
+        return _remote_runtime(cfg)
+    stt = SpeechToText(cfg)
+    gen = create_image_models(cfg)
+    memory = MemoryManager(cfg)
+    memory.register("stt", stt)
+    memory.register("sd", gen)
+    quality = QualityController(cfg)
+    profiler = Profiler(cfg)
+    return Runtime(cfg=cfg, stt=stt, gen=gen, memory=memory, quality=quality, profiler=profiler, tts=create_tts(cfg))
@@ -1,25 +1,55 @@
 from __future__ import annotations
 
 import asyncio
+import base64
+import io
 import json
+import logging
 import os
 import random
+import re
+import time
 import traceback
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Any, Optional
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from PIL import Image
 
-from .commands import parse_voice_command
+from .audio_codec import UnsupportedAudioFormat, available_formats, create_decoder, decode_audio_file
+from .commands import ParsedVoiceCommand, parse_voice_command
 from .config import Config, load_config
-from .gallery import copy_to_saved, list_gallery, save_generated_image
-from .image_sd import ImageGenerator
+from .export import FORMATS as EXPORT_FORMATS, export_filename, stream_archive
+from .gallery import GalleryJanitor, copy_to_saved, iter_export, list_gallery, save_generated_image
+from .image_models import UnknownModel
+from .image_sd import GenerationCancelled
+from .jobs import IdempotencyConflict, Job, JobQueue, JobQueueFull, fingerprint, sse_format
+from .metrics import (
+    ACTIVE_SESSIONS,
+    AUDIO_RECEIVED_BYTES,
+    DEVICE_INFO,
+    GENERATIONS,
+    IMAGE_ENCODE_SECONDS,
+    MODEL_METRICS,
+    REGISTRY,
+    WS_DROPPED,
+)
+from .outbox import Outbox
+from .profiling import ProfilerBusy
+from .quality import QualityChoice
+from .runtime import Runtime, create_runtime
 from .session import SessionState
-from .stt_whisper import SpeechToText
-from .tts import speak_async
-from .ws_protocol import dumps, error, status
+from .session_record import SessionRecorder
+from .stt_whisper import WHISPER_SAMPLE_RATE
+from .tracing import TRACER, current_trace, new_trace_id, set_trace, span
+from .tts import audio_mime
+from .ws_protocol import error, status
+
+
+log = logging.getLogger(__name__)
 
 
 def _set_privacy_env_defaults(cfg: Config) -> None:
@@ -28,8 +58,80 @@ def _set_privacy_env_defaults(cfg: Config) -> None:
     os.environ.setdefault("HF_HOME", str(cfg.hf_home))
 
 
+# Uploads to /api/transcribe: a few minutes of uncompressed audio at most.
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+
+def _generate_params(rt: Runtime, body: Any) -> dict[str, Any]:
+    """Validated /api/generate parameters; ValueError (or UnknownModel) on bad input."""
+    cfg = rt.cfg
+    if not isinstance(body, dict):
+        raise ValueError("Expected a JSON object.")
+    prompt = str(body.get("prompt") or "").strip()
+    if not prompt:
+        raise ValueError("Empty prompt.")
+    style = str(body.get("style") or "none")
+    if style not in ("none", "realistic", "abstract"):
+        raise ValueError(f"Unknown style: {style}")
+    model_id = rt.gen.resolve(body.get("model"))
+    spec = cfg.sd_model_spec(model_id)
+
+    def _int(name: str, default: int, lo: int, hi: int) -> int:
+        value = body.get(name)
+        if value is None:
+            return default
+        try:
+            return min(hi, max(lo, int(value)))
+        except (TypeError, ValueError):
+            raise ValueError(f"{name} must be an integer") from None
+
+    seed = body.get("seed")
+    if seed is not None:
+        seed = _int("seed", 0, 0, 2**31 - 1)
+    return {
+        "prompt": prompt,
+        "style": style,
+        "model": model_id,
+        "seed": seed,
+        "steps": _int("steps", max(1, int(spec.steps or cfg.steps)), 1, 150),
+        # Latent stride: sizes are multiples of 8.
+        "width": _int("width", cfg.width, 64, 2048) // 8 * 8,
+        "height": _int("height", cfg.height, 64, 2048) // 8 * 8,
+    }
+
+
 def create_app(cfg: Config) -> FastAPI:
-    app = FastAPI(title="Speak → See", docs_url=None, redoc_url=None)
+    rt = create_runtime(cfg)
+    TRACER.configure(cfg)
+    jobs = JobQueue(cfg)
+
+    def collect_devices() -> None:
+        # Only models that are already loaded: a scrape must never trigger a model load.
+        DEVICE_INFO.clear()
+        for model_id, device in rt.gen.devices().items():
+            DEVICE_INFO.set(1, model=f"sd:{model_id}", device=device)
+        stt_device = rt.stt.loaded_device
+        if stt_device is not None:
+            DEVICE_INFO.set(1, model=f"stt:{cfg.whisper_model}", device=stt_device)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        REGISTRY.on_collect(collect_devices)
+        rt.profiler.bind_event_loop()
+        sweeper = asyncio.create_task(rt.memory.run())
+        janitor = asyncio.create_task(GalleryJanitor(cfg).run())
+        try:
+            yield
+        finally:
+            sweeper.cancel()
+            janitor.cancel()
+            if rt.tts is not None:
+                rt.tts.close()
+            await jobs.close()
+            REGISTRY.remove_collector(collect_devices)
+
+    app = FastAPI(title="Speak → See", docs_url=None, redoc_url=None, lifespan=lifespan)
+    app.state.runtime = rt
 
     static_dir = Path(__file__).resolve().parent / "static"
     app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
@@ -43,15 +145,269 @@ def create_app(cfg: Config) -> FastAPI:
     async def api_gallery() -> JSONResponse:
         return JSONResponse({"items": list_gallery(cfg)})
 
+    @app.get("/api/export")
+    async def api_export(
+        format: str = "zip", since: str = "", until: str = "", style: str = "", saved: bool = False
+    ) -> Any:
+        # Streams a zip/tar of the matching images and their metadata as it is built.
+        if format not in EXPORT_FORMATS:
+            return JSONResponse({"error": "format must be 'zip' or 'tar'."}, status_code=400)
+        for v in (since, until):
+            if v and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", v):
+                return JSONResponse({"error": "since/until must be YYYY-MM-DD."}, status_code=400)
+        items = iter_export(cfg, since=since, until=until, style=style.strip(), saved_only=saved)
+        return StreamingResponse(
+            stream_archive(items, format),
+            media_type=EXPORT_FORMATS[format],
+            headers={"Content-Disposition": f'attachment; filename="{export_filename(format)}"'},
+        )
+
+    @app.get("/api/memory")
+    async def api_memory() -> JSONResponse:
+        return JSONResponse(await asyncio.to_thread(rt.memory.snapshot))
+
+    def render_metrics() -> str:
+        if rt.model_client is None:
+            return REGISTRY.render()
+        # Model timings are recorded in the model server process.
+        try:
+            model_metrics = rt.model_client.call("metrics")
+        except Exception as e:
+            log.warning("model server metrics unavailable: %s", e)
+            model_metrics = ""
+        return REGISTRY.render(skip=MODEL_METRICS) + model_metrics
+
+    @app.get("/metrics")
+    async def metrics() -> PlainTextResponse:
+        text = await asyncio.to_thread(render_metrics)
+        return PlainTextResponse(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @app.get("/api/trace")
+    async def api_trace(trace_id: Optional[str] = None) -> JSONResponse:
+        # Chrome trace-event JSON: open in chrome://tracing or https://ui.perfetto.dev
+        return JSONResponse(await asyncio.to_thread(TRACER.chrome_trace, trace_id))
+
+    @app.get("/api/profile")
+    async def api_profile_status() -> JSONResponse:
+        return JSONResponse(await asyncio.to_thread(rt.profiler.status))
+
+    @app.post("/api/profile")
+    async def api_profile(
+        request: Request, generate: int = 0, stt: int = 0, loop_s: float = 0.0
+    ) -> JSONResponse:
+        # Admin only: profiles include prompts and file paths, so never serve them off-machine.
+        if request.client is None or request.client.host not in ("127.0.0.1", "::1", "localhost"):
+            return JSONResponse({"error": "Profiling is only available from localhost."}, status_code=403)
+        try:
+            return JSONResponse(
+                await asyncio.to_thread(rt.profiler.arm, generate=generate, stt=stt, loop_s=loop_s)
+            )
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+        except ProfilerBusy as e:
+            return JSONResponse({"error": str(e)}, status_code=409)
+
+    # --- HTTP job API: the same models, without a WebSocket session ----------------------------
+
+    async def run_generate_job(job: Job, p: dict[str, Any]) -> dict[str, Any]:
+        set_trace(new_trace_id())
+        full_prompt, negative = cfg.styled_prompt(p["prompt"], p["style"])
+        seed = p["seed"] if p["seed"] is not None else random.randint(0, 2**31 - 1)
+
+        def on_progress(step_i: int, total: int) -> None:
+            job.emit_threadsafe(
+                "progress",
+                {"step": int(step_i), "total_steps": int(total), "percent": int(step_i / max(1, total) * 100)},
+            )
+
+        with rt.quality.running(), span("job.generate", job_id=job.id, model=p["model"]):
+            try:
+                result = await asyncio.to_thread(
+                    rt.profiler.wrap("generate", rt.gen.generate),
+                    model_id=p["model"],
+                    prompt=full_prompt,
+                    negative_prompt=negative,
+                    steps=p["steps"],
+                    width=p["width"],
+                    height=p["height"],
+                    seed=seed,
+                    on_progress=on_progress,
+                    guidance_scale=cfg.sd_model_spec(p["model"]).guidance_scale,
+                )
+            except Exception:
+                GENERATIONS.inc(quality="fixed", outcome="error")
+                raise
+            GENERATIONS.inc(quality="fixed", outcome="ok")
+            rt.quality.observe(
+                result.model_id,
+                result.device,
+                steps_run=result.steps_run,
+                width=result.width,
+                height=result.height,
+                elapsed_s=result.elapsed_s,
+            )
+            with span("gallery.save"):
+                meta = await asyncio.to_thread(
+                    save_generated_image,
+                    cfg,
+                    result.image,
+                    prompt=p["prompt"],
+                    negative_prompt=negative,
+                    seed=result.seed,
+                    steps=p["steps"],
+                    style=p["style"],
+                    model_id=result.model_id,
+                    device=result.device,
+                    extra={"source": "api", "job_id": job.id},
+                )
+        return {
+            "image_id": meta["id"],
+            "url": f"/images/{meta['file']}",
+            "prompt": meta["prompt"],
+            "seed": meta["seed"],
+            "style": meta["style"],
+            "model": result.model_id,
+            "device": result.device,
+            "width": result.width,
+            "height": result.height,
+            "steps": p["steps"],
+            "elapsed_s": round(result.elapsed_s, 3),
+            "trace_id": current_trace(),
+        }
+
+    async def run_transcribe_job(job: Job, data: bytes, fmt: str, sample_rate: int, channels: int) -> dict[str, Any]:
+        set_trace(new_trace_id())
+
+        def decode() -> bytes:
+            if fmt == "pcm16":
+                dec = create_decoder("pcm16", sample_rate, channels, target_rate=WHISPER_SAMPLE_RATE)
+                return dec.decode(data) + dec.flush()
+            return decode_audio_file(data, WHISPER_SAMPLE_RATE)
+
+        with span("job.transcribe", job_id=job.id, audio_bytes=len(data)):
+            pcm = await asyncio.to_thread(decode)
+            t0 = time.perf_counter()
+            res = await asyncio.to_thread(
+                rt.profiler.wrap("stt", rt.stt.transcribe_final), pcm, WHISPER_SAMPLE_RATE
+            )
+        return {
+            "text": res.text,
+            "audio_s": round(len(pcm) / 2 / WHISPER_SAMPLE_RATE, 3),
+            "elapsed_s": round(time.perf_counter() - t0, 3),
+            "trace_id": current_trace(),
+        }
+
+    def submit_job(kind: str, fp: str, runner: Any, request: Request) -> JSONResponse:
+        key = (request.headers.get("idempotency-key") or "").strip() or None
+        try:
+            job, created = jobs.submit(kind, fp, runner, idempotency_key=key)
+        except IdempotencyConflict:
+            return JSONResponse(
+                {"error": "Idempotency-Key was already used with different parameters."}, status_code=422
+            )
+        except JobQueueFull:
+            return JSONResponse(
+                {"error": f"Too many queued {kind} jobs; retry later."},
+                status_code=429,
+                headers={"Retry-After": "5"},
+            )
+        body = {**jobs.describe(job), "url": f"/api/jobs/{job.id}", "events": f"/api/jobs/{job.id}/events"}
+        return JSONResponse(body, status_code=202 if created else 200)
+
+    @app.post("/api/generate")
+    async def api_generate(request: Request) -> JSONResponse:
+        try:
+            p = _generate_params(rt, await request.json())
+        except UnknownModel as e:
+            return JSONResponse({"error": f"Unknown model: {e}"}, status_code=400)
+        except ValueError as e:  # includes malformed JSON
+            return JSONResponse({"error": str(e)}, status_code=400)
+        return submit_job("generate", fingerprint(p), lambda job: run_generate_job(job, p), request)
+
+    @app.post("/api/transcribe")
+    async def api_transcribe(
+        request: Request, format: str = "file", sample_rate: int = WHISPER_SAMPLE_RATE, channels: int = 1
+    ) -> JSONResponse:
+        # The request body is the audio itself: a file (WAV/FLAC/MP3/Ogg/WebM...) or, with
+        # ?format=pcm16, raw little-endian PCM16 at `sample_rate`.
+        if format not in ("file", "pcm16"):
+            return JSONResponse({"error": "format must be 'file' or 'pcm16'."}, status_code=400)
+        if not 8000 <= sample_rate <= 192000 or channels not in (1, 2):
+            return JSONResponse({"error": "Unsupported sample_rate/channels."}, status_code=400)
+        data = bytearray()
+        async for chunk in request.stream():
+            data += chunk
+            if len(data) > MAX_UPLOAD_BYTES:
+                return JSONResponse({"error": "Audio too large."}, status_code=413)
+        if not data:
+            return JSONResponse({"error": "Empty request body."}, status_code=400)
+        audio = bytes(data)
+        fp = fingerprint({"format": format, "sample_rate": sample_rate, "channels": channels}, audio)
+        return submit_job(
+            "transcribe",
+            fp,
+            lambda job: run_transcribe_job(job, audio, format, sample_rate, channels),
+            request,
+        )
+
+    @app.get("/api/jobs/{job_id}")
+    async def api_job(job_id: str) -> JSONResponse:
+        job = jobs.get(job_id)
+        if job is None:
+            return JSONResponse({"error": "Unknown job."}, status_code=404)
+        return JSONResponse(jobs.describe(job))
+
+    @app.get("/api/jobs/{job_id}/events")
+    async def api_job_events(job_id: str, request: Request) -> Any:
+        # Server-sent events: queued, started, progress..., then result or error.
+        job = jobs.get(job_id)
+        if job is None:
+            return JSONResponse({"error": "Unknown job."}, status_code=404)
+        try:
+            after = int(request.headers.get("last-event-id", "-1"))
+        except ValueError:
+            after = -1
+
+        async def body() -> Any:
+            async for event in jobs.stream(job, after):
+                yield sse_format(event)
+
+        return StreamingResponse(
+            body(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     @app.websocket("/ws")
     async def ws_endpoint(ws: WebSocket) -> None:
-        await handle_ws(cfg, ws)
+        await handle_ws(rt, ws)
 
     return app
 
 
-async def _ws_send(ws: WebSocket, payload: dict[str, Any]) -> None:
-    await ws.send_text(dumps(payload))
+_background_tasks: set[asyncio.Task[Any]] = set()
+
+
+def _spawn(coro: Any) -> asyncio.Task[Any]:
+    # Fire-and-forget, but keep a reference so the task isn't garbage collected mid-flight.
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def _gen_status(gen: Any) -> tuple[str, str, tuple[str, ...]]:
+    # Device, memory mode and OOM recovery steps. May block (a model server round trip, or the
+    # hardware probe): call it via asyncio.to_thread.
+    return gen.device, gen.memory_mode, tuple(gen.last_recovery)
+
+
+def _image_data_url(image: Image.Image, quality: int = 85) -> str:
+    # Previews are small and short-lived: inline them instead of writing them to the gallery.
+    buf = io.BytesIO()
+    with IMAGE_ENCODE_SECONDS.time(kind="jpeg_preview"):
+        image.convert("RGB").save(buf, format="JPEG", quality=quality)
+    return "data:image/jpeg;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
 
 
 def _slice_last_seconds(pcm16: bytearray, sample_rate: int, seconds: float) -> bytes:
@@ -65,32 +421,63 @@ def _slice_last_seconds(pcm16: bytearray, sample_rate: int, seconds: float) -> b
     return bytes(pcm16[-max_bytes:])
 
 
-async def handle_ws(cfg: Config, ws: WebSocket) -> None:
+async def handle_ws(rt: Runtime, ws: WebSocket) -> None:
     await ws.accept()
-    loop = asyncio.get_running_loop()
 
-    stt = SpeechToText(cfg)
-    gen = ImageGenerator(cfg)
+    cfg = rt.cfg
+    stt = rt.stt
+    gen = rt.gen
     state = SessionState()
+    # All outbound messages go through this connection's writer task (ordering, coalescing,
+    # backpressure); handlers never wait on the socket.
+    recorder = SessionRecorder.create(cfg)
+    out = Outbox(
+        ws,
+        max_queue=cfg.ws_max_queue,
+        send_timeout_s=cfg.ws_send_timeout_s,
+        on_sent=recorder.outgoing if recorder is not None else None,
+    )
+    out.start()
+    ACTIVE_SESSIONS.inc()
 
     partial_task: Optional[asyncio.Task[None]] = None
 
+    def say(text: str) -> None:
+        # Spoken feedback (SPEAKSEE_TTS): on the server's speakers, or sent for the client to play.
+        tts = rt.tts
+        if tts is None:
+            return
+        if tts.mode == "speaker":
+            tts.speak(text)
+            return
+
+        async def _send() -> None:
+            audio = await asyncio.wrap_future(tts.render(text))
+            if audio:
+                data = base64.b64encode(audio).decode("ascii")
+                out.send({"type": "tts", "text": text, "audio": f"data:{audio_mime(audio)};base64,{data}"})
+
+        _spawn(_send())
+
     async def send_models() -> None:
-        await _ws_send(
-            ws,
-            {
-                "type": "models",
-                "stt_model": cfg.whisper_model,
-                "image_model": cfg.sd_model,
-                "device": gen.device,
-            },
-        )
+        device, memory_mode, recovery = await asyncio.to_thread(_gen_status, gen)
+        out.send({
+            "type": "models",
+            "stt_model": cfg.whisper_model,
+            "image_model": state.model or cfg.sd_model,
+            "image_models": list(gen.model_ids),
+            "device": device,
+            "memory_mode": memory_mode,
+            "oom_recovery": list(recovery),
+            "audio_formats": list(available_formats()),
+        })
 
     async def start_partial_loop() -> None:
         nonlocal partial_task
 
         async def _loop() -> None:
             last_sent = ""
+            last_cmd: Optional[str] = None
             while state.recording:
                 await asyncio.sleep(cfg.stt_partial_interval_s)
                 if not state.recording:
@@ -103,18 +490,61 @@ async def handle_ws(cfg: Config, ws: WebSocket) -> None:
                 if len(pcm) < 32000:  # < 1s at 16k
                     continue
                 try:
-                    async with state.transcription_lock:
-                        res = await asyncio.to_thread(stt.transcribe_partial, pcm, state.sample_rate)
+                    with span("stt.partial"):
+                        async with state.transcription_lock:
+                            res = await asyncio.to_thread(
+                                rt.profiler.wrap("stt", stt.transcribe_partial), pcm, state.sample_rate
+                            )
                     text = res.text
                     if text and text != last_sent:
                         last_sent = text
-                        await _ws_send(ws, {"type": "transcript_partial", "text": text})
+                        out.send({"type": "transcript_partial", "text": text})
                 except Exception:
                     # Partial is best-effort; never kill the session.
                     continue
 
+                if not cfg.command_fast_path or not state.recording:
+                    continue
+                with span("command.parse"):
+                    # Exact phrases only: the user may still be speaking a prompt that starts alike.
+                    cmd = parse_voice_command(text, fuzzy=False)
+                if cmd is None or cmd.name != last_cmd:
+                    last_cmd = cmd.name if cmd is not None else None
+                    continue
+                # Two consecutive partials agree on a command: the user has stopped talking.
+                # End the utterance here; the final decode would only confirm it.
+                state.recording = False
+                state.audio_pcm16 = bytearray()
+                mark_speech_end()
+                send_transcript_final(text, cmd)
+                # Not in this task, which stop_partial_loop cancels after a short wait.
+                _spawn(run_voice_command(cmd))
+                break
+
         partial_task = asyncio.create_task(_loop())
 
+    def mark_speech_end() -> None:
+        state.speech_end = time.perf_counter()
+        if state.utterance_start:
+            TRACER.add("audio.recording", state.utterance_start, state.speech_end)
+
+    def send_transcript_final(text: str, cmd: Optional[ParsedVoiceCommand]) -> None:
+        out.send({
+            "type": "transcript_final",
+            "text": text,
+            "command": cmd.name if cmd is not None else None,
+            "trace_id": current_trace(),
+        })
+        state.final_sent_at = time.perf_counter()
+        if state.utterance_start:
+            TRACER.add("utterance", state.utterance_start, state.final_sent_at)
+
+    def mark_image_shown(preview: bool) -> None:
+        # Speak-to-image time: from the end of speech until the image is on its way to the client.
+        if state.speech_end and state.trace_id is not None and current_trace() == state.trace_id:
+            name = "speak_to_preview" if preview else "speak_to_image"
+            TRACER.add(name, state.speech_end, time.perf_counter())
+
     async def stop_partial_loop() -> None:
         nonlocal partial_task
         if partial_task is None:
@@ -126,130 +556,337 @@ async def handle_ws(cfg: Config, ws: WebSocket) -> None:
             pass
         partial_task = None
 
-    async def do_generate(prompt: str) -> None:
+    async def cancel_refine() -> None:
+        # Preempt a background refine pass: it stops at its next step; wait for it to wind down.
+        task = state.refine_task
+        if task is None or task.done() or task is asyncio.current_task():
+            return
+        state.bump_generation_token()
+        try:
+            await task
+        except Exception:
+            pass
+
+    async def wait_refine() -> None:
+        task = state.refine_task
+        if task is None or task.done() or task is asyncio.current_task():
+            return
+        try:
+            await task
+        except Exception:
+            pass
+
+    async def do_generate(prompt: str, **kwargs: Any) -> None:
+        with span(
+            "generate",
+            refine=kwargs.get("init_image") is not None,
+            final=bool(kwargs.get("final")),
+            two_pass=bool(kwargs.get("two_pass")),
+        ):
+            await run_generation(prompt, **kwargs)
+
+    async def run_generation(
+        prompt: str,
+        *,
+        init_image: Optional[Image.Image] = None,
+        strength: float = 1.0,
+        seed: Optional[int] = None,
+        model: Optional[str] = None,
+        final: bool = False,
+        two_pass: bool = False,
+    ) -> None:
         prompt = (prompt or "").strip()
         if not prompt:
-            await _ws_send(ws, error("Empty prompt."))
+            out.send(error("Empty prompt."))
             return
 
+        try:
+            model_id = gen.resolve(model if model is not None else state.model)
+        except UnknownModel:
+            out.send(error("Unknown model.", str(model)))
+            return
+
+        await cancel_refine()
         if state.generation_lock.locked():
-            await _ws_send(ws, error("Already generating. Please wait."))
+            out.send(error("Already generating. Please wait."))
             return
 
         token = state.bump_generation_token()
 
         style = state.style
-        negative = ""
-        full_prompt = prompt
-        if style == "realistic":
-            full_prompt = f"{prompt}, {cfg.realistic_prompt_suffix}"
-            negative = cfg.realistic_negative
-        elif style == "abstract":
-            full_prompt = f"{prompt}, {cfg.abstract_prompt_suffix}"
-            negative = cfg.abstract_negative
+        full_prompt, negative = cfg.styled_prompt(prompt, style)
 
         state.last_prompt = prompt
         state.last_negative_prompt = negative
 
-        steps = max(1, int(cfg.steps))
-        seed = random.randint(0, 2**31 - 1)
+        spec = cfg.sd_model_spec(model_id)
+        steps = max(1, int(spec.steps or cfg.steps))
+        if seed is None:
+            seed = random.randint(0, 2**31 - 1)
+        refine = init_image is not None
+        parent_id = state.last_image_id if refine else None
 
-        await _ws_send(ws, status("generating", "Generating image..."))
-        await _ws_send(ws, {"type": "gen_started", "prompt": prompt, "seed": seed, "steps": steps})
+        device, memory_mode, _ = await asyncio.to_thread(_gen_status, gen)
+        if refine or final:
+            # Refinements keep the size of the image they start from.
+            w, h = init_image.size if init_image is not None else (cfg.width, cfg.height)
+            quality = QualityChoice(steps, w, h, "final" if final else "fixed")
+        else:
+            quality = rt.quality.choose(model_id, device, steps=steps, width=cfg.width, height=cfg.height)
+            if two_pass:
+                preview = rt.quality.preview(
+                    model_id, device, quality, steps=steps, width=cfg.width, height=cfg.height
+                )
+                quality = preview or quality
+
+        # Final-quality passes run in the background: the user may already be talking again.
+        out.send(
+            status("refining" if final else "generating", "Refining image..." if refine else "Generating image...")
+        )
+        started: dict[str, Any] = {
+            "type": "gen_started",
+            "prompt": prompt,
+            "seed": seed,
+            "model": model_id,
+            **quality.as_meta(),
+        }
+        if quality.mode == "adaptive":
+            started["target_s"] = cfg.latency_target_s
+        if refine:
+            started.update({"mode": "img2img", "strength": strength, "parent_id": parent_id})
+        out.send(started)
+
+        step_times: list[float] = []
 
         def on_progress(step_i: int, total: int) -> None:
+            step_times.append(time.perf_counter())
             if token != state.generation_token:
                 return
             pct = int((step_i / max(1, total)) * 100)
-            try:
-                asyncio.run_coroutine_threadsafe(
-                    _ws_send(
-                        ws,
-                        {
-                            "type": "gen_progress",
-                            "step": int(step_i),
-                            "total_steps": int(total),
-                            "percent": pct,
-                        },
-                    ),
-                    loop,
-                )
-            except Exception:
-                pass
+            out.send_threadsafe(
+                {
+                    "type": "gen_progress",
+                    "step": int(step_i),
+                    "total_steps": int(total),
+                    "percent": pct,
+                }
+            )
 
         try:
-            async with state.generation_lock:
-                result = await asyncio.to_thread(
-                    gen.generate,
-                    prompt=full_prompt,
-                    negative_prompt=negative,
-                    steps=steps,
-                    width=cfg.width,
-                    height=cfg.height,
-                    seed=seed,
-                    on_progress=on_progress,
-                )
+            with rt.quality.running(), span("gen.run", model=model_id, **quality.as_meta()):
+                async with state.generation_lock:
+                    result = await asyncio.to_thread(
+                        rt.profiler.wrap("generate", gen.generate),
+                        model_id=model_id,
+                        prompt=full_prompt,
+                        negative_prompt=negative,
+                        steps=quality.steps,
+                        width=quality.width,
+                        height=quality.height,
+                        seed=seed,
+                        on_progress=on_progress,
+                        init_image=init_image,
+                        strength=strength,
+                        guidance_scale=spec.guidance_scale,
+                        should_cancel=lambda: token != state.generation_token,
+                    )
+        except GenerationCancelled:
+            # Preempted by a newer request, which reports its own status.
+            GENERATIONS.inc(quality=quality.mode, outcome="cancelled")
+            return
         except Exception as e:
-            await _ws_send(ws, error("Image generation failed.", str(e)))
-            await _ws_send(ws, status("ready", ""))
+            GENERATIONS.inc(quality=quality.mode, outcome="error")
+            if gen.memory_mode != memory_mode:
+                await send_models()
+            out.send(error("Image generation failed.", str(e)))
+            out.send(status("ready", ""))
+            say("Image generation failed")
             return
 
+        rt.quality.observe(
+            result.model_id,
+            result.device,
+            steps_run=result.steps_run,
+            width=result.width,
+            height=result.height,
+            elapsed_s=result.elapsed_s,
+            step_s=(
+                (step_times[-1] - step_times[0]) / (len(step_times) - 1) if len(step_times) > 1 else None
+            ),
+        )
+
+        if result.recovery or gen.memory_mode != memory_mode:
+            # OOM recovery kicked in (or the cooldown promoted us back): tell the client.
+            await send_models()
+
         if token != state.generation_token:
             # superseded; discard
-            await _ws_send(ws, status("ready", ""))
+            GENERATIONS.inc(quality=quality.mode, outcome="superseded")
+            out.send(status("ready", ""))
             return
+        GENERATIONS.inc(quality=quality.mode, outcome="ok")
 
-        meta = save_generated_image(
-            cfg,
-            result.image,
-            prompt=prompt,
-            negative_prompt=negative,
-            seed=result.seed,
-            steps=steps,
-            style=style,
-            model_id=cfg.sd_model,
-            device=result.device,
-        )
+        if quality.mode == "preview":
+            # First pass: show it right away (not saved), then refine it in the background.
+            state.last_image_id = None
+            state.last_image = result.image
+            state.last_seed = result.seed
+            state.last_model = result.model_id
+            state.last_full_quality = False
+            with span("preview.encode"):
+                url = _image_data_url(result.image)
+            out.send({
+                "type": "gen_preview",
+                "url": url,
+                "prompt": prompt,
+                "seed": result.seed,
+                "style": style,
+                "model": result.model_id,
+                "quality": quality.mode,
+                "width": result.width,
+                "height": result.height,
+                "trace_id": current_trace(),
+            })
+            mark_image_shown(preview=True)
+            state.refine_task = _spawn(do_final_quality())
+            return
+
+        extra: dict[str, Any] = {k: v for k, v in quality.as_meta().items() if k != "steps"}
+        if refine:
+            extra.update({"mode": "img2img", "strength": strength, "parent_id": parent_id})
+        if result.recovery:
+            extra.update({"oom_recovery": list(result.recovery), "width": result.width, "height": result.height})
+
+        with span("gallery.save"):
+            meta = save_generated_image(
+                cfg,
+                result.image,
+                prompt=prompt,
+                negative_prompt=negative,
+                seed=result.seed,
+                steps=quality.steps,
+                style=style,
+                model_id=result.model_id,
+                device=result.device,
+                extra=extra,
+            )
         state.last_image_id = meta["id"]
+        state.last_image = result.image
+        state.last_seed = result.seed
+        state.last_model = result.model_id
+        # Anything below the configured ceiling can be re-rendered at final quality on demand.
+        state.last_full_quality = quality.steps >= steps and result.image.size == (cfg.width, cfg.height)
 
-        await _ws_send(
-            ws,
-            {
-                "type": "gen_result",
-                "id": meta["id"],
-                "url": f"/images/{meta['file']}",
-                "prompt": meta["prompt"],
-                "seed": meta["seed"],
-                "style": meta["style"],
-                "ts": meta["ts"],
-            },
-        )
-        await _ws_send(ws, {"type": "gallery", "items": list_gallery(cfg)})
-        await _ws_send(ws, status("ready", ""))
+        out.send({
+            "type": "gen_result",
+            "id": meta["id"],
+            "url": f"/images/{meta['file']}",
+            "prompt": meta["prompt"],
+            "seed": meta["seed"],
+            "style": meta["style"],
+            "model": result.model_id,
+            "quality": quality.mode,
+            "final_available": not state.last_full_quality,
+            "ts": meta["ts"],
+            "trace_id": current_trace(),
+        })
+        mark_image_shown(preview=False)
+        out.send({"type": "gallery", "items": list_gallery(cfg)})
+        if not state.recording:
+            out.send(status("ready", ""))
 
     async def do_regenerate() -> None:
         if not state.last_prompt:
-            await _ws_send(ws, error("No previous prompt to regenerate."))
+            out.send(error("No previous prompt to regenerate."))
             return
-        await do_generate(state.last_prompt)
+        if state.last_image is not None and cfg.regenerate_strength > 0:
+            # Variation of the current composition with a new seed.
+            await do_generate(
+                state.last_prompt,
+                init_image=state.last_image,
+                strength=cfg.regenerate_strength,
+                model=state.last_model,
+            )
+            return
+        await do_generate(state.last_prompt, model=state.last_model, two_pass=cfg.two_pass)
+
+    async def do_restyle(style: str) -> None:
+        state.style = style
+        if state.last_image is None or not state.last_prompt or cfg.refine_strength <= 0:
+            await do_regenerate()
+            return
+        # Keep the composition: refine the last image toward the new style with the same seed.
+        await do_generate(
+            state.last_prompt,
+            init_image=state.last_image,
+            strength=cfg.refine_strength,
+            seed=state.last_seed,
+            model=state.last_model,
+        )
+
+    async def do_final_quality() -> None:
+        await wait_refine()
+        if state.last_image is None or not state.last_prompt:
+            out.send(error("No image to re-render yet."))
+            return
+        if state.last_full_quality:
+            out.send(status("ready", "Already at full quality."))
+            return
+        full = (cfg.width, cfg.height)
+        if state.last_image.size == full:
+            # Same size, fewer steps: re-run the same seed with all steps (same composition).
+            await do_generate(state.last_prompt, seed=state.last_seed, model=state.last_model, final=True)
+            return
+        # Smaller preview: upscale it and refine at full size, keeping the composition.
+        init = state.last_image.resize(full, Image.Resampling.LANCZOS)
+        await do_generate(
+            state.last_prompt,
+            init_image=init,
+            strength=cfg.final_strength,
+            seed=state.last_seed,
+            model=state.last_model,
+            final=True,
+        )
 
     async def do_save_image() -> None:
+        # Right after a preview, save the refined image it turns into.
+        await wait_refine()
         if not state.last_image_id:
-            await _ws_send(ws, error("No image to save yet."))
+            out.send(error("No image to save yet."))
+            say("Nothing to save yet")
             return
         try:
-            await _ws_send(ws, status("saving", "Saving image..."))
+            out.send(status("saving", "Saving image..."))
             path = await asyncio.to_thread(copy_to_saved, cfg, state.last_image_id)
-            await _ws_send(ws, {"type": "saved", "id": state.last_image_id, "path": str(path)})
-            await _ws_send(ws, status("ready", "Saved."))
-            speak_async("Saved")
+            out.send({"type": "saved", "id": state.last_image_id, "path": str(path)})
+            out.send(status("ready", "Saved."))
+            say("Saved")
         except Exception as e:
-            await _ws_send(ws, error("Save failed.", str(e)))
-            await _ws_send(ws, status("ready", ""))
+            out.send(error("Save failed.", str(e)))
+            out.send(status("ready", ""))
 
-    await _ws_send(ws, status("idle", ""))
+    async def run_voice_command(cmd: ParsedVoiceCommand) -> None:
+        # Execute voice commands immediately (client will also suppress autogen).
+        if cmd.name == "save_image":
+            await do_save_image()
+            return
+        if cmd.name == "regenerate":
+            say("Regenerating")
+            await do_regenerate()
+            return
+        if cmd.name == "more_realistic":
+            say("More realistic")
+            await do_restyle("realistic")
+            return
+        if cmd.name == "more_abstract":
+            say("More abstract")
+            await do_restyle("abstract")
+            return
+        out.send(status("ready", ""))
+
+    out.send(status("idle", ""))
     await send_models()
-    await _ws_send(ws, {"type": "gallery", "items": list_gallery(cfg)})
+    out.send({"type": "gallery", "items": list_gallery(cfg)})
 
     try:
         while True:
@@ -257,9 +894,20 @@ async def handle_ws(cfg: Config, ws: WebSocket) -> None:
             if msg.get("type") == "websocket.disconnect":
                 break
 
+            if recorder is not None:
+                if msg.get("bytes") is not None:
+                    recorder.incoming_bytes(msg["bytes"])
+                elif msg.get("text"):
+                    recorder.incoming_text(msg["text"])
+
             if "bytes" in msg and msg["bytes"] is not None:
-                if state.recording:
-                    state.audio_pcm16.extend(msg["bytes"])
+                AUDIO_RECEIVED_BYTES.inc(len(msg["bytes"]), format=state.audio_format)
+                if state.recording and state.audio_decoder is not None:
+                    try:
+                        state.audio_pcm16.extend(state.audio_decoder.decode(msg["bytes"]))
+                    except Exception:
+                        # A corrupt frame costs a few ms of audio; never kill the session.
+                        pass
                 continue
 
             text = msg.get("text")
@@ -268,7 +916,7 @@ async def handle_ws(cfg: Config, ws: WebSocket) -> None:
             try:
                 data = json.loads(text)
             except Exception:
-                await _ws_send(ws, error("Invalid JSON message."))
+                out.send(error("Invalid JSON message."))
                 continue
 
             mtype = data.get("type")
@@ -278,10 +926,34 @@ async def handle_ws(cfg: Config, ws: WebSocket) -> None:
                 continue
 
             if mtype == "audio_start":
+                fmt = str(data.get("format") or "pcm16").lower()
+                try:
+                    # Clients stream at their device rate; the session buffer is always Whisper's rate.
+                    decoder = create_decoder(
+                        fmt,
+                        int(data.get("sample_rate") or WHISPER_SAMPLE_RATE),
+                        int(data.get("channels") or 1),
+                        target_rate=WHISPER_SAMPLE_RATE,
+                    )
+                except UnsupportedAudioFormat:
+                    out.send(error("Unsupported audio format.", fmt))
+                    continue
+                except ValueError as e:
+                    out.send(error("Unsupported sample rate.", str(e)))
+                    continue
                 state.audio_pcm16 = bytearray()
-                state.sample_rate = int(data.get("sample_rate") or 16000)
+                state.sample_rate = WHISPER_SAMPLE_RATE
+                state.audio_format = fmt
+                state.audio_decoder = decoder
                 state.recording = True
-                await _ws_send(ws, status("recording", "Listening..."))
+                # One trace per utterance, carried on into the generation it triggers.
+                state.trace_id = new_trace_id()
+                set_trace(state.trace_id)
+                state.utterance_start = time.perf_counter()
+                state.speech_end = state.final_sent_at = 0.0
+                out.send(status("recording", "Listening..."))
+                # Reload parked/unloaded models while the user is still talking.
+                _spawn(asyncio.to_thread(rt.memory.prepare, "stt", "sd"))
                 await start_partial_loop()
                 continue
 
@@ -289,88 +961,163 @@ async def handle_ws(cfg: Config, ws: WebSocket) -> None:
                 if not state.recording:
                     continue
                 state.recording = False
-                await stop_partial_loop()
-                await _ws_send(ws, status("transcribing", "Transcribing..."))
+                if state.audio_decoder is not None:
+                    try:
+                        state.audio_pcm16.extend(state.audio_decoder.flush())
+                    except Exception:
+                        pass
+                    state.audio_decoder = None
+                mark_speech_end()
+                with span("stt.partial_drain"):
+                    # A partial decode still running (or sleeping) finishes first.
+                    await stop_partial_loop()
+                out.send(status("transcribing", "Transcribing..."))
 
                 pcm = bytes(state.audio_pcm16)
                 state.audio_pcm16 = bytearray()
 
+                res = None
+                cmd = None
                 try:
-                    async with state.transcription_lock:
-                        res = await asyncio.to_thread(stt.transcribe_final, pcm, state.sample_rate)
+                    with span("stt.final") as stt_args:
+                        async with state.transcription_lock:
+                            duration_s = len(pcm) / 2 / max(1, state.sample_rate)
+                            stt_args["audio_s"] = round(duration_s, 2)
+                            if cfg.command_fast_path and duration_s <= cfg.command_max_utterance_s:
+                                # Short utterances are usually commands: try the cheap decode first.
+                                quick = await asyncio.to_thread(
+                                    rt.profiler.wrap("stt", stt.transcribe_partial), pcm, state.sample_rate
+                                )
+                                with span("command.parse"):
+                                    cmd = parse_voice_command(quick.text)
+                                if cmd is not None:
+                                    res = quick
+                                    stt_args["fast_path"] = True
+                            if res is None:
+                                res = await asyncio.to_thread(
+                                    rt.profiler.wrap("stt", stt.transcribe_final), pcm, state.sample_rate
+                                )
                 except Exception as e:
-                    await _ws_send(ws, error("Transcription failed.", str(e)))
-                    await _ws_send(ws, status("ready", ""))
+                    out.send(error("Transcription failed.", str(e)))
+                    out.send(status("ready", ""))
                     continue
 
                 final_text = res.text
-                await _ws_send(ws, {"type": "transcript_final", "text": final_text})
-
-                cmd = parse_voice_command(final_text)
                 if cmd is None:
-                    await _ws_send(ws, status("ready", ""))
-                    continue
+                    with span("command.parse"):
+                        cmd = parse_voice_command(final_text)
+                send_transcript_final(final_text, cmd)
 
-                # Execute voice commands immediately (client will also suppress autogen).
-                if cmd.name == "save_image":
-                    await do_save_image()
-                    continue
-                if cmd.name == "regenerate":
-                    await do_regenerate()
-                    continue
-                if cmd.name == "more_realistic":
-                    state.style = "realistic"
-                    await do_regenerate()
-                    continue
-                if cmd.name == "more_abstract":
-                    state.style = "abstract"
-                    await do_regenerate()
+                if cmd is None:
+                    out.send(status("ready", ""))
                     continue
 
-                await _ws_send(ws, status("ready", ""))
+                await run_voice_command(cmd)
                 continue
 
             if mtype == "generate":
                 prompt = str(data.get("prompt") or "")
-                await do_generate(prompt)
+                trace_id = str(data.get("trace_id") or "")
+                if trace_id and trace_id == state.trace_id and state.final_sent_at:
+                    # Auto-generate after the client's countdown: same trace as the utterance.
+                    set_trace(trace_id)
+                    TRACER.add("client.autogen_wait", state.final_sent_at, time.perf_counter())
+                    state.final_sent_at = 0.0
+                else:
+                    set_trace(new_trace_id())
+                model = str(data.get("model") or "")
+                if model:
+                    try:
+                        # Sticky: later voice-triggered generations use the picked model too.
+                        state.model = gen.resolve(model)
+                    except UnknownModel:
+                        out.send(error("Unknown model.", model))
+                        continue
+                await do_generate(prompt, two_pass=cfg.two_pass)
                 continue
 
             if mtype == "action":
                 name = str(data.get("name") or "")
+                set_trace(new_trace_id())
                 if name == "regenerate":
                     await do_regenerate()
                     continue
                 if name == "save_image":
                     await do_save_image()
                     continue
+                if name == "final_quality":
+                    await do_final_quality()
+                    continue
                 if name == "set_style":
                     val = str(data.get("value") or "none").lower()
                     if val in ("none", "realistic", "abstract"):
                         state.style = val
-                        await _ws_send(ws, status("ready", f"Style: {val}"))
+                        out.send(status("ready", f"Style: {val}"))
                     else:
-                        await _ws_send(ws, error("Unknown style.", val))
+                        out.send(error("Unknown style.", val))
                     continue
-                await _ws_send(ws, error("Unknown action.", name))
+                out.send(error("Unknown action.", name))
                 continue
 
-            await _ws_send(ws, error("Unknown message type.", str(mtype)))
+            out.send(error("Unknown message type.", str(mtype)))
 
     except WebSocketDisconnect:
         pass
     finally:
         state.recording = False
         await stop_partial_loop()
+        # Stop a background refine for a client that is gone.
+        state.bump_generation_token()
+        await out.close()
+        ACTIVE_SESSIONS.dec()
+        if recorder is not None:
+            recorder.close()
+        if out.dropped:
+            WS_DROPPED.inc(out.dropped, reason="backpressure")
+
+
+def app_from_env() -> FastAPI:
+    """App factory for uvicorn worker processes (`web_workers` > 1)."""
+    cfg = load_config()
+    _set_privacy_env_defaults(cfg)
+    return create_app(cfg)
 
 
 def main() -> None:
     cfg = load_config()
     _set_privacy_env_defaults(cfg)
+    if cfg.web_workers > 1 or cfg.model_server:
+        from .model_server import check_platform
+
+        check_platform()
 
     import uvicorn
 
-    app = create_app(cfg)
-    uvicorn.run(app, host=cfg.host, port=cfg.port, log_level="info")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    if cfg.web_workers <= 1:
+        uvicorn.run(create_app(cfg), host=cfg.host, port=cfg.port, log_level="info")
+        return
+
+    # Several web workers share one model server instead of each loading the models.
+    proc = None
+    if not cfg.model_server:
+        from .model_server import spawn
+
+        proc, address = spawn(cfg)
+        os.environ["SPEAKSEE_MODEL_SERVER"] = address  # inherited by the workers
+    try:
+        uvicorn.run(
+            "speaksee.server:app_from_env",
+            factory=True,
+            host=cfg.host,
+            port=cfg.port,
+            workers=cfg.web_workers,
+            log_level="info",
+        )
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
 
 
 if __name__ == "__main__":
@@ -2,25 +2,47 @@ from __future__ import annotations
 
 import asyncio
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
+
+from .audio_codec import AudioDecoder
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 
 @dataclass
 class SessionState:
     audio_pcm16: bytearray = field(default_factory=bytearray)
-    sample_rate: int = 16000
+    sample_rate: int = 16000  # of audio_pcm16 (decoders resample client audio to this)
+    audio_format: str = "pcm16"  # "pcm16" | "opus"
+    audio_decoder: Optional[AudioDecoder] = None
     recording: bool = False
 
+    # Tracing (see tracing.py): the current utterance's trace and its milestones (perf_counter).
+    trace_id: Optional[str] = None
+    utterance_start: float = 0.0
+    speech_end: float = 0.0
+    final_sent_at: float = 0.0
+
     style: str = "none"  # "none" | "realistic" | "abstract"
     last_prompt: Optional[str] = None
     last_negative_prompt: str = ""
 
     last_image_id: Optional[str] = None
+    # Kept in memory as the starting point for img2img refinement (style changes).
+    last_image: Optional["Image.Image"] = None
+    last_seed: Optional[int] = None
+    last_model: Optional[str] = None
+    last_full_quality: bool = True  # False after an adaptive (reduced) image
+
+    model: Optional[str] = None  # picked in the UI; None = Config.sd_model
 
     transcription_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
     generation_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
 
     generation_token: int = 0
+    # Background second pass of a two-pass generation; a new generation preempts it.
+    refine_task: Optional[asyncio.Task[None]] = None
 
     def bump_generation_token(self) -> int:
         self.generation_token += 1
@@ -0,0 +1,315 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import struct
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+
+from .config import Config
+
+
+log = logging.getLogger(__name__)
+
+MAGIC = b"SKSR1\n"
+# kind, seconds since the session started, payload length
+_HEADER = struct.Struct("<BdI")
+
+KIND_META = 0
+KIND_IN_TEXT = 1
+KIND_IN_BYTES = 2
+KIND_OUT_TEXT = 3
+
+# Outbound messages that mark progress through a session: replay waits for as many of these as
+# the recording had seen before sending the next client message (see `replay`).
+MILESTONE_TYPES = frozenset({"transcript_final", "gen_result", "saved"})
+# Differ between runs by nature (ids, timestamps, random seeds, progress granularity).
+_VOLATILE_FIELDS = frozenset(
+    {"id", "ts", "url", "seed", "trace_id", "path", "predicted_s", "queue_depth", "parent_id", "items"}
+)
+# Client messages that start the work behind each milestone (voice commands come via audio_stop).
+_TRIGGERS = {
+    "transcript_final": ("audio_start", "audio_stop"),
+    "gen_result": ("generate", "action", "audio_stop"),
+    "saved": ("action", "audio_stop"),
+}
+_NOT_DIFFED = frozenset({"gen_progress", "transcript_partial", "gallery", "models", "status", "tts"})
+
+
+@dataclass(frozen=True)
+class Record:
+    kind: int
+    t: float
+    data: Union[bytes, str]
+
+    def message(self) -> dict[str, Any]:
+        assert isinstance(self.data, str)
+        try:
+            msg = json.loads(self.data)
+        except ValueError:
+            return {}
+        return msg if isinstance(msg, dict) else {}
+
+
+class SessionRecorder:
+    """
+    Opt-in (`Config.session_record`) recording of one WebSocket session: every client message
+    (binary audio frames included) and every message sent back, each with its time since the
+    connection opened. Stored gzip-compressed in `data/logs/sessions/`; `speaksee-replay` plays
+    it back against a server.
+    """
+
+    def __init__(self, path: Path, meta: dict[str, Any]):
+        self.path = path
+        self._t0 = time.perf_counter()
+        self._file: Optional[gzip.GzipFile] = None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = gzip.open(path, "wb", compresslevel=6)  # type: ignore[assignment]
+        assert self._file is not None
+        self._file.write(MAGIC)
+        self._write(KIND_META, json.dumps(meta).encode("utf-8"))
+
+    @classmethod
+    def create(cls, cfg: Config) -> Optional["SessionRecorder"]:
+        if not cfg.session_record:
+            return None
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{uuid.uuid4().hex[:6]}.sksr.gz"
+        meta = {
+            "version": 1,
+            "started_at": time.time(),
+            "sd_model": cfg.sd_model,
+            "whisper_model": cfg.whisper_model,
+            "steps": cfg.steps,
+            "width": cfg.width,
+            "height": cfg.height,
+            "two_pass": cfg.two_pass,
+            "latency_target_s": cfg.latency_target_s,
+        }
+        try:
+            return cls(cfg.data_dir / "logs" / "sessions" / name, meta)
+        except OSError as e:
+            log.warning("session recording disabled: %s", e)
+            return None
+
+    def _write(self, kind: int, payload: bytes) -> None:
+        if self._file is None:
+            return
+        try:
+            self._file.write(_HEADER.pack(kind, time.perf_counter() - self._t0, len(payload)))
+            self._file.write(payload)
+        except (OSError, ValueError) as e:
+            log.warning("session recording stopped: %s", e)
+            self._file = None
+
+    def incoming_text(self, text: str) -> None:
+        self._write(KIND_IN_TEXT, text.encode("utf-8"))
+
+    def incoming_bytes(self, data: bytes) -> None:
+        self._write(KIND_IN_BYTES, bytes(data))
+
+    def outgoing(self, text: str) -> None:
+        self._write(KIND_OUT_TEXT, text.encode("utf-8"))
+
+    def close(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+
+def read_records(path: Path) -> Iterator[Record]:
+    with gzip.open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path}: not a speaksee session recording")
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return  # end (or a recording cut short by a crash)
+            kind, t, n = _HEADER.unpack(header)
+            payload = f.read(n)
+            if len(payload) < n:
+                return
+            yield Record(kind, t, payload if kind == KIND_IN_BYTES else payload.decode("utf-8"))
+
+
+# --- replay -------------------------------------------------------------------------------------
+
+
+def _triggered(records: list[Record]) -> list[tuple[dict[str, Any], float]]:
+    """Outbound messages with their delay after the client message that caused them."""
+    out: list[tuple[dict[str, Any], float]] = []
+    last_in: dict[str, float] = {}
+    latest = 0.0
+    for r in records:
+        if r.kind == KIND_IN_TEXT:
+            latest = r.t
+            last_in[str(r.message().get("type"))] = r.t
+        elif r.kind == KIND_OUT_TEXT:
+            msg = r.message()
+            triggers = _TRIGGERS.get(str(msg.get("type")))
+            start = max((last_in.get(t, 0.0) for t in triggers), default=0.0) if triggers else latest
+            out.append((msg, r.t - start))
+    return out
+
+
+def _stable(msg: dict[str, Any]) -> dict[str, Any]:
+    return {k: v for k, v in msg.items() if k not in _VOLATILE_FIELDS}
+
+
+def diff_sessions(recorded: list[Record], replayed: list[Record]) -> dict[str, Any]:
+    """
+    Compare the server's answers in two runs of the same client input: per message type, the k-th
+    message of each run is matched up; content (minus volatile fields) and latency after the
+    triggering client message are compared.
+    """
+    by_type: dict[str, list[list[tuple[dict[str, Any], float]]]] = {}
+    for run, records in enumerate((recorded, replayed)):
+        for msg, delay in _triggered(records):
+            slots = by_type.setdefault(str(msg.get("type")), [[], []])
+            slots[run].append((msg, delay))
+
+    counts: dict[str, dict[str, int]] = {}
+    mismatches: list[dict[str, Any]] = []
+    timings: list[dict[str, Any]] = []
+    for mtype, (a, b) in sorted(by_type.items()):
+        counts[mtype] = {"recorded": len(a), "replayed": len(b)}
+        if mtype in _NOT_DIFFED:
+            continue
+        for k, ((ma, da), (mb, db)) in enumerate(zip(a, b)):
+            if _stable(ma) != _stable(mb):
+                mismatches.append({"type": mtype, "n": k, "recorded": _stable(ma), "replayed": _stable(mb)})
+            if mtype in MILESTONE_TYPES:
+                timings.append({
+                    "type": mtype,
+                    "n": k,
+                    "recorded_ms": round(da * 1000, 1),
+                    "replayed_ms": round(db * 1000, 1),
+                    "delta_ms": round((db - da) * 1000, 1),
+                })
+    return {
+        "counts": counts,
+        "count_mismatches": [t for t, c in counts.items() if c["recorded"] != c["replayed"] and t not in _NOT_DIFFED],
+        "mismatches": mismatches,
+        "timings": timings,
+    }
+
+
+async def replay(
+    records: list[Record],
+    url: str,
+    *,
+    speed: float = 1.0,
+    sync: bool = True,
+    timeout_s: float = 120.0,
+    tail_s: float = 5.0,
+) -> list[Record]:
+    """
+    Send the recorded client messages to `url` with their original spacing divided by `speed`
+    (0 = no delays) and record what comes back. With `sync`, each client message also waits until
+    the server has produced as many milestone messages (MILESTONE_TYPES) as it had at that point in
+    the recording, so accelerated replays keep the original order of cause and effect.
+    """
+    import websockets  # installed with uvicorn[standard]
+
+    out: list[Record] = []
+    milestones = 0
+    progressed = asyncio.Event()
+    t0 = time.perf_counter()
+
+    async def reader(ws: Any) -> None:
+        nonlocal milestones
+        async for raw in ws:
+            if isinstance(raw, bytes):
+                continue
+            rec = Record(KIND_OUT_TEXT, time.perf_counter() - t0, raw)
+            out.append(rec)
+            if rec.message().get("type") in MILESTONE_TYPES:
+                milestones += 1
+                progressed.set()
+
+    async with websockets.connect(url, max_size=None) as ws:
+        task = asyncio.create_task(reader(ws))
+        seen_before = 0
+        prev_t = 0.0
+        for r in records:
+            if r.kind == KIND_OUT_TEXT:
+                msg = r.message()
+                if msg.get("type") in MILESTONE_TYPES:
+                    seen_before += 1
+                continue
+            if r.kind not in (KIND_IN_TEXT, KIND_IN_BYTES):
+                continue
+            if speed > 0 and r.t > prev_t:
+                await asyncio.sleep((r.t - prev_t) / speed)
+            prev_t = r.t
+            if sync and r.kind == KIND_IN_TEXT:
+                deadline = time.perf_counter() + timeout_s
+                while milestones < seen_before and time.perf_counter() < deadline:
+                    progressed.clear()
+                    try:
+                        await asyncio.wait_for(progressed.wait(), max(0.01, deadline - time.perf_counter()))
+                    except asyncio.TimeoutError:
+                        break
+            if r.kind == KIND_IN_TEXT:
+                out.append(Record(KIND_IN_TEXT, time.perf_counter() - t0, r.data))
+            await ws.send(r.data)
+        # Let the last answers arrive.
+        deadline = time.perf_counter() + timeout_s
+        while milestones < seen_before and time.perf_counter() < deadline:
+            progressed.clear()
+            try:
+                await asyncio.wait_for(progressed.wait(), max(0.01, deadline - time.perf_counter()))
+            except asyncio.TimeoutError:
+                break
+        await asyncio.sleep(tail_s / max(1.0, speed))
+        task.cancel()
+    return out
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="speaksee-replay",
+        description="Replay a recorded session (SPEAKSEE_SESSION_RECORD=1) and diff answers and timings.",
+    )
+    parser.add_argument("recording", type=Path)
+    parser.add_argument("--url", default="ws://127.0.0.1:7860/ws")
+    parser.add_argument("--speed", type=float, default=1.0, help="2 = twice as fast, 0 = no delays")
+    parser.add_argument("--no-sync", action="store_true", help="don't wait for the server's answers")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--out", type=Path, help="write the full report (JSON) here")
+    args = parser.parse_args(argv)
+
+    recorded = list(read_records(args.recording))
+    meta = next((r.message() for r in recorded if r.kind == KIND_META), {})
+    frames = sum(1 for r in recorded if r.kind == KIND_IN_BYTES)
+    print(f"replaying {args.recording.name}: {len(recorded)} records, {frames} audio frames "
+          f"({meta.get('sd_model', '?')}, {meta.get('whisper_model', '?')}) at {args.speed}x")
+
+    replayed = asyncio.run(
+        replay(recorded, args.url, speed=args.speed, sync=not args.no_sync, timeout_s=args.timeout)
+    )
+    report = {"recording": str(args.recording), "meta": meta, "speed": args.speed}
+    report.update(diff_sessions(recorded, replayed))
+
+    for t in report["timings"]:
+        print(f"{t['type']:<17} #{t['n']:<3} {t['recorded_ms']:>9.1f} ms -> {t['replayed_ms']:>9.1f} ms "
+              f"({t['delta_ms']:+.1f})")
+    for m in report["mismatches"]:
+        print(f"DIFF  {m['type']} #{m['n']}: {m['recorded']} != {m['replayed']}")
+    for t in report["count_mismatches"]:
+        print(f"COUNT {t}: {report['counts'][t]['recorded']} recorded, {report['counts'][t]['replayed']} replayed")
+    if args.out:
+        args.out.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 1 if report["mismatches"] or report["count_mismatches"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,7 +4,9 @@
   const autoListenEl = document.getElementById("autoListen");
   const genBtn = document.getElementById("genBtn");
   const regenBtn = document.getElementById("regenBtn");
+  const finalBtn = document.getElementById("finalBtn");
   const saveBtn = document.getElementById("saveBtn");
+  const modelSelect = document.getElementById("modelSelect");
   const statusText = document.getElementById("statusText");
   const modelText = document.getElementById("modelText");
   const phasePill = document.getElementById("phasePill");
@@ -41,6 +43,7 @@
 
   let autogenTimer = null;
   let autogenStartAt = 0;
+  let utteranceTraceId = null; // server trace of the last utterance, echoed by its auto-generate
   const AUTOGEN_DELAY_MS = 1200;
 
   // UI helpers
@@ -149,7 +152,7 @@
       const remain = Math.max(0, AUTOGEN_DELAY_MS - elapsed);
       if (remain <= 0) {
         cancelAutogen();
-        sendGenerate(promptBox.value);
+        sendGenerate(promptBox.value, utteranceTraceId);
         return;
       }
       countdownEl.textContent = "Auto-generate in " + (remain / 1000).toFixed(1) + "s (type to cancel)";
@@ -192,7 +195,10 @@
         return;
       }
       if (msg.type === "models") {
-        modelText.textContent = `STT: ${msg.stt_model} · SD: ${msg.image_model} · device: ${msg.device}`;
+        const mode = msg.memory_mode && msg.memory_mode !== "normal" ? ` (${msg.memory_mode}, low memory)` : "";
+        modelText.textContent = `STT: ${msg.stt_model} · SD: ${msg.image_model} · device: ${msg.device}${mode}`;
+        if (mic) mic.setServerFormats(msg.audio_formats);
+        setModelChoices(msg.image_models || [], msg.image_model);
         return;
       }
       if (msg.type === "transcript_partial") {
@@ -203,12 +209,26 @@
         const t = msg.text || "";
         liveText.textContent = t || "…";
         promptBox.value = t;
+        utteranceTraceId = msg.trace_id || null;
+        if (msg.command) {
+          // Server already ran the command (possibly from a partial, before we stopped streaming).
+          cancelAutogen();
+          stopRecording();
+          return;
+        }
         scheduleAutogen(t);
         return;
       }
       if (msg.type === "gen_started") {
-        setLoading(true);
-        progressText.textContent = "Starting…";
+        if (msg.quality === "final") {
+          // Refining the image on screen (two-pass preview or final quality): keep it visible.
+          progressWrap.classList.add("on");
+          progressFill.style.width = "0%";
+          progressText.textContent = "Refining…";
+        } else {
+          setLoading(true);
+          progressText.textContent = "Starting…";
+        }
         return;
       }
       if (msg.type === "gen_progress") {
@@ -217,13 +237,25 @@
         progressText.textContent = `Step ${msg.step}/${msg.total_steps}`;
         return;
       }
+      if (msg.type === "gen_preview") {
+        // Fast first pass; the refined gen_result replaces it shortly (progress stays up meanwhile).
+        mainImage.src = msg.url;
+        mainImage.onload = () => {
+          mainImage.classList.add("ready");
+          skeleton.classList.remove("on");
+        };
+        finalBtn.hidden = true;
+        return;
+      }
       if (msg.type === "gen_result") {
         mainImage.src = msg.url;
         mainImage.onload = () => {
           mainImage.classList.add("ready");
           setLoading(false);
         };
-        showToast("Generated");
+        // Offered while the image was rendered below full quality to meet the latency target.
+        finalBtn.hidden = !msg.final_available;
+        showToast(msg.quality === "final" ? "Final quality" : "Generated");
         return;
       }
       if (msg.type === "gallery") {
@@ -234,6 +266,11 @@
         showToast("Saved image");
         return;
       }
+      if (msg.type === "tts") {
+        // Spoken feedback rendered by the server (SPEAKSEE_TTS=browser); autoplay may be blocked.
+        new Audio(msg.audio).play().catch(() => {});
+        return;
+      }
       if (msg.type === "error") {
         showToast(msg.message || "Error");
         setPhase("ready", "");
@@ -293,12 +330,13 @@
       auto &&
       !recording &&
       !startInFlight &&
-      (phase === "idle" || phase === "ready") &&
+      (phase === "idle" || phase === "ready" || phase === "refining") &&
       document.activeElement !== promptBox &&
       !autogenTimer;
 
     const START_THRESH = 0.015; // tweakable
-    const START_FRAMES = 2;
+    // ~170 ms of speech before auto-start, whatever the capture frame size (20 ms worklet / ~85 ms fallback).
+    const START_FRAMES = Math.max(2, Math.round(170 / ((mic && mic.frameMs) || 85)));
     const COOLDOWN_MS = 350;
 
     if (canAutoStart) {
@@ -397,12 +435,32 @@
     }
   });
 
+  function setModelChoices(ids, current) {
+    // Only worth a control when the server offers more than one model.
+    modelSelect.hidden = ids.length < 2;
+    const known = Array.from(modelSelect.options).map((o) => o.value).join("\n");
+    if (known !== ids.join("\n")) {
+      modelSelect.textContent = "";
+      for (const id of ids) {
+        const opt = document.createElement("option");
+        opt.value = id;
+        opt.textContent = id.split("/").pop();
+        opt.title = id;
+        modelSelect.appendChild(opt);
+      }
+    }
+    if (current) modelSelect.value = current;
+  }
+
   // Actions
-  function sendGenerate(text) {
+  function sendGenerate(text, traceId) {
     const prompt = (text || "").trim();
     if (!prompt) return;
     if (!ws || ws.readyState !== WebSocket.OPEN) return;
-    ws.send(JSON.stringify({ type: "generate", prompt }));
+    const msg = { type: "generate", prompt };
+    if (!modelSelect.hidden && modelSelect.value) msg.model = modelSelect.value;
+    if (traceId) msg.trace_id = traceId;
+    ws.send(JSON.stringify(msg));
   }
   function sendAction(name, value) {
     if (!ws || ws.readyState !== WebSocket.OPEN) return;
@@ -413,6 +471,7 @@
 
   genBtn.addEventListener("click", () => sendGenerate(promptBox.value));
   regenBtn.addEventListener("click", () => sendAction("regenerate"));
+  finalBtn.addEventListener("click", () => sendAction("final_quality"));
   saveBtn.addEventListener("click", () => sendAction("save_image"));
 
   // Keyboard shortcuts
@@ -426,6 +485,7 @@
       ae &&
       (ae.tagName === "TEXTAREA" ||
         ae.tagName === "INPUT" ||
+        ae.tagName === "SELECT" ||
         ae.isContentEditable);
 
     if (e.key === "Enter" && (e.metaKey || e.ctrlKey)) {
@@ -471,6 +531,10 @@
       sendAction("save_image");
       return;
     }
+    if ((e.key === "f" || e.key === "F") && !finalBtn.hidden) {
+      sendAction("final_quality");
+      return;
+    }
   });
 
   window.addEventListener("keyup", (e) => {
@@ -1,9 +1,12 @@
 // Microphone capture + PCM16 streaming to the app WebSocket.
+// Capture runs in an AudioWorklet (capture-worklet.js) where available, with a ScriptProcessorNode
+// fallback for older browsers.
 // The mic device stays enabled after permission is granted, while audio streaming to the server
 // is toggled per utterance (VAD/push-to-talk) to support "open the URL and speak".
 (function () {
   const TARGET_SR = 16000;
   const PRE_ROLL_MS = 320; // audio we keep before VAD starts streaming
+  const FRAME_MS = 20;     // AudioWorklet frame size
 
   function downsampleBuffer(buffer, inSampleRate, outSampleRate) {
     if (outSampleRate === inSampleRate) return buffer;
@@ -35,12 +38,33 @@
     return out;
   }
 
+  // Opus uplink (~3 KB/s instead of ~32 KB/s of raw PCM16) via WebCodecs, when the browser has it.
+  const OPUS_CONFIG = {
+    codec: "opus",
+    sampleRate: TARGET_SR,
+    numberOfChannels: 1,
+    bitrate: 24000,
+    opus: { frameDuration: 20000 },
+  };
+
+  async function opusEncoderSupported() {
+    if (typeof window.AudioEncoder !== "function" || typeof window.AudioData !== "function") return false;
+    try {
+      const res = await window.AudioEncoder.isConfigSupported(OPUS_CONFIG);
+      return !!(res && res.supported);
+    } catch (_) {
+      return false;
+    }
+  }
+
   class MicStreamer {
     constructor() {
       this.stream = null;
       this.audioCtx = null;
       this.source = null;
-      this.processor = null;
+      this.processor = null;   // AudioWorkletNode, or ScriptProcessorNode fallback
+      this.workletNode = null;
+      this.frameMs = FRAME_MS; // duration of one onRms() frame
       this.zeroGain = null;
       this.ws = null;
       this.onRms = null;
@@ -48,6 +72,10 @@
       this.enabled = false;   // device/audio graph active
       this.streaming = false; // sending audio to server
 
+      this.serverFormats = ["pcm16"]; // advertised by the server in the "models" message
+      this.encoder = null;            // WebCodecs AudioEncoder while streaming Opus
+      this._encTimestampUs = 0;
+
       this._preRoll = [];
       this._preRollBytes = 0;
       this._preRollMaxBytes = Math.floor((TARGET_SR * 2 * PRE_ROLL_MS) / 1000);
@@ -57,6 +85,136 @@
       this.ws = ws;
     }
 
+    setServerFormats(formats) {
+      this.serverFormats = Array.isArray(formats) && formats.length ? formats : ["pcm16"];
+    }
+
+    _sendPcm16(pcm16) {
+      if (!this.ws || this.ws.readyState !== WebSocket.OPEN) return;
+      if (!this.encoder) {
+        this.ws.send(pcm16.buffer);
+        return;
+      }
+      const data = new AudioData({
+        format: "s16",
+        sampleRate: TARGET_SR,
+        numberOfFrames: pcm16.length,
+        numberOfChannels: 1,
+        timestamp: this._encTimestampUs,
+        data: pcm16,
+      });
+      this._encTimestampUs += Math.round((pcm16.length * 1e6) / TARGET_SR);
+      try { this.encoder.encode(data); } finally { data.close(); }
+    }
+
+    async _startEncoder() {
+      if (!this.serverFormats.includes("opus") || !(await opusEncoderSupported())) return "pcm16";
+      try {
+        this.encoder = new AudioEncoder({
+          output: (chunk) => {
+            const buf = new ArrayBuffer(chunk.byteLength);
+            chunk.copyTo(buf);
+            if (this.ws && this.ws.readyState === WebSocket.OPEN) this.ws.send(buf);
+          },
+          error: () => {},
+        });
+        this.encoder.configure(OPUS_CONFIG);
+        this._encTimestampUs = 0;
+        return "opus";
+      } catch (_) {
+        this.encoder = null;
+        return "pcm16";
+      }
+    }
+
+    async _stopEncoder() {
+      const enc = this.encoder;
+      if (!enc) return;
+      // Flush so trailing packets reach the server before audio_stop.
+      try { await enc.flush(); } catch (_) {}
+      try { enc.close(); } catch (_) {}
+      this.encoder = null;
+    }
+
+    // Called once per captured frame with PCM16 at TARGET_SR. Returns true if the buffer was
+    // retained (pre-roll), in which case it is recycled later when evicted.
+    _onFrame(pcm16, rms) {
+      // RMS for VAD/silence detection (handled in app.js).
+      if (this.onRms) {
+        try { this.onRms(rms); } catch (_) {}
+      }
+
+      if (this.streaming && this.ws && this.ws.readyState === WebSocket.OPEN) {
+        this._sendPcm16(pcm16);
+        return false;
+      }
+      // Keep a small pre-roll so we don't miss the first syllable when VAD triggers.
+      this._preRoll.push(pcm16.buffer);
+      this._preRollBytes += pcm16.byteLength;
+      while (this._preRollBytes > this._preRollMaxBytes && this._preRoll.length > 0) {
+        const b = this._preRoll.shift();
+        if (b) {
+          this._preRollBytes -= b.byteLength || 0;
+          this._recycle(b);
+        }
+      }
+      return true;
+    }
+
+    _recycle(buf) {
+      // Hand worklet frame buffers back to its pool (no-op for the ScriptProcessor path).
+      if (!this.workletNode) return;
+      try { this.workletNode.port.postMessage(buf, [buf]); } catch (_) {}
+    }
+
+    async _createWorkletProcessor() {
+      // Preferred path: resampling + RMS run on the audio thread, 20 ms frames, pooled buffers.
+      if (!this.audioCtx.audioWorklet || typeof window.AudioWorkletNode !== "function") return false;
+      try {
+        await this.audioCtx.audioWorklet.addModule("/static/capture-worklet.js");
+        const node = new AudioWorkletNode(this.audioCtx, "speaksee-capture", {
+          numberOfInputs: 1,
+          numberOfOutputs: 1,
+          outputChannelCount: [1],
+          processorOptions: { targetSampleRate: TARGET_SR, frameSamples: (TARGET_SR * FRAME_MS) / 1000 },
+        });
+        node.port.onmessage = (e) => {
+          const msg = e.data;
+          if (!this.enabled || !this.audioCtx) {
+            this._recycle(msg.pcm);
+            return;
+          }
+          if (!this._onFrame(new Int16Array(msg.pcm), msg.rms)) this._recycle(msg.pcm);
+        };
+        this.workletNode = node;
+        this.processor = node;
+        this.frameMs = FRAME_MS;
+        return true;
+      } catch (_) {
+        this.workletNode = null;
+        return false;
+      }
+    }
+
+    _createScriptProcessor() {
+      // Fallback: ScriptProcessorNode is deprecated but widely supported and simplest for raw PCM.
+      const bufferSize = 4096;
+      this.processor = this.audioCtx.createScriptProcessor(bufferSize, 1, 1);
+      this.frameMs = (bufferSize * 1000) / this.audioCtx.sampleRate;
+
+      this.processor.onaudioprocess = (e) => {
+        if (!this.enabled || !this.audioCtx) return;
+        const input = e.inputBuffer.getChannelData(0);
+
+        let sum = 0;
+        for (let i = 0; i < input.length; i++) sum += input[i] * input[i];
+        const rms = Math.sqrt(sum / input.length);
+
+        const down = downsampleBuffer(input, this.audioCtx.sampleRate, TARGET_SR);
+        this._onFrame(floatTo16BitPCM(down), rms);
+      };
+    }
+
     async enable() {
       if (this.enabled) return;
       if (!navigator.mediaDevices || !navigator.mediaDevices.getUserMedia) {
@@ -78,38 +236,7 @@
       }
       this.source = this.audioCtx.createMediaStreamSource(this.stream);
 
-      // ScriptProcessorNode is deprecated but widely supported and simplest for raw PCM.
-      const bufferSize = 4096;
-      this.processor = this.audioCtx.createScriptProcessor(bufferSize, 1, 1);
-
-      this.processor.onaudioprocess = (e) => {
-        if (!this.enabled || !this.audioCtx) return;
-        const input = e.inputBuffer.getChannelData(0);
-
-        // RMS for VAD/silence detection (handled in app.js).
-        let sum = 0;
-        for (let i = 0; i < input.length; i++) sum += input[i] * input[i];
-        const rms = Math.sqrt(sum / input.length);
-        if (this.onRms) {
-          try { this.onRms(rms); } catch (_) {}
-        }
-
-        const down = downsampleBuffer(input, this.audioCtx.sampleRate, TARGET_SR);
-        const pcm16 = floatTo16BitPCM(down);
-
-        if (this.streaming && this.ws && this.ws.readyState === WebSocket.OPEN) {
-          this.ws.send(pcm16.buffer);
-        } else {
-          // Keep a small pre-roll so we don't miss the first syllable when VAD triggers.
-          this._preRoll.push(pcm16.buffer);
-          this._preRollBytes += pcm16.byteLength;
-          while (this._preRollBytes > this._preRollMaxBytes && this._preRoll.length > 0) {
-            const b = this._preRoll.shift();
-            if (b) this._preRollBytes -= b.byteLength || 0;
-          }
-        }
-      };
-
+      if (!(await this._createWorkletProcessor())) this._createScriptProcessor();
       this.source.connect(this.processor);
       // Keep the processor alive without routing audio to speakers (avoid echo).
       this.zeroGain = this.audioCtx.createGain();
@@ -138,6 +265,7 @@
       this.audioCtx = null;
       this.source = null;
       this.processor = null;
+      this.workletNode = null;
       this.zeroGain = null;
       this._preRoll = [];
       this._preRollBytes = 0;
@@ -151,13 +279,15 @@
         try { await this.audioCtx.resume(); } catch (_) {}
       }
 
+      const format = await this._startEncoder();
       this.streaming = true;
-      this.ws.send(JSON.stringify({ type: "audio_start", sample_rate: TARGET_SR, format: "pcm16", channels: 1 }));
+      this.ws.send(JSON.stringify({ type: "audio_start", sample_rate: TARGET_SR, format, channels: 1 }));
 
       // Flush pre-roll (best-effort).
       try {
         for (const b of this._preRoll) {
-          if (this.ws && this.ws.readyState === WebSocket.OPEN) this.ws.send(b);
+          this._sendPcm16(new Int16Array(b));
+          this._recycle(b);
         }
       } catch (_) {}
       this._preRoll = [];
@@ -167,6 +297,7 @@
     async stopStreaming() {
       if (!this.streaming) return;
       this.streaming = false;
+      await this._stopEncoder();
       try {
         if (this.ws && this.ws.readyState === WebSocket.OPEN) {
           this.ws.send(JSON.stringify({ type: "audio_stop" }));
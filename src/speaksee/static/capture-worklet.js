@@ -0,0 +1,109 @@
+// AudioWorklet capture: low-pass resample the mic to 16 kHz off the main thread and post fixed
+// 20 ms PCM16 frames (plus their RMS) to MicStreamer. Frame buffers are pooled: the main thread
+// transfers each buffer back once it is done with it, so steady-state capture allocates nothing.
+const TAPS = 32;    // FIR length per output sample
+const HALF = TAPS / 2;
+const PHASES = 128; // fractional-delay resolution of the polyphase table
+const POOL_SIZE = 16;
+
+function blackman(x) {
+  // x in [-1, 1]
+  if (x <= -1 || x >= 1) return 0;
+  const a = Math.PI * (x + 1);
+  return 0.42 - 0.5 * Math.cos(a) + 0.08 * Math.cos(2 * a);
+}
+
+function sinc(x) {
+  if (x === 0) return 1;
+  const px = Math.PI * x;
+  return Math.sin(px) / px;
+}
+
+class SpeakSeeCaptureProcessor extends AudioWorkletProcessor {
+  constructor(options) {
+    super();
+    const opts = (options && options.processorOptions) || {};
+    this.outRate = opts.targetSampleRate || 16000;
+    this.frameSamples = opts.frameSamples || Math.round(this.outRate / 50);
+
+    // `sampleRate` is the AudioContext rate (global in AudioWorkletGlobalScope).
+    this.step = sampleRate / this.outRate;
+    // Anti-aliasing cutoff a bit under the output Nyquist, relative to the input rate.
+    const cutoff = Math.min(1, this.outRate / sampleRate) * 0.92;
+    this.table = new Float32Array((PHASES + 1) * TAPS);
+    for (let p = 0; p <= PHASES; p++) {
+      let sum = 0;
+      for (let k = 0; k < TAPS; k++) {
+        const d = k - HALF + 1 - p / PHASES;
+        const h = cutoff * sinc(cutoff * d) * blackman(d / HALF);
+        this.table[p * TAPS + k] = h;
+        sum += h;
+      }
+      // Unity DC gain for every phase.
+      for (let k = 0; k < TAPS; k++) this.table[p * TAPS + k] /= sum;
+    }
+
+    this.hist = new Float32Array(TAPS + 1024);
+    this.histLen = TAPS; // start with zeros so the first output has full history
+    this.pos = HALF;     // next output position, in input samples within `hist`
+
+    this.pool = [];
+    for (let i = 0; i < POOL_SIZE; i++) this.pool.push(new ArrayBuffer(this.frameSamples * 2));
+    this.frame = null;
+    this.frameLen = 0;
+    this.sumSq = 0;
+
+    this.port.onmessage = (e) => {
+      const buf = e.data;
+      if (buf instanceof ArrayBuffer && buf.byteLength === this.frameSamples * 2) this.pool.push(buf);
+    };
+  }
+
+  _emit(sample) {
+    if (this.frame === null) {
+      this.frame = new Int16Array(this.pool.length ? this.pool.pop() : new ArrayBuffer(this.frameSamples * 2));
+      this.frameLen = 0;
+      this.sumSq = 0;
+    }
+    const s = sample < -1 ? -1 : sample > 1 ? 1 : sample;
+    this.frame[this.frameLen++] = s < 0 ? s * 0x8000 : s * 0x7fff;
+    this.sumSq += s * s;
+    if (this.frameLen === this.frameSamples) {
+      const buf = this.frame.buffer;
+      this.port.postMessage({ pcm: buf, rms: Math.sqrt(this.sumSq / this.frameSamples) }, [buf]);
+      this.frame = null;
+    }
+  }
+
+  process(inputs) {
+    const input = inputs[0] && inputs[0][0];
+    if (!input) return true;
+
+    const hist = this.hist;
+    hist.set(input, this.histLen);
+    this.histLen += input.length;
+
+    const table = this.table;
+    while (this.pos + HALF < this.histLen) {
+      const base = Math.floor(this.pos);
+      const phase = Math.round((this.pos - base) * PHASES);
+      const off = phase * TAPS;
+      const start = base - HALF + 1;
+      let acc = 0;
+      for (let k = 0; k < TAPS; k++) acc += hist[start + k] * table[off + k];
+      this._emit(acc);
+      this.pos += this.step;
+    }
+
+    // Drop consumed history, keeping the taps the next output still needs.
+    const drop = Math.floor(this.pos) - HALF;
+    if (drop > 0) {
+      hist.copyWithin(0, drop, this.histLen);
+      this.histLen -= drop;
+      this.pos -= drop;
+    }
+    return true;
+  }
+}
+
+registerProcessor("speaksee-capture", SpeakSeeCaptureProcessor);
@@ -1,6 +1,8 @@
 from __future__ import annotations
 
+import logging
 import os
+import threading
 import time
 from dataclasses import dataclass
 from pathlib import Path
@@ -9,6 +11,17 @@ from typing import Optional
 import numpy as np
 
 from .config import Config
+from .hardware import select_device
+from .metrics import MODEL_LOAD_SECONDS, STT_RTF, STT_SECONDS
+from .model_store import ModelEntry, ModelStore
+from .resample import resample_pcm16
+from .tracing import span
+
+
+log = logging.getLogger(__name__)
+
+# Whisper models operate on 16kHz mono audio.
+WHISPER_SAMPLE_RATE = 16000
 
 
 @dataclass(frozen=True)
@@ -17,36 +30,90 @@ class SttResult:
 
 
 class SpeechToText:
-    def __init__(self, cfg: Config):
+    def __init__(self, cfg: Config, store: Optional[ModelStore] = None):
         self._cfg = cfg
+        self._store = store or ModelStore(cfg)
         self._model = None
         self._model_device = None
+        self._model_bytes = 0  # on-disk weight size, a close proxy for resident size
 
-    def _select_device(self) -> str:
-        # faster-whisper supports cpu and cuda.
-        pref = self._cfg.device_preference
-        if pref == "cuda":
-            try:
-                import torch
+        # Shared by all connections. The lock guards loading and residency only; decodes run
+        # concurrently and are counted so the memory manager never parks/unloads a model in use
+        # (it never waits for the lock either).
+        self._lock = threading.RLock()
+        self._users = 0
+        self._last_used = 0.0
+        self._parked = False  # weights moved to host RAM (CTranslate2 unload_model(to_cpu=True))
 
-                if torch.cuda.is_available():
-                    return "cuda"
-            except Exception:
-                return "cpu"
+    def _select_device(self) -> str:
+        # faster-whisper supports cpu and cuda (only when asked for explicitly).
+        if self._cfg.device_preference == "cuda":
+            return select_device("cuda", supported=("cuda",))
         return "cpu"
 
     def _ensure_model(self) -> None:
-        if self._model is not None:
-            return
+        with self._lock:
+            if self._model is not None:
+                # Parked/unloaded by the memory manager: CTranslate2 reloads in place.
+                ct2 = getattr(self._model, "model", None)
+                if ct2 is not None and not getattr(ct2, "model_is_loaded", True):
+                    ct2.load_model()
+                    self._parked = False
+                return
+            with MODEL_LOAD_SECONDS.time(model=f"stt:{self._cfg.whisper_model}"), span("stt.load"):
+                self._load_model()
+
+    @property
+    def download_root(self) -> Path:
+        return Path(self._cfg.hf_home) / "whisper"
+
+    @staticmethod
+    def _compute_type(device: str) -> str:
+        return "float16" if device == "cuda" else "int8"
+
+    def _resolve_local(self, local_files_only: bool = True) -> Path:
+        path = Path(self._cfg.whisper_model)
+        if path.is_dir():
+            return path
+        from faster_whisper.utils import download_model
+
+        return Path(
+            download_model(
+                self._cfg.whisper_model,
+                local_files_only=local_files_only,
+                cache_dir=str(self.download_root),
+            )
+        )
 
+    def prefetch(self) -> ModelEntry:
+        """Download the model (without loading it) and record its snapshot."""
+        device = self._select_device()
+        path = self._resolve_local(local_files_only=False)
+        return self._store.record(
+            "stt", self._cfg.whisper_model, path, dtype=self._compute_type(device), device=device
+        )
+
+    def _load_model(self) -> None:
         from faster_whisper import WhisperModel  # heavy import, keep lazy
 
         device = self._select_device()
-        compute_type = "float16" if device == "cuda" else "int8"
+        compute_type = self._compute_type(device)
 
-        download_root = Path(self._cfg.hf_home) / "whisper"
+        download_root = self.download_root
         download_root.mkdir(parents=True, exist_ok=True)
 
+        # The snapshot that loaded last time (model store manifest): load the directory directly.
+        entry = self._store.get("stt", self._cfg.whisper_model)
+        if entry is not None:
+            try:
+                self._model = WhisperModel(entry.path, device=device, compute_type=compute_type)
+                self._model_device = device
+                self._model_bytes = self._weights_size(Path(entry.path))
+                return
+            except Exception as e:
+                log.warning("recorded whisper snapshot failed to load (%s); resolving again", e)
+                self._store.forget("stt", self._cfg.whisper_model)
+
         # Prefer local-only first; fall back to auto-download if missing.
         try:
             self._model = WhisperModel(
@@ -65,22 +132,87 @@ class SpeechToText:
                 local_files_only=False,
             )
         self._model_device = device
+        try:
+            path = self._resolve_local()
+        except Exception:
+            path = None
+        self._model_bytes = self._weights_size(path)
+        if path is not None:
+            try:
+                self._store.record(
+                    "stt", self._cfg.whisper_model, path, dtype=compute_type, device=device
+                )
+            except Exception as e:
+                log.warning("could not record whisper snapshot: %s", e)
 
     @staticmethod
-    def _pcm16_to_float32(pcm16: bytes) -> np.ndarray:
+    def _weights_size(path: Optional[Path]) -> int:
+        if path is None:
+            return 0
+        try:
+            return sum(f.stat().st_size for f in path.glob("*.bin"))
+        except Exception:
+            return 0
+
+    @staticmethod
+    def _pcm16_to_float32(pcm16: bytes, sample_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
         if not pcm16:
             return np.zeros((0,), dtype=np.float32)
+        if sample_rate and sample_rate != WHISPER_SAMPLE_RATE:
+            pcm16 = resample_pcm16(pcm16, sample_rate, WHISPER_SAMPLE_RATE)
         a = np.frombuffer(pcm16, dtype=np.int16).astype(np.float32)
         return a / 32768.0
 
+    def _observe(self, kind: str, pcm16: bytes, sample_rate: int, t0: float) -> None:
+        elapsed = time.perf_counter() - t0
+        STT_SECONDS.observe(elapsed, kind=kind)
+        audio_s = len(pcm16) / 2 / max(1, sample_rate or WHISPER_SAMPLE_RATE)
+        if audio_s > 0:
+            STT_RTF.observe(elapsed / audio_s, kind=kind)
+
+    def _acquire(self):
+        """Load the model if needed and mark it in use until `_release`; returns the model."""
+        with self._lock:
+            self._ensure_model()  # load time is reported separately
+            self._users += 1
+            return self._model
+
+    def _release(self) -> None:
+        with self._lock:
+            self._users -= 1
+            self._last_used = time.monotonic()
+
     def transcribe_final(self, pcm16: bytes, sample_rate: int) -> SttResult:
-        self._ensure_model()
-        audio = self._pcm16_to_float32(pcm16)
+        model = self._acquire()
+        try:
+            t0 = time.perf_counter()
+            with span("stt.decode", kind="final", audio_bytes=len(pcm16)):
+                result = self._transcribe_final(model, pcm16, sample_rate)
+            self._observe("final", pcm16, sample_rate, t0)
+            return result
+        finally:
+            self._release()
+
+    def transcribe_partial(self, pcm16: bytes, sample_rate: int) -> SttResult:
+        """
+        Cheap partial transcript for live preview. Uses a smaller decode.
+        """
+        model = self._acquire()
+        try:
+            t0 = time.perf_counter()
+            with span("stt.decode", kind="partial", audio_bytes=len(pcm16)):
+                result = self._transcribe_partial(model, pcm16, sample_rate)
+            self._observe("partial", pcm16, sample_rate, t0)
+            return result
+        finally:
+            self._release()
+
+    def _transcribe_final(self, model, pcm16: bytes, sample_rate: int) -> SttResult:
+        audio = self._pcm16_to_float32(pcm16, sample_rate)
         if audio.size == 0:
             return SttResult(text="")
 
-        # NOTE: audio from the client is expected to already be 16kHz mono PCM16.
-        segments, _info = self._model.transcribe(  # type: ignore[operator]
+        segments, _info = model.transcribe(
             audio,
             beam_size=5,
             best_of=5,
@@ -89,16 +221,12 @@ class SpeechToText:
         text = "".join(seg.text for seg in segments).strip()
         return SttResult(text=text)
 
-    def transcribe_partial(self, pcm16: bytes, sample_rate: int) -> SttResult:
-        """
-        Cheap partial transcript for live preview. Uses a smaller decode.
-        """
-        self._ensure_model()
-        audio = self._pcm16_to_float32(pcm16)
+    def _transcribe_partial(self, model, pcm16: bytes, sample_rate: int) -> SttResult:
+        audio = self._pcm16_to_float32(pcm16, sample_rate)
         if audio.size == 0:
             return SttResult(text="")
 
-        segments, _info = self._model.transcribe(  # type: ignore[operator]
+        segments, _info = model.transcribe(
             audio,
             beam_size=1,
             best_of=1,
@@ -112,3 +240,66 @@ class SpeechToText:
         self._ensure_model()
         return str(self._model_device or "cpu")
 
+    @property
+    def loaded_device(self) -> Optional[str]:
+        """Device of the loaded model, or None; unlike `device`, never loads it."""
+        return None if self.residency == "unloaded" else str(self._model_device or "cpu")
+
+    # --- memory manager hooks (see memory.ManagedModel) --------------------------------------
+
+    def _ct2(self):
+        return getattr(self._model, "model", None) if self._model is not None else None
+
+    @property
+    def residency(self) -> str:
+        ct2 = self._ct2()
+        if ct2 is None:
+            return "unloaded"
+        if not getattr(ct2, "model_is_loaded", True):
+            return "host" if self._parked else "unloaded"
+        if getattr(ct2, "device", self._model_device) == "cuda":
+            return "device"
+        return "host"
+
+    @property
+    def last_used(self) -> float:
+        return self._last_used
+
+    def footprint(self) -> tuple[int, int]:
+        residency = self.residency
+        if residency == "device":
+            return self._model_bytes, 0
+        if residency == "host":
+            return 0, self._model_bytes
+        return 0, 0
+
+    def park(self) -> bool:
+        ct2 = self._ct2()
+        if ct2 is None or self.residency != "device" or not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self._users:
+                return False
+            ct2.unload_model(to_cpu=True)
+            self._parked = True
+            return True
+        finally:
+            self._lock.release()
+
+    def unload(self) -> bool:
+        ct2 = self._ct2()
+        if ct2 is None or self.residency == "unloaded" or not self._lock.acquire(blocking=False):
+            return False
+        try:
+            if self._users:
+                return False
+            ct2.unload_model()
+            self._parked = False
+            return True
+        finally:
+            self._lock.release()
+
+    def warm(self) -> None:
+        self._ensure_model()
+        self._last_used = time.monotonic()
+
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from .config import Config
+
+
+log = logging.getLogger(__name__)
+
+# perf_counter() -> wall clock, fixed once so span timestamps from all threads line up.
+_EPOCH_OFFSET = time.time() - time.perf_counter()
+
+# The trace (utterance / generation) the current task or thread works for. asyncio.to_thread()
+# and create_task() copy the context, so thread-pool work lands in the right trace on its own.
+_current: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("speaksee_trace", default=None)
+
+
+@dataclass(frozen=True)
+class Span:
+    trace_id: str
+    name: str
+    start: float  # time.perf_counter()
+    end: float
+    thread_id: int
+    thread_name: str
+    args: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration_s(self) -> float:
+        return self.end - self.start
+
+    def as_json(self) -> dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "ts": round(self.start + _EPOCH_OFFSET, 6),
+            "dur_ms": round(self.duration_s * 1000, 3),
+            "thread": self.thread_name,
+            "args": self.args,
+        }
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace() -> Optional[str]:
+    return _current.get()
+
+
+def set_trace(trace_id: Optional[str]) -> None:
+    """Make `trace_id` current for this task (and the tasks / threads it starts from now on)."""
+    _current.set(trace_id)
+
+
+class Tracer:
+    """
+    Span recorder for end-to-end request timing: the last `Config.trace_buffer` spans stay in
+    memory (exported as Chrome trace events, see `chrome_trace`), and with `Config.trace_log` every
+    span is also appended to `data/logs/traces.jsonl`.
+    """
+
+    def __init__(self, capacity: int = 5000, log_path: Optional[Path] = None):
+        self._lock = threading.Lock()
+        self._spans: deque[Span] = deque(maxlen=max(1, capacity))
+        self.enabled = capacity > 0
+        self._log_path = log_path
+
+    def configure(self, cfg: Config) -> None:
+        with self._lock:
+            self.enabled = cfg.trace_buffer > 0
+            self._spans = deque(self._spans, maxlen=max(1, cfg.trace_buffer))
+            self._log_path = cfg.data_dir / "logs" / "traces.jsonl" if cfg.trace_log else None
+            if self._log_path is not None:
+                self._log_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def add(
+        self, name: str, start: float, end: float, *, trace_id: Optional[str] = None, **args: Any
+    ) -> None:
+        """Record a span measured elsewhere (`start` / `end` from time.perf_counter())."""
+        trace_id = trace_id or _current.get()
+        if not self.enabled or trace_id is None:
+            return
+        t = threading.current_thread()
+        self._append(Span(trace_id, name, start, end, t.ident or 0, t.name, args))
+
+    def _append(self, sp: Span) -> None:
+        with self._lock:
+            self._spans.append(sp)
+            if self._log_path is not None:
+                try:
+                    with self._log_path.open("a", encoding="utf-8") as f:
+                        f.write(json.dumps(sp.as_json(), default=str) + "\n")
+                except OSError as e:
+                    log.warning("trace log disabled: %s", e)
+                    self._log_path = None
+
+    @contextmanager
+    def span(self, name: str, **args: Any) -> Iterator[dict[str, Any]]:
+        """
+        Time the block as a span of the current trace; a no-op outside a trace. The yielded dict
+        can be filled with more args while the block runs.
+        """
+        trace_id = _current.get()
+        if not self.enabled or trace_id is None:
+            yield args
+            return
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = type(e).__name__
+            raise
+        finally:
+            self.add(name, start, time.perf_counter(), trace_id=trace_id, **args)
+
+    def export(self, trace_id: str, since: float) -> list[dict[str, Any]]:
+        """
+        Spans of `trace_id` that started at or after `since` (perf_counter), with wall-clock
+        times, for another process to `merge` (the model server hands its spans to the web tier).
+        """
+        return [
+            {
+                "name": sp.name,
+                "start": sp.start + _EPOCH_OFFSET,
+                "end": sp.end + _EPOCH_OFFSET,
+                "thread_id": sp.thread_id,
+                "thread_name": sp.thread_name,
+                "args": sp.args,
+            }
+            for sp in self.spans(trace_id)
+            if sp.start >= since
+        ]
+
+    def merge(self, exported: list[dict[str, Any]], *, trace_id: str, thread_prefix: str = "") -> None:
+        """Record spans from another process's `export` as part of `trace_id`."""
+        if not self.enabled:
+            return
+        for e in exported:
+            self._append(Span(
+                trace_id,
+                e["name"],
+                e["start"] - _EPOCH_OFFSET,
+                e["end"] - _EPOCH_OFFSET,
+                e["thread_id"],
+                thread_prefix + e["thread_name"],
+                e.get("args") or {},
+            ))
+
+    def spans(self, trace_id: Optional[str] = None) -> list[Span]:
+        with self._lock:
+            items = list(self._spans)
+        if trace_id is not None:
+            items = [s for s in items if s.trace_id == trace_id]
+        return sorted(items, key=lambda s: s.start)
+
+    def chrome_trace(self, trace_id: Optional[str] = None) -> dict[str, Any]:
+        """
+        Chrome trace-event JSON (chrome://tracing, ui.perfetto.dev): one process row per trace, one
+        thread row per thread that worked on it.
+        """
+        events: list[dict[str, Any]] = []
+        pids: dict[str, int] = {}
+        threads: set[tuple[int, int]] = set()
+        for sp in self.spans(trace_id):
+            pid = pids.get(sp.trace_id)
+            if pid is None:
+                pid = pids[sp.trace_id] = len(pids) + 1
+                events.append({
+                    "name": "process_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "args": {"name": f"trace {sp.trace_id}"},
+                })
+            if (pid, sp.thread_id) not in threads:
+                threads.add((pid, sp.thread_id))
+                events.append({
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": sp.thread_id,
+                    "args": {"name": sp.thread_name},
+                })
+            events.append({
+                "name": sp.name,
+                "cat": "speaksee",
+                "ph": "X",
+                "ts": round((sp.start + _EPOCH_OFFSET) * 1e6, 1),
+                "dur": round(sp.duration_s * 1e6, 1),
+                "pid": pid,
+                "tid": sp.thread_id,
+                "args": {"trace_id": sp.trace_id, **sp.args},
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+TRACER = Tracer()
+span = TRACER.span
@@ -1,24 +1,161 @@
 from __future__ import annotations
 
+import hashlib
+import logging
 import os
 import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
 
+from .config import Config
 
-def speak_async(text: str) -> None:
-    if os.getenv("SPEAKSEE_TTS", "").strip() not in ("1", "true", "yes", "on"):
-        return
-    try:
-        import pyttsx3  # type: ignore
-    except Exception:
-        return
 
-    def _run() -> None:
+log = logging.getLogger(__name__)
+
+# Spoken feedback; rendered ahead of time in "browser" mode so the first use is instant.
+PHRASES = (
+    "Saved",
+    "Regenerating",
+    "More realistic",
+    "More abstract",
+    "Image generation failed",
+    "Nothing to save yet",
+)
+
+_MEMORY_CACHE = 32  # rendered phrases kept in RAM (all of them are also on disk)
+
+
+def audio_mime(data: bytes) -> str:
+    # pyttsx3 writes WAV, except on macOS where the system voice always writes AIFF.
+    if data[:4] == b"FORM":
+        return "audio/aiff"
+    return "audio/wav"
+
+
+def _default_engine() -> Any:
+    import pyttsx3  # type: ignore
+
+    return pyttsx3.init()
+
+
+class TtsWorker:
+    """
+    Spoken feedback through one pyttsx3 engine, created once and only ever used from its own
+    thread (engines are neither cheap to start nor thread-safe).
+
+    `cfg.tts` is "speaker" (say it on this machine) or "browser" (render a WAV for the client to
+    play; `render`). Requests queue up in order; one for a phrase that is already waiting joins it
+    instead of being said / rendered twice. Rendered audio is cached in memory and under
+    data/cache/tts/, keyed by voice, rate and text.
+    """
+
+    def __init__(self, cfg: Config, *, engine_factory: Callable[[], Any] = _default_engine):
+        self._cfg = cfg
+        self._engine_factory = engine_factory
+        self._cache_dir = cfg.data_dir / "cache" / "tts"
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[tuple[str, str], Future]" = OrderedDict()
+        self._rendered: "OrderedDict[str, bytes]" = OrderedDict()  # by text: one engine, one voice
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def mode(self) -> str:
+        return self._cfg.tts
+
+    def _submit(self, kind: str, text: str) -> Future:
+        with self._cond:
+            fut = self._pending.get((kind, text))
+            if fut is not None:
+                return fut  # already waiting: coalesce
+            fut = Future()
+            if self._closed:
+                fut.set_result(None)
+                return fut
+            self._pending[(kind, text)] = fut
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tts", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return fut
+
+    def speak(self, text: str) -> Future:
+        """Say `text` on this machine's speakers (resolves to None once said)."""
+        return self._submit("speak", text.strip())
+
+    def render(self, text: str) -> Future:
+        """Audio file bytes of `text` (None if no TTS engine is available); see `audio_mime`."""
+        text = text.strip()
+        with self._cond:
+            wav = self._rendered.get(text)
+            if wav is not None:
+                self._rendered.move_to_end(text)
+                done: Future = Future()
+                done.set_result(wav)
+                return done
+        return self._submit("render", text)
+
+    def prerender(self, phrases: tuple[str, ...] = PHRASES) -> None:
+        for text in phrases:
+            self.render(text)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    # --- worker thread -----------------------------------------------------------------------
+
+    def _run(self) -> None:
         try:
-            engine = pyttsx3.init()
-            engine.say(text)
+            engine = self._engine_factory()
+        except Exception as e:
+            log.warning("text-to-speech unavailable: %s", e)
+            engine = None
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                (kind, text), fut = self._pending.popitem(last=False)
+            if engine is None:
+                fut.set_result(None)
+                continue
+            try:
+                fut.set_result(self._render(engine, text) if kind == "render" else self._speak(engine, text))
+            except Exception as e:
+                log.warning("text-to-speech failed for %r: %s", text, e)
+                fut.set_result(None)
+
+    @staticmethod
+    def _speak(engine: Any, text: str) -> None:
+        engine.say(text)
+        engine.runAndWait()
+
+    def _render(self, engine: Any, text: str) -> bytes:
+        key = f"{engine.getProperty('voice')}\0{engine.getProperty('rate')}\0{text}"
+        path = self._cache_dir / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.wav"
+        if not path.exists():
+            self._cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp.wav")
+            engine.save_to_file(text, str(tmp))
             engine.runAndWait()
-        except Exception:
-            pass
+            os.replace(tmp, path)
+        wav = path.read_bytes()
+        with self._cond:
+            self._rendered[text] = wav
+            while len(self._rendered) > _MEMORY_CACHE:
+                self._rendered.popitem(last=False)
+        return wav
+
 
-    threading.Thread(target=_run, daemon=True).start()
+def create_tts(cfg: Config) -> Optional[TtsWorker]:
+    if cfg.tts == "off":
+        return None
+    tts = TtsWorker(cfg)
+    if cfg.tts == "browser":
+        tts.prerender()
+    return tts
 
@@ -0,0 +1,630 @@
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import itertools
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Callable, Optional
+
+from PIL import Image
+
+from .config import Config, load_config
+from .image_models import UnknownModel
+from .image_sd import GenerationCancelled, ImageGenResult
+from .metrics import GEN_QUEUE_WAIT_SECONDS, GEN_WORKERS_BUSY
+from .tracing import TRACER, current_trace, set_trace
+
+
+log = logging.getLogger(__name__)
+
+# The coordinator pings every worker this often; either side gives the other up after
+# LOST_AFTER_S without hearing from it.
+HEARTBEAT_S = 2.0
+LOST_AFTER_S = 10.0
+
+# Errors raised on a worker that reach the caller as themselves (and are never retried).
+_ERRORS: dict[str, type[Exception]] = {
+    "GenerationCancelled": GenerationCancelled,
+    "UnknownModel": UnknownModel,
+    "ValueError": ValueError,
+}
+
+
+class NoWorkers(RuntimeError):
+    pass
+
+
+class WorkerLost(ConnectionError):
+    pass
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    host, sep, port = address.strip().rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"expected host:port, got {address!r}")
+    return host.strip("[]") or "0.0.0.0", int(port)
+
+
+# Images cross the network as raw pixels: lossless, and cheaper than PNG on a LAN.
+def _pack_image(image: Optional[Image.Image]) -> Optional[dict[str, Any]]:
+    if image is None:
+        return None
+    return {"mode": image.mode, "size": image.size, "data": image.tobytes()}
+
+
+def _unpack_image(ref: Optional[dict[str, Any]]) -> Optional[Image.Image]:
+    if ref is None:
+        return None
+    return Image.frombytes(ref["mode"], tuple(ref["size"]), ref["data"])
+
+
+# --- coordinator -------------------------------------------------------------------------------
+
+
+@dataclasses.dataclass(eq=False)
+class _Worker:
+    id: int
+    name: str
+    conn: Connection
+    models: tuple[str, ...]
+    device: str
+    loaded: dict[str, str]  # model id -> residency on the worker
+    last_seen: float = dataclasses.field(default_factory=time.monotonic)
+    last_dispatch: float = 0.0
+    inflight: int = 0
+    pending: dict[int, tuple[Future, Optional[Callable[[int, int], None]]]] = dataclasses.field(default_factory=dict)
+    send_lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+    lost: bool = False
+
+    def send(self, msg: tuple[Any, ...]) -> None:
+        with self.send_lock:
+            self.conn.send(msg)
+
+    def affinity(self, model_id: str) -> int:
+        return {"device": 0, "host": 1}.get(self.loaded.get(model_id, ""), 2)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "device": self.device,
+            "models": list(self.models),
+            "loaded": dict(self.loaded),
+            "inflight": self.inflight,
+        }
+
+
+@dataclasses.dataclass(eq=False)
+class _Waiter:
+    model_id: str
+    exclude: set[int]
+
+
+class WorkerPool:
+    """
+    The coordinator side: accepts `speaksee-worker` connections on `cfg.worker_listen` and hands
+    each generation to one of them.
+
+    A generation goes to a free worker (each renders one image at a time: its pipelines are
+    serialized anyway) that serves the model, preferring one that already has it on its
+    accelerator, then in host RAM, then the least recently used. When every suitable worker is
+    busy it waits, first come first served. If its worker disconnects or stops answering pings,
+    it is retried on another worker (`cfg.worker_retries`); errors the worker reports are not
+    retried.
+    """
+
+    def __init__(self, cfg: Config):
+        if not cfg.worker_key:
+            raise ValueError("SPEAKSEE_WORKER_KEY must be set to accept generation workers")
+        self._cfg = cfg
+        self._cond = threading.Condition()
+        self._workers: dict[int, _Worker] = {}
+        self._waiting: "deque[_Waiter]" = deque()
+        self._ids = itertools.count(1)
+        self._req_ids = itertools.count(1)
+        self._listener: Optional[Listener] = None
+        self._closed = threading.Event()
+
+    @property
+    def address(self) -> tuple[str, int]:
+        assert self._listener is not None
+        return self._listener.address  # type: ignore[return-value]
+
+    def start(self) -> "WorkerPool":
+        self._listener = Listener(parse_address(self._cfg.worker_listen), authkey=self._cfg.worker_key.encode("utf-8"))
+        log.info("accepting generation workers on %s:%d", *self.address)
+        threading.Thread(target=self._accept_loop, name="worker-accept", daemon=True).start()
+        threading.Thread(target=self._monitor_loop, name="worker-monitor", daemon=True).start()
+        return self
+
+    def close(self) -> None:
+        self._closed.set()
+        if self._listener is not None:
+            self._listener.close()
+        for w in self.workers():
+            self._lose(w, "coordinator shutting down")
+
+    def workers(self) -> list[_Worker]:
+        with self._cond:
+            return list(self._workers.values())
+
+    def snapshot(self) -> list[dict[str, Any]]:
+        with self._cond:
+            return [w.as_dict() for w in self._workers.values()]
+
+    # --- connections -------------------------------------------------------------------------
+
+    def _accept_loop(self) -> None:
+        assert self._listener is not None
+        while not self._closed.is_set():
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                if self._closed.is_set():
+                    return
+                log.exception("worker accept failed")
+                continue
+            except Exception as e:  # failed authentication, or a stray client
+                log.warning("rejected worker connection: %s", e)
+                continue
+            threading.Thread(target=self._serve_worker, args=(conn,), name="worker-conn", daemon=True).start()
+
+    def _serve_worker(self, conn: Connection) -> None:
+        try:
+            if not conn.poll(LOST_AFTER_S):
+                raise EOFError("no hello")
+            kind, info = conn.recv()
+            if kind != "hello":
+                raise EOFError(f"unexpected {kind!r}")
+        except (EOFError, OSError, ValueError) as e:
+            log.warning("worker handshake failed: %s", e)
+            conn.close()
+            return
+        w = _Worker(
+            id=next(self._ids),
+            name=str(info.get("name") or "worker"),
+            conn=conn,
+            models=tuple(info.get("models") or ()),
+            device=str(info.get("device") or "unknown"),
+            loaded=dict(info.get("loaded") or {}),
+        )
+        with self._cond:
+            self._workers[w.id] = w
+            self._publish()
+            self._cond.notify_all()
+        log.info("worker %s joined (%s, models: %s)", w.name, w.device, ", ".join(w.models))
+        self._read_loop(w)
+
+    def _read_loop(self, w: _Worker) -> None:
+        while not w.lost:
+            try:
+                msg = w.conn.recv()
+            except (EOFError, OSError):
+                break
+            w.last_seen = time.monotonic()
+            kind = msg[0]
+            if kind == "pong":
+                with self._cond:
+                    w.device = msg[1].get("device", w.device)
+                    w.loaded = dict(msg[1].get("loaded", w.loaded))
+                continue
+            entry = w.pending.get(msg[1])
+            if entry is None:
+                continue
+            fut, on_progress = entry
+            if kind == "progress":
+                if on_progress is not None:
+                    try:
+                        on_progress(msg[2], msg[3])
+                    except Exception:
+                        pass
+                continue
+            w.pending.pop(msg[1], None)
+            fut.set_result(msg)
+        self._lose(w, "connection closed")
+
+    def _lose(self, w: _Worker, reason: str) -> None:
+        with self._cond:
+            if w.lost:
+                return
+            w.lost = True
+            self._workers.pop(w.id, None)
+            self._publish()
+            self._cond.notify_all()
+        if not self._closed.is_set():
+            log.warning("worker %s lost: %s", w.name, reason)
+        try:
+            w.conn.close()
+        except OSError:
+            pass
+        for req_id in list(w.pending):
+            entry = w.pending.pop(req_id, None)
+            if entry is not None and not entry[0].done():
+                entry[0].set_exception(WorkerLost(f"worker {w.name} lost: {reason}"))
+
+    def _monitor_loop(self) -> None:
+        while not self._closed.wait(HEARTBEAT_S):
+            now = time.monotonic()
+            for w in self.workers():
+                if now - w.last_seen > LOST_AFTER_S:
+                    self._lose(w, f"no reply for {now - w.last_seen:.0f}s")
+                    continue
+                try:
+                    w.send(("ping",))
+                except (OSError, EOFError, ValueError) as e:
+                    self._lose(w, str(e))
+
+    def _publish(self) -> None:
+        GEN_WORKERS_BUSY.clear()
+        for w in self._workers.values():
+            GEN_WORKERS_BUSY.set(w.inflight, worker=w.name, device=w.device)
+
+    # --- dispatch ----------------------------------------------------------------------------
+
+    def _pick(self, model_id: str, exclude: set[int]) -> Optional[_Worker]:
+        free = [
+            w for w in self._workers.values()
+            if model_id in w.models and w.id not in exclude and w.inflight == 0
+        ]
+        if not free:
+            return None
+        return min(free, key=lambda w: (w.affinity(model_id), w.last_dispatch))
+
+    def _can_serve(self, model_id: str, exclude: set[int]) -> bool:
+        return any(model_id in w.models and w.id not in exclude for w in self._workers.values())
+
+    def _acquire(self, model_id: str, exclude: set[int], should_cancel: Optional[Callable[[], bool]]) -> _Worker:
+        me = _Waiter(model_id, exclude)
+        deadline = time.monotonic() + self._cfg.worker_wait_s
+        with self._cond:
+            self._waiting.append(me)
+            try:
+                while True:
+                    w = self._pick(model_id, exclude)
+                    # First come first served: an earlier waiter that could take a worker goes first.
+                    ahead = itertools.takewhile(lambda x: x is not me, self._waiting)
+                    if w is not None and not any(self._pick(x.model_id, x.exclude) for x in ahead):
+                        w.inflight += 1
+                        w.last_dispatch = time.monotonic()
+                        self._publish()
+                        return w
+                    if should_cancel is not None and should_cancel():
+                        raise GenerationCancelled()
+                    if self._can_serve(model_id, exclude):
+                        deadline = time.monotonic() + self._cfg.worker_wait_s  # busy, not missing
+                    elif time.monotonic() > deadline:
+                        raise NoWorkers(f"no generation worker serves {model_id}")
+                    self._cond.wait(0.1)
+            finally:
+                self._waiting.remove(me)
+                self._cond.notify_all()
+
+    def _release(self, w: _Worker) -> None:
+        with self._cond:
+            w.inflight -= 1
+            self._publish()
+            self._cond.notify_all()
+
+    def generate(
+        self,
+        *,
+        model_id: str,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        should_cancel: Optional[Callable[[], bool]] = None,
+        init_image: Optional[Image.Image] = None,
+        **kwargs: Any,
+    ) -> ImageGenResult:
+        kwargs = {**kwargs, "model_id": model_id, "init_image": _pack_image(init_image)}
+        exclude: set[int] = set()
+        attempt = 0
+        while True:
+            t0 = time.perf_counter()
+            w = self._acquire(model_id, exclude, should_cancel)
+            t1 = time.perf_counter()
+            GEN_QUEUE_WAIT_SECONDS.observe(t1 - t0)
+            TRACER.add("gen.queue_wait", t0, t1, worker=w.name)
+            try:
+                return self._run_on(w, kwargs, on_progress, should_cancel)
+            except WorkerLost as e:
+                if attempt >= self._cfg.worker_retries:
+                    raise
+                attempt += 1
+                exclude.add(w.id)
+                log.warning("%s; retrying the generation elsewhere (attempt %d)", e, attempt + 1)
+            finally:
+                self._release(w)
+
+    def _run_on(
+        self,
+        w: _Worker,
+        kwargs: dict[str, Any],
+        on_progress: Optional[Callable[[int, int], None]],
+        should_cancel: Optional[Callable[[], bool]],
+    ) -> ImageGenResult:
+        req_id = next(self._req_ids)
+        fut: Future = Future()
+        w.pending[req_id] = (fut, on_progress)
+        trace_id = current_trace()
+        try:
+            w.send(("generate", req_id, kwargs, trace_id))
+        except (OSError, EOFError, ValueError) as e:
+            self._lose(w, str(e))
+        cancel_sent = False
+        while True:
+            try:
+                msg = fut.result(timeout=0.1)
+                break
+            except FutureTimeout:
+                if not cancel_sent and should_cancel is not None and should_cancel():
+                    try:
+                        w.send(("cancel", req_id))
+                    except (OSError, EOFError, ValueError):
+                        pass
+                    cancel_sent = True
+        spans = msg[-1]
+        if spans and trace_id:
+            TRACER.merge(spans, trace_id=trace_id, thread_prefix=f"{w.name}/")
+        if msg[0] == "err":
+            raise _ERRORS.get(msg[2], RuntimeError)(msg[3])
+        r = dict(msg[2])
+        with self._cond:
+            w.device = r["device"]
+            w.loaded = dict(r.pop("loaded", w.loaded))
+        return ImageGenResult(image=_unpack_image(r.pop("image")), **r)
+
+
+class DistributedImageModels:
+    """
+    Stands in for `ImageModels` when generation runs on `speaksee-worker`s. The workers manage
+    their own memory, so the memory manager sees an empty model here.
+    """
+
+    def __init__(self, cfg: Config, pool: Optional[WorkerPool] = None):
+        self._cfg = cfg
+        self.pool = pool or WorkerPool(cfg).start()
+        self._last_device = "remote"
+        self._last_recovery: tuple[str, ...] = ()
+
+    @property
+    def model_ids(self) -> tuple[str, ...]:
+        return self._cfg.sd_model_ids
+
+    def resolve(self, model_id: Optional[str]) -> str:
+        model_id = (model_id or "").strip() or self._cfg.sd_model
+        if model_id not in self.model_ids:
+            raise UnknownModel(model_id)
+        return model_id
+
+    def generate(self, *, model_id: Optional[str] = None, **kwargs: Any) -> ImageGenResult:
+        result = self.pool.generate(model_id=self.resolve(model_id), **kwargs)
+        self._last_device = result.device
+        self._last_recovery = tuple(result.recovery)
+        return result
+
+    @property
+    def device(self) -> str:
+        return self._last_device
+
+    @property
+    def memory_mode(self) -> str:
+        return "normal"
+
+    @property
+    def last_recovery(self) -> tuple[str, ...]:
+        return self._last_recovery
+
+    def devices(self) -> dict[str, str]:
+        return {
+            f"{model_id}@{w.name}": w.device
+            for w in self.pool.workers()
+            for model_id, residency in w.loaded.items()
+            if residency != "unloaded"
+        }
+
+    # --- memory manager hooks (see memory.ManagedModel) --------------------------------------
+
+    @property
+    def residency(self) -> str:
+        return "unloaded"
+
+    @property
+    def last_used(self) -> float:
+        return 0.0
+
+    def footprint(self) -> tuple[int, int]:
+        return 0, 0
+
+    def park(self) -> bool:
+        return False
+
+    def unload(self) -> bool:
+        return False
+
+    def warm(self) -> None:
+        pass
+
+
+# --- worker ------------------------------------------------------------------------------------
+
+
+class GenerationWorker:
+    """
+    `speaksee-worker`: loads the image models on this machine's device and renders whatever a
+    coordinator sends, reconnecting whenever the connection drops.
+    """
+
+    def __init__(self, cfg: Config, gen: Any, *, name: Optional[str] = None, memory: Any = None):
+        self._cfg = cfg
+        self.gen = gen
+        self.memory = memory
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        # One generation at a time (the coordinator never sends more); the connection thread stays
+        # free for pings and cancels.
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="worker-gen")
+        self._conn: Optional[Connection] = None
+        self._stopped = threading.Event()
+
+    def _status(self) -> dict[str, Any]:
+        return {"device": self.gen.device, "loaded": self.gen.loaded()}
+
+    def run(self, address: tuple[str, int], authkey: bytes) -> None:
+        """Serve `address` until `stop()`; reconnects with backoff when the coordinator goes away."""
+        if self.memory is not None:
+            threading.Thread(target=self._sweep_loop, name="memory-sweep", daemon=True).start()
+        backoff = 0.5
+        while not self._stopped.is_set():
+            try:
+                conn = Client(address, authkey=authkey)
+            except (OSError, EOFError, AuthenticationError) as e:
+                log.info("coordinator %s:%d not reachable (%s); retrying", *address, e)
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, 10.0)
+                continue
+            backoff = 0.5
+            self._conn = conn
+            log.info("connected to coordinator %s:%d as %s", *address, self.name)
+            try:
+                self._serve(conn)
+            finally:
+                conn.close()
+                self._conn = None
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._conn is not None:
+            self._conn.close()
+
+    def _sweep_loop(self) -> None:
+        while not self._stopped.wait(self._cfg.memory_sweep_interval_s):
+            try:
+                self.memory.sweep()
+            except Exception:
+                log.exception("memory sweep failed")
+
+    def _serve(self, conn: Connection) -> None:
+        send_lock = threading.Lock()
+
+        def send(msg: tuple[Any, ...]) -> None:
+            with send_lock:
+                try:
+                    conn.send(msg)
+                except (OSError, EOFError, ValueError):
+                    pass  # the coordinator went away; it retries the job elsewhere
+
+        send(("hello", {
+            "name": self.name,
+            "models": list(self._cfg.sd_model_ids),
+            **self._status(),
+        }))
+        # Request ids are per connection; whatever is still running when it drops is abandoned
+        # (the coordinator retries it elsewhere), so it is cancelled here too.
+        running: set[int] = set()
+        cancelled: set[int] = set()
+        try:
+            while not self._stopped.is_set():
+                try:
+                    if not conn.poll(LOST_AFTER_S):
+                        log.warning("coordinator silent for %.0fs; reconnecting", LOST_AFTER_S)
+                        return
+                    msg = conn.recv()
+                except (EOFError, OSError, ValueError):
+                    return
+                if msg[0] == "ping":
+                    send(("pong", self._status()))
+                elif msg[0] == "cancel":
+                    cancelled.add(msg[1])
+                elif msg[0] == "generate":
+                    running.add(msg[1])
+                    self._pool.submit(self._generate, send, running, cancelled, *msg[1:])
+        finally:
+            cancelled.update(running)
+
+    def _generate(
+        self,
+        send: Callable[[tuple[Any, ...]], None],
+        running: set[int],
+        cancelled: set[int],
+        req_id: int,
+        kwargs: dict[str, Any],
+        trace_id: Optional[str],
+    ) -> None:
+        set_trace(trace_id)
+        t0 = time.perf_counter()
+        try:
+            result = self.gen.generate(
+                **{**kwargs, "init_image": _unpack_image(kwargs.get("init_image"))},
+                on_progress=lambda step, total: send(("progress", req_id, step, total)),
+                should_cancel=lambda: req_id in cancelled,
+            )
+            reply: tuple[Any, ...] = ("ok", req_id, {
+                "image": _pack_image(result.image),
+                "seed": result.seed,
+                "device": result.device,
+                "width": result.width,
+                "height": result.height,
+                "recovery": tuple(result.recovery),
+                "model_id": result.model_id,
+                "steps_run": result.steps_run,
+                "elapsed_s": result.elapsed_s,
+                "loaded": self.gen.loaded(),
+            })
+        except Exception as e:
+            if type(e).__name__ not in _ERRORS:
+                log.exception("generation failed")
+            reply = ("err", req_id, type(e).__name__, str(e))
+        finally:
+            running.discard(req_id)
+            cancelled.discard(req_id)
+        spans = TRACER.export(trace_id, since=t0) if trace_id else []
+        send(reply + (spans,))
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="speaksee-worker",
+        description="Render images for a speaksee server started with SPEAKSEE_WORKER_LISTEN.",
+    )
+    parser.add_argument("--coordinator", required=True, help="host:port of the coordinator's SPEAKSEE_WORKER_LISTEN")
+    parser.add_argument("--name", help="name shown in metrics and traces (default: hostname-pid)")
+    parser.add_argument("--device", choices=("auto", "cpu", "mps", "cuda"), help="override SPEAKSEE_DEVICE")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    cfg = load_config()
+    if args.device:
+        cfg = dataclasses.replace(cfg, device_preference=args.device)
+    if not cfg.worker_key:
+        parser.error("SPEAKSEE_WORKER_KEY must be set (the same value as on the coordinator)")
+    os.environ.setdefault("HF_HUB_DISABLE_TELEMETRY", "1")
+    os.environ.setdefault("HF_HUB_DISABLE_PROGRESS_BARS", "1")
+    os.environ.setdefault("HF_HOME", str(cfg.hf_home))
+    TRACER.configure(cfg)
+
+    from .hardware import probe_in_background
+    from .image_models import ImageModels
+    from .memory import MemoryManager
+
+    probe_in_background(cfg.device_preference)
+    gen = ImageModels(cfg)
+    memory = MemoryManager(cfg)
+    memory.register("sd", gen)
+    worker = GenerationWorker(cfg, gen, name=args.name, memory=memory)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        worker.run(parse_address(args.coordinator), cfg.worker_key.encode("utf-8"))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,9 +3,22 @@ from __future__ import annotations
 import json
 from typing import Any
 
+try:  # optional, much faster for the larger messages (gallery lists)
+    import orjson  # type: ignore
+except Exception:
+    orjson = None
+
+# One reusable encoder: `json.dumps` with non-default options builds a new one on every call.
+_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
 
 def dumps(msg: dict[str, Any]) -> str:
-    return json.dumps(msg, separators=(",", ":"), ensure_ascii=False)
+    if orjson is not None:
+        try:
+            return orjson.dumps(msg).decode("utf-8")
+        except TypeError:
+            pass  # e.g. non-str dict keys; the stdlib encoder is more lenient
+    return _encoder.encode(msg)
 
 
 def status(phase: str, detail: str = "") -> dict[str, Any]:
@@ -1,5 +1,8 @@
 import sys
 from pathlib import Path
+from typing import Any, Callable
+
+import pytest
 
 # Ensure src/ is importable when running tests without installing the project.
 ROOT = Path(__file__).resolve().parents[1]
@@ -7,3 +10,42 @@ SRC = ROOT / "src"
 if str(SRC) not in sys.path:
     sys.path.insert(0, str(SRC))
 
+from speaksee.config import Config  # noqa: E402
+
+
+@pytest.fixture
+def make_cfg(tmp_path: Path) -> Callable[..., Config]:
+    """
+    Config factory: the data directories under `tmp_path/data` (created), fake models on the CPU,
+    small images. Keyword arguments override any field.
+    """
+    data_dir = tmp_path / "data"
+
+    def make(**overrides: Any) -> Config:
+        kw: dict[str, Any] = dict(
+            root_dir=tmp_path,
+            host="127.0.0.1",
+            port=7860,
+            data_dir=data_dir,
+            gallery_dir=data_dir / "gallery",
+            saved_dir=data_dir / "saved",
+            hf_home=data_dir / "hf",
+            sd_model="fake",
+            whisper_model="fake",
+            steps=2,
+            width=64,
+            height=64,
+            device_preference="cpu",
+        )
+        kw.update(overrides)
+        cfg = Config(**kw)
+        for d in (cfg.gallery_dir, cfg.saved_dir, cfg.hf_home):
+            d.mkdir(parents=True, exist_ok=True)
+        return cfg
+
+    return make
+
+
+@pytest.fixture
+def cfg(make_cfg: Callable[..., Config]) -> Config:
+    return make_cfg()
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from speaksee.audio_codec import UnsupportedAudioFormat, available_formats, create_decoder
+
+
+def test_pcm16_passthrough():
+    dec = create_decoder("pcm16", 16000)
+    assert dec.decode(b"\x01\x00\x02\x00") == b"\x01\x00\x02\x00"
+    assert dec.flush() == b""
+
+
+def test_unknown_format_rejected():
+    with pytest.raises(UnsupportedAudioFormat):
+        create_decoder("mp3", 16000)
+
+
+def test_opus_roundtrip_to_pcm16():
+    av = pytest.importorskip("av")
+    if "opus" not in available_formats():
+        pytest.skip("opus decoder unavailable")
+
+    sr = 16000
+    enc = av.codec.CodecContext.create("libopus", "w")
+    enc.sample_rate = sr
+    enc.layout = "mono"
+    enc.format = "s16"
+    enc.bit_rate = 24000
+    enc.open()
+
+    t = np.arange(sr) / sr
+    pcm = (0.3 * np.sin(2 * np.pi * 440 * t) * 32767).astype(np.int16)
+    packets = []
+    n = enc.frame_size
+    for i in range(0, pcm.size - n + 1, n):
+        frame = av.AudioFrame.from_ndarray(pcm[i : i + n].reshape(1, -1), format="s16", layout="mono")
+        frame.sample_rate = sr
+        frame.pts = i
+        packets.extend(bytes(p) for p in enc.encode(frame))
+
+    dec = create_decoder("opus", sr)
+    out = bytearray()
+    for p in packets:
+        out += dec.decode(p)
+    out += dec.flush()
+
+    decoded = np.frombuffer(bytes(out), dtype=np.int16)
+    assert abs(decoded.size - pcm.size) < sr // 10
+    assert np.abs(decoded.astype(np.float32)).max() > 1000
@@ -0,0 +1,86 @@
+import json
+import wave
+from pathlib import Path
+from types import SimpleNamespace
+
+from PIL import Image
+
+from speaksee.batch import iter_inputs, read_audio, run_batch
+from speaksee.config import Config
+
+
+class _FakeStt:
+    def transcribe_final(self, pcm16: bytes, sample_rate: int):
+        return SimpleNamespace(text="a spoken prompt" if any(pcm16) else "")
+
+
+class _FakeModels:
+    def __init__(self) -> None:
+        self.batches: list[list[str]] = []
+
+    def resolve(self, model_id):
+        return model_id or "fake"
+
+    def generate_batch(self, *, model_id, prompts, seeds, width, height, **kwargs):
+        self.batches.append(list(prompts))
+        return [
+            SimpleNamespace(image=Image.new("RGB", (width, height)), seed=s, model_id=model_id, device="cpu")
+            for s in seeds
+        ]
+
+
+def _wav(path: Path, pcm16: bytes, rate: int = 16000) -> Path:
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm16)
+    return path
+
+
+def test_inputs_and_wav_decoding(tmp_path: Path) -> None:
+    audio = tmp_path / "audio"
+    audio.mkdir()
+    _wav(audio / "b.wav", b"\x10\x00" * 480, rate=48000)
+    _wav(audio / "a.wav", b"\x00\x00" * 160)
+    (audio / "notes.txt").write_text("ignored")
+    prompts = tmp_path / "prompts.txt"
+    prompts.write_text("# header\na cat\n\na dog\n")
+
+    items = list(iter_inputs([audio, prompts]))
+    assert [i.key for i in items] == [str(audio / "a.wav"), str(audio / "b.wav"), f"{prompts}:2", f"{prompts}:4"]
+    assert items[3].prompt == "a dog"
+    assert abs(len(read_audio(audio / "b.wav")) - 2 * 160) <= 2 * 8  # 48 kHz resampled to 16 kHz
+
+
+def test_batches_and_resumes(tmp_path: Path, cfg: Config) -> None:
+    audio = tmp_path / "audio"
+    audio.mkdir()
+    _wav(audio / "silent.wav", b"\x00\x00" * 160)
+    _wav(audio / "speech.wav", b"\x10\x00" * 160)
+    prompts = tmp_path / "prompts.txt"
+    prompts.write_text("a cat\na dog\na fox\n")
+    manifest = tmp_path / "out" / "manifest.jsonl"
+
+    models = _FakeModels()
+    summary = run_batch(
+        cfg, iter_inputs([audio, prompts]), manifest, stt=_FakeStt(), models=models, batch_size=2, seed=7
+    )
+    assert summary["ok"] == 4 and summary["empty"] == 1 and summary["error"] == 0
+    assert sorted(p for b in models.batches for p in b) == ["a cat", "a dog", "a fox", "a spoken prompt"]
+    assert max(len(b) for b in models.batches) <= 2
+    entries = [json.loads(line) for line in manifest.read_text().splitlines()]
+    ok = [e for e in entries if e["status"] == "ok"]
+    assert all(Path(e["file"]).exists() for e in ok)
+    assert len(list(cfg.gallery_dir.glob("*/*/*.png"))) == 4
+
+    # Interrupted after the first line: only the rest is redone, with the same seeds.
+    manifest.write_text(json.dumps(entries[0]) + "\n" + '{"key": "trunc')
+    models = _FakeModels()
+    summary = run_batch(
+        cfg, iter_inputs([audio, prompts]), manifest, stt=_FakeStt(), models=models, batch_size=2, seed=7
+    )
+    assert summary["skipped"] == 1
+    assert summary["ok"] + summary["empty"] == 4
+    redone = {e["key"]: e["seed"] for e in map(json.loads, manifest.read_text().splitlines()[2:]) if "seed" in e}
+    assert redone == {e["key"]: e["seed"] for e in ok if e["key"] in redone}
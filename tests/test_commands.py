@@ -32,3 +32,40 @@ def test_parse_voice_command_save_image():
 def test_parse_voice_command_none_for_prompt():
     assert parse_voice_command("a fox that says regenerate in a forest") is None
 
+
+def test_parse_voice_command_save_the_image_with_filler():
+    cmd = parse_voice_command("Okay, save the image, thanks!")
+    assert cmd is not None
+    assert cmd.name == "save_image"
+
+
+def test_parse_voice_command_tolerates_near_miss():
+    assert parse_voice_command("Regenerated.").name == "regenerate"
+    assert parse_voice_command("re-generate").name == "regenerate"
+    assert parse_voice_command("safe image").name == "save_image"
+    assert parse_voice_command("more realistik").name == "more_realistic"
+    assert parse_voice_command("regenarate").name == "regenerate"
+
+
+def test_parse_voice_command_near_miss_can_be_disabled():
+    assert parse_voice_command("safe image", fuzzy=False) is None
+
+
+def test_parse_voice_command_none_for_short_prompts():
+    assert parse_voice_command("more plastic") is None
+    assert parse_voice_command("a red image") is None
+    assert parse_voice_command("more cats") is None
+
+
+def test_parse_voice_command_near_miss_rejects_prompts():
+    for text in (
+        "more realistic cat",
+        "wave image",
+        "same image",
+        "a save image",
+        "degenerate",
+        "generate",
+        "more abstracts",
+        "more realist",
+    ):
+        assert parse_voice_command(text) is None, text
@@ -1,38 +1,24 @@
-from pathlib import Path
+import dataclasses
+import io
+import json
+import tarfile
+import zipfile
 
 from PIL import Image
 
 from speaksee.config import Config
-from speaksee.gallery import copy_to_saved, list_gallery, save_generated_image
-
-
-def _cfg(tmp_path: Path) -> Config:
-    data_dir = tmp_path / "data"
-    gallery_dir = data_dir / "gallery"
-    saved_dir = data_dir / "saved"
-    hf_home = data_dir / "hf"
-    gallery_dir.mkdir(parents=True, exist_ok=True)
-    saved_dir.mkdir(parents=True, exist_ok=True)
-    hf_home.mkdir(parents=True, exist_ok=True)
-    return Config(
-        root_dir=tmp_path,
-        host="127.0.0.1",
-        port=7860,
-        data_dir=data_dir,
-        gallery_dir=gallery_dir,
-        saved_dir=saved_dir,
-        hf_home=hf_home,
-        sd_model="stabilityai/sd-turbo",
-        whisper_model="Systran/faster-whisper-base",
-        steps=4,
-        width=512,
-        height=512,
-        device_preference="cpu",
-    )
+from speaksee.export import stream_archive
+from speaksee.gallery import (
+    GalleryJanitor,
+    copy_to_saved,
+    image_path,
+    iter_export,
+    list_gallery,
+    save_generated_image,
+)
 
 
-def test_gallery_save_and_list(tmp_path: Path):
-    cfg = _cfg(tmp_path)
+def test_gallery_save_and_list(cfg: Config):
     img = Image.new("RGB", (64, 64), color=(255, 0, 0))
     meta = save_generated_image(
         cfg,
@@ -45,8 +31,10 @@ def test_gallery_save_and_list(tmp_path: Path):
         model_id=cfg.sd_model,
         device="cpu",
     )
-    assert (cfg.gallery_dir / f"{meta['id']}.png").exists()
-    assert (cfg.gallery_dir / f"{meta['id']}.json").exists()
+    png = cfg.gallery_dir / meta["file"]
+    assert png.exists() and png.with_suffix(".json").exists()
+    # <day>/<hash bucket>/<id>.png
+    assert png.parent.parent.name == meta["id"][:10] and len(png.parent.name) == 2
 
     items = list_gallery(cfg)
     assert items
@@ -54,8 +42,7 @@ def test_gallery_save_and_list(tmp_path: Path):
     assert items[0]["url"].endswith(f"{meta['id']}.png")
 
 
-def test_copy_to_saved(tmp_path: Path):
-    cfg = _cfg(tmp_path)
+def test_copy_to_saved(cfg: Config):
     img = Image.new("RGB", (32, 32), color=(0, 255, 0))
     meta = save_generated_image(
         cfg,
@@ -71,4 +58,112 @@ def test_copy_to_saved(tmp_path: Path):
     dst = copy_to_saved(cfg, meta["id"])
     assert dst.exists()
     assert dst.name == f"{meta['id']}.png"
+    # Same filesystem: the saved file shares the gallery file's data instead of copying it.
+    assert dst.stat().st_ino == (cfg.gallery_dir / meta["file"]).stat().st_ino
+    assert copy_to_saved(cfg, meta["id"]) == dst
+
+
+def test_same_seed_in_same_second_does_not_overwrite(cfg: Config):
+    kw = dict(prompt="x", negative_prompt="", seed=7, steps=1, style="none", model_id="m", device="cpu")
+    a = save_generated_image(cfg, Image.new("RGB", (8, 8)), **kw)
+    b = save_generated_image(cfg, Image.new("RGB", (8, 8)), extra={"mode": "img2img"}, **kw)
+    assert a["id"] != b["id"]
+    assert b["mode"] == "img2img"
+    assert len(list(cfg.gallery_dir.glob("*/*/*.png"))) == 2
+
+
+def _flat_image(cfg: Config, image_id: str, size: int = 100) -> None:
+    (cfg.gallery_dir / f"{image_id}.png").write_bytes(b"x" * size)
+    (cfg.gallery_dir / f"{image_id}.json").write_text(json.dumps({"id": image_id, "file": f"{image_id}.png"}))
+
+
+def test_flat_gallery_is_migrated_in_steps(cfg: Config):
+    ids = [f"2024-01-0{d}T10-00-00_seed{d}" for d in range(1, 6)]
+    for image_id in ids:
+        _flat_image(cfg, image_id)
+    (cfg.gallery_dir / ".gitkeep").write_text("")
+    # Listed (and copyable) before the migration, too.
+    assert [i["id"] for i in list_gallery(cfg)] == ids[::-1]
+
+    janitor = GalleryJanitor(cfg, max_files=3)
+    assert janitor.step()["migrated"] == 3
+    assert janitor.step()["migrated"] == 2
+    assert sorted(p.name for p in cfg.gallery_dir.iterdir() if p.is_file()) == [".gitkeep"]
+    assert [i["id"] for i in list_gallery(cfg)] == ids[::-1]
+    meta = json.loads(image_path(cfg, ids[0]).with_suffix(".json").read_text())
+    assert (cfg.gallery_dir / meta["file"]).exists()
+    assert copy_to_saved(cfg, ids[0]).exists()
+
+
+def test_retention_deletes_oldest_first_but_keeps_saved(make_cfg):
+    cfg = make_cfg(gallery_max_mb=1)
+    old = [f"2024-01-0{d}T10-00-00_seed{d}" for d in range(1, 6)]
+    for image_id in old:
+        path = image_path(cfg, image_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * 400_000)
+    copy_to_saved(cfg, old[0])
+    kw = dict(prompt="new", negative_prompt="", seed=9, steps=1, style="none", model_id="m", device="cpu")
+    recent = save_generated_image(cfg, Image.new("RGB", (8, 8)), **kw)["id"]
+
+    stats = GalleryJanitor(cfg).step()
+    # 4 x 400 KB not saved over a 1 MB budget: the two oldest go, never the saved one.
+    assert stats["deleted"] == 2 and stats["freed_bytes"] == 800_000
+    assert [image_path(cfg, i).exists() for i in old] == [True, False, False, True, True]
+    assert image_path(cfg, recent).exists()
+    assert not (cfg.gallery_dir / "2024-01-02").exists()
+
+    # Age limit: everything from 2024 goes (still not the saved image).
+    cfg = dataclasses.replace(cfg, gallery_max_mb=0, gallery_max_age_days=30)
+    assert GalleryJanitor(cfg).step()["deleted"] == 2
+    assert [image_path(cfg, i).exists() for i in old] == [True, False, False, False, False]
+    assert image_path(cfg, recent).exists()
+
+
+def test_saved_images_over_budget_do_not_empty_the_gallery(make_cfg):
+    cfg = make_cfg(gallery_max_mb=1)
+    saved = [f"2024-01-0{d}T10-00-00_seed{d}" for d in range(1, 4)]
+    for image_id in saved:
+        path = image_path(cfg, image_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * 500_000)
+        copy_to_saved(cfg, image_id)
+    kw = dict(prompt="new", negative_prompt="", seed=9, steps=1, style="none", model_id="m", device="cpu")
+    recent = save_generated_image(cfg, Image.new("RGB", (8, 8)), **kw)["id"]
+
+    assert GalleryJanitor(cfg).step()["deleted"] == 0
+    assert all(image_path(cfg, i).exists() for i in [*saved, recent])
+    assert not any(cfg.gallery_dir.rglob("*.lock"))
+
+
+def test_export_filters_and_streams_archives(cfg: Config):
+    ids = []
+    for day, style in (("01", "realistic"), ("02", "abstract"), ("03", "realistic")):
+        image_id = f"2024-05-{day}T12-00-00_seed1"
+        path = image_path(cfg, image_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(day.encode() * 1000)
+        path.with_suffix(".json").write_text(json.dumps({"id": image_id, "style": style}))
+        ids.append(image_id)
+    copy_to_saved(cfg, ids[2])
+
+    def names(**kw):
+        return [i.image_id for i in iter_export(cfg, **kw)]
+
+    assert names() == ids
+    assert names(since="2024-05-02") == ids[1:]
+    assert names(until="2024-05-02", style="realistic") == ids[:1]
+    assert names(saved_only=True) == ids[2:]
 
+    items = list(iter_export(cfg, style="realistic"))
+    zf = zipfile.ZipFile(io.BytesIO(b"".join(stream_archive(items, "zip"))))
+    assert zf.namelist() == [
+        "2024-05-01/2024-05-01T12-00-00_seed1.png",
+        "2024-05-01/2024-05-01T12-00-00_seed1.json",
+        "2024-05-03/2024-05-03T12-00-00_seed1.png",
+        "2024-05-03/2024-05-03T12-00-00_seed1.json",
+    ]
+    assert zf.read("2024-05-03/2024-05-03T12-00-00_seed1.png") == b"03" * 1000
+    tf = tarfile.open(fileobj=io.BytesIO(b"".join(stream_archive(items, "tar"))))
+    assert tf.getnames() == zf.namelist()
+    assert json.loads(tf.extractfile("2024-05-01/2024-05-01T12-00-00_seed1.json").read())["style"] == "realistic"
@@ -0,0 +1,76 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from speaksee import hardware
+from speaksee.hardware import Hardware, probe, probed, select_device
+
+
+@pytest.fixture
+def fake_probe(monkeypatch):
+    calls = []
+
+    def _probe():
+        calls.append(threading.current_thread().name)
+        time.sleep(0.05)
+        return Hardware(torch=True, cuda=True, mps=False)
+
+    monkeypatch.setattr(hardware, "_cached", None)
+    monkeypatch.setattr(hardware, "_probe", _probe)
+    return calls
+
+
+def test_probe_runs_once(fake_probe) -> None:
+    assert probed() is None
+    threads = [threading.Thread(target=probe) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(fake_probe) == 1
+    assert probe() is probed() and probed().cuda
+
+
+def test_select_device(fake_probe) -> None:
+    assert select_device("cpu") == "cpu"
+    assert fake_probe == []  # nothing to probe for
+    assert select_device("auto") == "cuda"
+    assert select_device("mps") == "cpu"
+    assert select_device("auto", supported=("mps",)) == "cpu"
+    assert len(fake_probe) == 1
+
+
+def test_background_probe(fake_probe) -> None:
+    hardware.probe_in_background("cpu")
+    assert fake_probe == []
+    hardware.probe_in_background("auto")
+    deadline = time.monotonic() + 5
+    while probed() is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert fake_probe == ["hardware-probe"]
+
+
+def test_server_startup_imports_no_ml_frameworks(tmp_path: Path) -> None:
+    # Guards startup time: torch & co. load lazily (the hardware probe, the first model load).
+    code = f"""
+import sys
+from pathlib import Path
+from speaksee.config import Config
+from speaksee.server import create_app
+p = Path({str(tmp_path)!r})
+create_app(Config(root_dir=p, host="127.0.0.1", port=7860, data_dir=p, gallery_dir=p, saved_dir=p,
+    hf_home=p, sd_model="fake", whisper_model="fake", steps=1, width=64, height=64,
+    device_preference="cpu"))
+print(",".join(m for m in ("torch", "diffusers", "transformers", "faster_whisper", "ctranslate2") if m in sys.modules))
+"""
+    src = Path(__file__).resolve().parents[1] / "src"
+    env = {**os.environ, "PYTHONPATH": str(src), "SPEAKSEE_OFFLINE": "1"}
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == ""
@@ -0,0 +1,57 @@
+import pytest
+
+from speaksee import image_models
+from speaksee.config import SdModelSpec, parse_sd_model_spec
+from speaksee.image_models import ImageModels, UnknownModel
+
+
+class _FakeGen:
+    def __init__(self, cfg, model_id, *, lock=None, shared=None):
+        self.model_id = model_id
+        self.residency = "unloaded"
+        self.last_used = 0.0
+
+    def generate(self, **kwargs):
+        self.residency = "device"
+        return self.model_id
+
+    def park(self):
+        self.residency = "host"
+        return True
+
+    def unload(self):
+        self.residency = "unloaded"
+        return True
+
+
+_MODELS = dict(sd_model="a", sd_models=(SdModelSpec("b"), SdModelSpec("c", steps=25, guidance_scale=7.5)))
+
+
+def test_parse_sd_model_spec() -> None:
+    assert parse_sd_model_spec("org/m") == SdModelSpec("org/m")
+    assert parse_sd_model_spec(" org/m@25:7.5 ") == SdModelSpec("org/m", 25, 7.5)
+    assert parse_sd_model_spec("org/m@8") == SdModelSpec("org/m", 8, None)
+
+
+def test_lru_parks_then_unloads(make_cfg, monkeypatch) -> None:
+    monkeypatch.setattr(image_models, "ImageGenerator", _FakeGen)
+    models = ImageModels(make_cfg(**_MODELS, sd_max_resident=1, sd_max_loaded=2))
+
+    assert models.generate() == "a"
+    assert models.generate(model_id="b") == "b"
+    assert models.loaded() == {"a": "host", "b": "device"}
+
+    assert models.generate(model_id="c") == "c"
+    assert models.loaded() == {"a": "unloaded", "b": "host", "c": "device"}
+
+    # Switching back to a parked model only unloads the least recently used one.
+    models.generate(model_id="b")
+    assert models.loaded() == {"a": "unloaded", "b": "device", "c": "host"}
+
+
+def test_unknown_model(make_cfg, monkeypatch) -> None:
+    monkeypatch.setattr(image_models, "ImageGenerator", _FakeGen)
+    models = ImageModels(make_cfg(**_MODELS))
+    assert models.resolve(None) == "a"
+    with pytest.raises(UnknownModel):
+        models.generate(model_id="nope")
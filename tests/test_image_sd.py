@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+
+import pytest
+from PIL import Image
+
+from speaksee.image_sd import GenerationCancelled, ImageGenerator
+
+torch = pytest.importorskip("torch")
+
+
+class _FakePipe:
+    """Raises device OOM for the first `ooms` calls, then returns an image of the requested size."""
+
+    def __init__(self, ooms: int):
+        self.ooms = ooms
+        self.calls: list[tuple[int, int]] = []
+        self.moved_to: list[str] = []
+
+    def __call__(self, prompt, negative_prompt=None, num_inference_steps=1, guidance_scale=0.0,
+                 width=512, height=512, generator=None):
+        self.calls.append((width, height))
+        if self.ooms > 0:
+            self.ooms -= 1
+            raise RuntimeError("MPS backend out of memory")
+        return SimpleNamespace(images=[Image.new("RGB", (width, height))])
+
+    def to(self, device):
+        self.moved_to.append(device)
+        return self
+
+
+def _gen(make_cfg, ooms: int, **cfg_overrides) -> tuple[ImageGenerator, _FakePipe]:
+    gen = ImageGenerator(make_cfg(width=512, height=512, device_preference="mps", **cfg_overrides))
+    pipe = _FakePipe(ooms)
+    gen._pipe = pipe
+    gen._device = gen._home_device = "mps"
+    return gen, pipe
+
+
+def _run(gen: ImageGenerator):
+    return gen.generate(prompt="x", negative_prompt="", steps=2, width=512, height=512, seed=1)
+
+
+def test_oom_retry_after_freeing_cache_stays_on_device(make_cfg):
+    gen, pipe = _gen(make_cfg, ooms=1)
+    res = _run(gen)
+    assert res.recovery == ("free_cache",)
+    assert res.device == "mps"
+    assert gen.memory_mode == "normal"
+    assert pipe.moved_to == []
+
+
+def test_oom_escalates_offload_then_downscale_before_cpu(make_cfg):
+    gen, pipe = _gen(make_cfg, ooms=3)
+    res = _run(gen)
+    assert res.recovery == ("free_cache", "offload", "downscale")
+    assert (res.width, res.height) == (384, 384)
+    assert gen.memory_mode == "offload"
+    assert "cpu" not in pipe.moved_to
+
+
+def test_oom_falls_back_to_cpu_and_promotes_after_cooldown(make_cfg):
+    gen, pipe = _gen(make_cfg, ooms=3, oom_allow_downscale=False, oom_cooldown_s=0.0)
+    res = _run(gen)
+    assert res.recovery == ("free_cache", "offload", "cpu")
+    assert res.device == "cpu"
+    assert gen.memory_mode == "cpu"
+
+    res = _run(gen)  # cooldown of 0s: next request is back on the home device
+    assert res.device == "mps"
+    assert gen.memory_mode == "normal"
+    assert pipe.moved_to[-1] == "mps"
+
+
+def test_cancelled_generation_never_runs(make_cfg):
+    gen, pipe = _gen(make_cfg, ooms=0)
+    with pytest.raises(GenerationCancelled):
+        gen.generate(
+            prompt="x", negative_prompt="", steps=2, width=512, height=512, should_cancel=lambda: True
+        )
+    assert pipe.calls == []
+
+
+class _BatchPipe(_FakePipe):
+    def __call__(self, prompt, negative_prompt=None, num_inference_steps=1, guidance_scale=0.0,
+                 width=512, height=512, generator=None):
+        n = len(prompt) if isinstance(prompt, list) else 1
+        if n > 1 and self.ooms > 0:
+            self.ooms -= 1
+            self.calls.append((width, height))
+            raise RuntimeError("MPS backend out of memory")
+        self.calls.append((width, height))
+        return SimpleNamespace(images=[Image.new("RGB", (width, height))] * n)
+
+
+def test_batch_that_does_not_fit_renders_one_at_a_time(make_cfg):
+    gen, _ = _gen(make_cfg, ooms=0)
+    pipe = gen._pipe = _BatchPipe(ooms=0)
+    kw = dict(prompts=["a", "b", "c"], negative_prompt="", steps=2, width=64, height=64, seeds=[1, 2, 3])
+    res = gen.generate_batch(**kw)
+    assert [r.seed for r in res] == [1, 2, 3]
+    assert len(pipe.calls) == 1
+
+    pipe.ooms = 1
+    res = gen.generate_batch(**kw)
+    assert [r.seed for r in res] == [1, 2, 3]
+    assert len(pipe.calls) == 1 + 1 + 3  # the failed batch, then one call per prompt
+    assert gen.memory_mode == "normal"
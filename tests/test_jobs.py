@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from speaksee.config import Config
+from speaksee.gallery import image_path
+from speaksee.image_sd import ImageGenResult
+from speaksee.jobs import IdempotencyConflict, JobQueue, JobQueueFull
+from speaksee.server import create_app
+
+
+def test_idempotency_and_queue_limit(make_cfg) -> None:
+    async def scenario() -> None:
+        q = JobQueue(make_cfg(job_queue_max=2))
+        release = asyncio.Event()
+        runs = 0
+
+        async def runner(job):
+            nonlocal runs
+            runs += 1
+            await release.wait()
+            return {"n": runs}
+
+        a, created = q.submit("generate", "fp1", runner, idempotency_key="k1")
+        assert created
+        again, created = q.submit("generate", "fp1", runner, idempotency_key="k1")
+        assert again is a and not created
+        with pytest.raises(IdempotencyConflict):
+            q.submit("generate", "fp2", runner, idempotency_key="k1")
+
+        await asyncio.sleep(0)  # `a` starts running; two more may wait
+        b, _ = q.submit("generate", "fp2", runner)
+        q.submit("generate", "fp3", runner)
+        assert q.describe(b)["queue_position"] == 0
+        with pytest.raises(JobQueueFull):
+            q.submit("generate", "fp4", runner)
+
+        release.set()
+        events = [e["event"] async for e in q.stream(a) if e is not None]
+        assert events == ["queued", "started", "result"]
+        assert a.result == {"n": 1}
+        # Resuming after "started" only replays what came later.
+        assert [e["event"] async for e in q.stream(a, after=1) if e is not None] == ["result"]
+        await q.close()
+        assert runs == 3
+
+    asyncio.run(scenario())
+
+
+def test_http_generate_job(cfg: Config) -> None:
+    app = create_app(cfg)
+    calls = []
+
+    def fake_generate(**kwargs):
+        calls.append(kwargs)
+        kwargs["on_progress"](1, 2)
+        kwargs["on_progress"](2, 2)
+        return ImageGenResult(
+            image=Image.new("RGB", (kwargs["width"], kwargs["height"]), "red"),
+            seed=kwargs["seed"],
+            device="cpu",
+            width=kwargs["width"],
+            height=kwargs["height"],
+            model_id=kwargs["model_id"],
+            steps_run=kwargs["steps"],
+        )
+
+    app.state.runtime.gen.generate = fake_generate
+    with TestClient(app) as client:
+        assert client.post("/api/generate", json={"prompt": " "}).status_code == 400
+        assert client.post("/api/generate", json={"prompt": "x", "model": "nope"}).status_code == 400
+
+        body = {"prompt": "a red square", "style": "abstract", "seed": 5, "width": 100}
+        r = client.post("/api/generate", json=body, headers={"Idempotency-Key": "abc"})
+        assert r.status_code == 202
+        job_id = r.json()["id"]
+
+        with client.stream("GET", f"/api/jobs/{job_id}/events") as stream:
+            text = "".join(stream.iter_text())
+        events = [line[len("event: "):] for line in text.splitlines() if line.startswith("event: ")]
+        assert events == ["queued", "started", "progress", "progress", "result"]
+
+        job = client.get(f"/api/jobs/{job_id}").json()
+        assert job["status"] == "done" and job["progress"]["percent"] == 100
+        assert job["result"]["seed"] == 5 and job["result"]["width"] == 96  # multiple of 8
+        assert client.get(job["result"]["url"]).status_code == 200
+        assert calls[0]["prompt"].startswith("a red square, abstract")
+
+        # A retried request returns the same job without generating again.
+        r = client.post("/api/generate", json=body, headers={"Idempotency-Key": "abc"})
+        assert r.status_code == 200 and r.json()["id"] == job_id
+        assert len(calls) == 1
+        r = client.post("/api/generate", json={**body, "seed": 6}, headers={"Idempotency-Key": "abc"})
+        assert r.status_code == 422
+
+        assert client.get("/api/jobs/unknown").status_code == 404
+        meta = json.loads(image_path(app.state.runtime.cfg, job["result"]["image_id"]).with_suffix(".json").read_text())
+        assert meta["job_id"] == job_id
@@ -0,0 +1,123 @@
+import threading
+import time
+
+from speaksee.config import Config
+from speaksee.memory import MemoryManager
+
+MB = 1024 * 1024
+
+
+class _FakeModel:
+    def __init__(self, size_mb: int, last_used: float, busy: bool = False):
+        self.size = size_mb * MB
+        self.residency = "device"
+        self.last_used = last_used
+        self.busy = busy
+
+    def footprint(self):
+        if self.residency == "device":
+            return self.size, 0
+        if self.residency == "host":
+            return 0, self.size
+        return 0, 0
+
+    def park(self):
+        if self.busy or self.residency != "device":
+            return False
+        self.residency = "host"
+        return True
+
+    def unload(self):
+        if self.busy:
+            return False
+        self.residency = "unloaded"
+        return True
+
+    def warm(self):
+        self.residency = "device"
+        self.last_used = time.monotonic()
+
+
+def test_idle_models_are_parked_then_unloaded(make_cfg):
+    mm = MemoryManager(make_cfg(idle_offload_s=10.0, idle_unload_s=100.0))
+    now = time.monotonic()
+    fresh, idle, stale = _FakeModel(1, now), _FakeModel(1, now - 20), _FakeModel(1, now - 200)
+    for name, m in (("fresh", fresh), ("idle", idle), ("stale", stale)):
+        mm.register(name, m)
+
+    actions = mm.sweep()
+    assert sorted(actions) == ["park:idle", "unload:stale"]
+    assert (fresh.residency, idle.residency, stale.residency) == ("device", "host", "unloaded")
+
+
+def test_gpu_budget_evicts_least_recently_used_first(make_cfg):
+    mm = MemoryManager(make_cfg(gpu_budget_mb=5))
+    now = time.monotonic()
+    old, mid, new = _FakeModel(3, now - 30), _FakeModel(3, now - 20), _FakeModel(3, now - 10)
+    mm.register("old", old)
+    mm.register("mid", mid)
+    mm.register("new", new)
+
+    assert mm.sweep() == ["park:old", "park:mid"]
+    assert new.residency == "device"
+    assert mm.snapshot()["device_bytes"] == 3 * MB
+
+
+def test_busy_model_is_skipped(make_cfg):
+    mm = MemoryManager(make_cfg(gpu_budget_mb=3))
+    now = time.monotonic()
+    busy, other = _FakeModel(3, now - 30, busy=True), _FakeModel(3, now - 10)
+    mm.register("busy", busy)
+    mm.register("other", other)
+
+    assert mm.sweep() == ["park:other"]
+    assert busy.residency == "device"
+
+
+def test_prepare_makes_room_before_warming(make_cfg):
+    mm = MemoryManager(make_cfg(gpu_budget_mb=4))
+    now = time.monotonic()
+    stt, sd = _FakeModel(3, now - 10), _FakeModel(3, now - 5)
+    mm.register("stt", stt)
+    mm.register("sd", sd)
+    mm.usage()  # learn footprints
+    stt.residency = "host"
+
+    actions = mm.prepare("stt")
+    assert actions == ["park:sd", "warm:stt"]
+    assert (stt.residency, sd.residency) == ("device", "host")
+
+
+def test_stt_decodes_concurrently_and_is_not_parked_in_use(cfg: Config):
+    from speaksee.stt_whisper import SpeechToText
+
+    started, release = threading.Barrier(3), threading.Event()
+
+    class _Ct2:
+        device = "cuda"
+        model_is_loaded = True
+
+        def unload_model(self, to_cpu=False):
+            self.model_is_loaded = False
+
+    class _Whisper:
+        model = _Ct2()
+
+        def transcribe(self, audio, **kw):
+            started.wait(5)  # both decodes must be running at once
+            release.wait(5)
+            return [], None
+
+    stt = SpeechToText(cfg)
+    stt._model = _Whisper()
+    threads = [
+        threading.Thread(target=stt.transcribe_partial, args=(b"\x01\x00" * 160, 16000)) for _ in range(2)
+    ]
+    for t in threads:
+        t.start()
+    started.wait(5)
+    assert not stt.park() and not stt.unload()
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert stt.park() and stt.residency == "host"
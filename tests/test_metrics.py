@@ -0,0 +1,69 @@
+import pytest
+
+from speaksee.metrics import REGISTRY, Registry
+
+
+def test_counter_and_gauge_render() -> None:
+    r = Registry()
+    c = r.counter("t_bytes_total", "Bytes.", ("format",))
+    g = r.gauge("t_sessions", "Sessions.")
+    c.inc(10, format="pcm16")
+    c.inc(5, format="pcm16")
+    g.inc()
+    g.inc()
+    g.dec()
+    text = r.render()
+    assert "# TYPE t_bytes_total counter" in text
+    assert 't_bytes_total{format="pcm16"} 15' in text
+    assert "t_sessions 1" in text
+    assert text.endswith("\n")
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    r = Registry()
+    h = r.histogram("t_seconds", "Latency.", ("kind",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.7, 3.0):
+        h.observe(v, kind="final")
+    lines = r.render().splitlines()
+    assert 't_seconds_bucket{kind="final",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{kind="final",le="1"} 3' in lines
+    assert 't_seconds_bucket{kind="final",le="+Inf"} 4' in lines
+    assert 't_seconds_count{kind="final"} 4' in lines
+    assert any(line.startswith('t_seconds_sum{kind="final"} 4.25') for line in lines)
+    assert h.count(kind="final") == 4
+
+
+def test_labels_are_escaped_and_checked() -> None:
+    r = Registry()
+    g = r.gauge("t_info", "Info.", ("model",))
+    g.set(1, model='a"b\\c\nd')
+    assert 't_info{model="a\\"b\\\\c\\nd"} 1' in r.render()
+    with pytest.raises(ValueError):
+        g.set(1, device="cpu")
+    with pytest.raises(ValueError):
+        r.gauge("t_info", "Again.")
+
+
+def test_collectors_run_before_render() -> None:
+    r = Registry()
+    g = r.gauge("t_device_info", "Device.", ("device",))
+
+    def collect() -> None:
+        g.clear()
+        g.set(1, device="cpu")
+
+    r.on_collect(collect)
+    assert 't_device_info{device="cpu"} 1' in r.render()
+    r.remove_collector(collect)
+
+
+def test_speaksee_metrics_registered() -> None:
+    text = REGISTRY.render()
+    for name in (
+        "speaksee_stt_seconds",
+        "speaksee_generation_seconds",
+        "speaksee_generation_queue_wait_seconds",
+        "speaksee_active_sessions",
+        "speaksee_device_info",
+    ):
+        assert f"# TYPE {name} " in text
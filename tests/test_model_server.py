@@ -0,0 +1,167 @@
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+from speaksee import model_server
+from speaksee.config import Config
+from speaksee.image_models import UnknownModel
+from speaksee.image_sd import GenerationCancelled, ImageGenResult
+from speaksee.model_server import (
+    ModelClient,
+    ModelServer,
+    RemoteImageModels,
+    RemoteMemory,
+    RemoteSpeechToText,
+)
+from speaksee.stt_whisper import SttResult
+from speaksee.tracing import TRACER, new_trace_id, set_trace, span
+
+
+class _FakeStt:
+    loaded_device = "cpu"
+
+    def transcribe_final(self, pcm16: bytes, sample_rate: int) -> SttResult:
+        return SttResult(f"{len(pcm16)} bytes at {sample_rate}")
+
+    transcribe_partial = transcribe_final
+
+
+class _FakeGen:
+    device = "cpu"
+    memory_mode = "normal"
+    last_recovery = ()
+
+    def __init__(self) -> None:
+        self.init_sizes = []
+
+    def devices(self):
+        return {"fake": "cpu"}
+
+    def generate(self, *, prompt, width, height, seed, on_progress, should_cancel, init_image=None, **kw):
+        self.init_sizes.append(init_image.size if init_image is not None else None)
+        with span("fake.pipeline"):
+            on_progress(1, 2)
+            if prompt == "slow":
+                deadline = time.monotonic() + 5
+                while not should_cancel():
+                    if time.monotonic() > deadline:
+                        raise AssertionError("never cancelled")
+                    time.sleep(0.01)
+                raise GenerationCancelled()
+            on_progress(2, 2)
+        return ImageGenResult(
+            image=Image.new("RGB", (width, height), "blue"), seed=seed, device="cpu", width=width, height=height,
+            model_id="fake", steps_run=2,
+        )
+
+
+class _FakeMemory:
+    def prepare(self, *names):
+        return [f"warm {n}" for n in names]
+
+    def snapshot(self):
+        return {"models": []}
+
+    def sweep(self):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path: Path, cfg: Config):
+    gen = _FakeGen()
+    srv = ModelServer(cfg, stt=_FakeStt(), gen=gen, memory=_FakeMemory())
+    address = str(tmp_path / "m.sock")
+    threading.Thread(target=srv.serve_forever, args=(address,), daemon=True).start()
+    client = ModelClient(address, connect_timeout_s=5)
+    yield client, gen
+    srv.close()
+
+
+def _shm_segments() -> set[str]:
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+def test_calls_over_socket_and_shared_memory(server, cfg: Config) -> None:
+    client, fake_gen = server
+    before = _shm_segments()
+    stt = RemoteSpeechToText(client)
+    assert stt.transcribe_final(b"\x01\x00" * 800, 16000).text == "1600 bytes at 16000"
+    assert stt.transcribe_partial(b"", 16000).text == "0 bytes at 16000"
+    assert stt.loaded_device == "cpu"
+
+    gen = RemoteImageModels(cfg, client)
+    with pytest.raises(UnknownModel):
+        gen.resolve("other")
+    steps = []
+    trace_id = new_trace_id()
+    set_trace(trace_id)
+    try:
+        res = gen.generate(
+            model_id="fake", prompt="x", negative_prompt="", steps=2, width=48, height=32, seed=3,
+            on_progress=lambda i, n: steps.append((i, n)), init_image=Image.new("RGB", (16, 8)),
+        )
+    finally:
+        set_trace(None)
+    assert res.image.size == (48, 32) and res.image.getpixel((0, 0)) == (0, 0, 255)
+    assert res.seed == 3 and steps == [(1, 2), (2, 2)]
+    assert fake_gen.init_sizes == [(16, 8)]
+    assert gen.device == "cpu" and gen.devices() == {"fake": "cpu"}
+    assert RemoteMemory(client).prepare("stt", "sd") == ["warm stt", "warm sd"]
+    # The server's spans come back into this process's trace.
+    assert any(s.thread_name.startswith("model-server/") for s in TRACER.spans(trace_id))
+    assert _shm_segments() == before  # every segment was unlinked by its receiver
+
+
+def test_cancel_reaches_the_model_server(server, cfg: Config) -> None:
+    client, _ = server
+    gen = RemoteImageModels(cfg, client)
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    with pytest.raises(GenerationCancelled):
+        gen.generate(
+            model_id="fake", prompt="slow", negative_prompt="", steps=2, width=8, height=8, seed=1,
+            on_progress=lambda i, n: None, should_cancel=cancel.is_set,
+        )
+    assert client.call("ping") == "pong"
+
+
+def test_failed_calls_unlink_their_shared_memory(tmp_path: Path, cfg: Config) -> None:
+    before = _shm_segments()
+    client = ModelClient(str(tmp_path / "nobody.sock"), connect_timeout_s=0.1)
+    with pytest.raises(ConnectionError):
+        RemoteSpeechToText(client).transcribe_final(b"\x01\x00" * 800, 16000)
+    with pytest.raises(ConnectionError):
+        RemoteImageModels(cfg, client).generate(
+            model_id="fake", prompt="x", negative_prompt="", steps=1, width=8, height=8, seed=1,
+            init_image=Image.new("RGB", (16, 8)),
+        )
+    assert _shm_segments() == before
+
+
+def test_windows_is_refused_up_front(monkeypatch) -> None:
+    monkeypatch.setattr(sys, "platform", "win32")
+    with pytest.raises(SystemExit, match="SPEAKSEE_WEB_WORKERS=1"):
+        model_server.main([])
+
+
+def test_generator_status_is_fetched_again_when_stale(server, cfg: Config, monkeypatch) -> None:
+    client, fake_gen = server
+    gen = RemoteImageModels(cfg, client)
+    assert gen.device == "cpu"
+    fake_gen.device = "mps"  # e.g. another web worker moved the shared model
+    assert gen.device == "cpu"  # cached
+    monkeypatch.setattr(model_server, "_STATUS_TTL_S", 0.0)
+    assert gen.device == "mps"
+
+
+def test_failed_send_forgets_the_request(server) -> None:
+    client, _ = server
+    with pytest.raises(Exception):
+        client.call("ping", lambda: None)  # cannot be pickled
+    assert client._pending == {}
+    assert client.call("ping") == "pong"
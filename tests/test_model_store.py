@@ -0,0 +1,62 @@
+import hashlib
+from pathlib import Path
+
+from speaksee.config import Config
+from speaksee.model_store import ModelStore
+
+
+def _snapshot(tmp_path: Path) -> Path:
+    # Mimic the HF cache layout: snapshot files are symlinks to content-addressed blobs.
+    data = b"weights" * 100
+    blobs = tmp_path / "blobs"
+    blobs.mkdir()
+    blob = blobs / hashlib.sha256(data).hexdigest()
+    blob.write_bytes(data)
+    snap = tmp_path / "snapshots" / "abc"
+    (snap / "unet").mkdir(parents=True)
+    (snap / "unet" / "model.safetensors").symlink_to(blob)
+    (snap / "model_index.json").write_text("{}")
+    return snap
+
+
+def test_record_and_get_roundtrip(tmp_path: Path, cfg: Config) -> None:
+    store = ModelStore(cfg)
+    snap = _snapshot(tmp_path)
+    store.record("sd", "org/sd", snap, variant="fp16", dtype="torch.float16", device="cuda")
+
+    entry = ModelStore(cfg).get("sd", "org/sd")
+    assert entry is not None
+    assert entry.path == str(snap.resolve())
+    assert entry.variant == "fp16"
+    assert entry.files == {"model_index.json": 2, "unet/model.safetensors": 700}
+    assert store.get("stt", "org/sd") is None
+
+    store.forget("sd", "org/sd")
+    assert store.get("sd", "org/sd") is None
+
+
+def test_missing_snapshot_is_ignored(tmp_path: Path, cfg: Config) -> None:
+    store = ModelStore(cfg)
+    snap = _snapshot(tmp_path)
+    store.record("sd", "org/sd", snap)
+    (snap / "model_index.json").unlink()
+    (snap / "unet" / "model.safetensors").unlink()
+    (snap / "unet").rmdir()
+    snap.rmdir()
+    assert store.get("sd", "org/sd") is None
+
+
+def test_verify_detects_corruption(tmp_path: Path, cfg: Config) -> None:
+    store = ModelStore(cfg)
+    snap = _snapshot(tmp_path)
+    entry = store.record("sd", "org/sd", snap)
+    assert store.verify(entry, deep=True) == []
+
+    # Same size, different bytes: only the deep check notices.
+    blob = (snap / "unet" / "model.safetensors").resolve()
+    blob.write_bytes(b"x" * 700)
+    assert store.verify(entry) == []
+    assert store.verify(entry, deep=True) == ["checksum mismatch unet/model.safetensors"]
+
+    (snap / "model_index.json").write_text("{\"a\": 1}")
+    assert any("size mismatch" in p for p in store.verify(entry))
@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+from speaksee.outbox import CLOSE_TOO_SLOW, Outbox
+
+
+class _FakeWs:
+    def __init__(self, delay_s: float = 0.0):
+        self.delay_s = delay_s
+        self.sent: list[dict] = []
+        self.closed_with = None
+
+    async def send_text(self, text: str) -> None:
+        if self.delay_s:
+            await asyncio.sleep(self.delay_s)
+        self.sent.append(json.loads(text))
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed_with = code
+
+
+def _progress(step: int) -> dict:
+    return {"type": "gen_progress", "step": step, "total_steps": 10, "percent": step * 10}
+
+
+async def _drain(out: Outbox) -> None:
+    for _ in range(100):
+        if not len(out):
+            break
+        await asyncio.sleep(0.01)
+    await out.close()
+
+
+def test_progress_coalesced_and_superseded_by_result() -> None:
+    async def run() -> list[dict]:
+        ws = _FakeWs()
+        out = Outbox(ws)
+        out.start()  # writer has not run yet: everything below is queued
+        out.send({"type": "gen_started"})
+        for i in range(1, 6):
+            out.send(_progress(i))
+        out.send({"type": "status", "phase": "generating"})
+        for i in range(6, 9):
+            out.send(_progress(i))
+        out.send({"type": "gen_result", "id": "x"})
+        await _drain(out)
+        return ws.sent
+
+    sent = asyncio.run(run())
+    assert [(m["type"], m.get("step")) for m in sent] == [
+        ("gen_started", None),
+        ("gen_progress", 5),  # replaced in place, still before the status sent after it
+        ("status", None),
+        ("gen_result", None),  # the progress queued after the status was obsolete
+    ]
+
+
+def test_state_is_coalesced_and_critical_messages_overtake_droppable_ones() -> None:
+    async def run() -> list[dict]:
+        ws = _FakeWs()
+        out = Outbox(ws)
+        out.start()
+        out.send({"type": "status", "phase": "idle"})
+        out.send({"type": "gallery", "items": ["a"]})
+        out.send({"type": "tts", "text": "Saved"})
+        out.send({"type": "transcript_partial", "text": "a c"})
+        out.send({"type": "status", "phase": "ready"})
+        out.send({"type": "gallery", "items": ["a", "b"]})
+        out.send({"type": "transcript_partial", "text": "a ca"})
+        out.send({"type": "error", "message": "boom"})
+        await _drain(out)
+        return ws.sent
+
+    sent = asyncio.run(run())
+    assert [(m["type"], m.get("phase") or m.get("items") or m.get("text")) for m in sent] == [
+        ("tts", "Saved"),
+        ("transcript_partial", "a c"),
+        ("status", "ready"),  # the queued "idle" was replaced
+        ("gallery", ["a", "b"]),
+        ("error", None),  # ahead of the partial queued before it, not of the state
+        ("transcript_partial", "a ca"),
+    ]
+
+
+def test_backpressure_sheds_droppable_then_disconnects() -> None:
+    async def run() -> tuple[_FakeWs, Outbox]:
+        ws = _FakeWs()
+        out = Outbox(ws, max_queue=8)
+        out.start()
+        for i in range(8):
+            out.send({"type": "status", "phase": str(i)})
+            out.send({"type": "transcript_partial", "text": str(i)})
+        assert len(out) == 8 and not out.closed  # the oldest partial was dropped
+        assert [m.msg["phase"] for m in out._queue if m.msg["type"] == "status"] == ["7"]
+        out.send({"type": "error", "message": "boom"})
+        out.send({"type": "status", "phase": "late"})
+        types = [m.msg["type"] for m in out._queue]
+        assert len(out) <= 8 and types[-3:] == ["error", "transcript_partial", "status"]
+        for i in range(10):
+            out.send({"type": "gen_result", "id": str(i)})
+        await asyncio.sleep(0.05)
+        return ws, out
+
+    ws, out = asyncio.run(run())
+    assert out.closed
+    assert ws.closed_with == CLOSE_TOO_SLOW
+
+
+def test_stalled_client_is_disconnected() -> None:
+    async def run() -> _FakeWs:
+        ws = _FakeWs(delay_s=1.0)
+        out = Outbox(ws, send_timeout_s=0.05)
+        out.start()
+        out.send({"type": "status", "phase": "ready"})
+        await asyncio.sleep(0.2)
+        assert out.closed
+        return ws
+
+    assert asyncio.run(run()).closed_with == CLOSE_TOO_SLOW
@@ -0,0 +1,89 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from speaksee.config import Config
+from speaksee.profiling import Profiler, ProfilerBusy
+
+
+def _transcribe(pcm: bytes) -> str:
+    return str(sum(pcm))
+
+
+def test_disarmed_wrap_is_the_function_itself(cfg: Config) -> None:
+    p = Profiler(cfg)
+    assert p.wrap("stt", _transcribe) is _transcribe
+    assert p.status() == {"active": False}
+
+
+def test_captures_the_next_n_calls(cfg: Config) -> None:
+    p = Profiler(cfg)
+    p.arm(stt=1)
+    profiled = p.wrap("stt", _transcribe)
+    assert profiled is not _transcribe
+    assert p.wrap("generate", _transcribe) is _transcribe  # not armed for generations
+    assert profiled(b"\x01\x02") == "3"
+    assert p.wrap("stt", _transcribe) is _transcribe  # capture used up
+
+    status = p.status()
+    assert status["active"] is False
+    out = cfg.data_dir / "logs" / "profiles"
+    assert (out / status["artifacts"][0]).suffix == ".pstats"
+    summary = json.loads((out / f"{status['capture_id']}.json").read_text())
+    assert summary["runs"][0]["kind"] == "stt"
+    assert summary["runs"][0]["name"] == "_transcribe"
+
+
+def test_arm_validation(cfg: Config) -> None:
+    p = Profiler(cfg)
+    with pytest.raises(ValueError):
+        p.arm()
+    p.arm(generate=2)
+    with pytest.raises(ProfilerBusy):
+        p.arm(stt=1)
+
+
+def test_overlapping_or_failing_profiles_run_unprofiled(cfg: Config, monkeypatch: pytest.MonkeyPatch) -> None:
+    p = Profiler(cfg)
+    p.arm(stt=3)
+    inner = p.wrap("stt", _transcribe)
+
+    def outer(pcm: bytes) -> str:
+        return inner(pcm)  # overlaps the outer capture
+
+    assert p.wrap("stt", outer)(b"\x01") == "1"
+    runs = p.status()["runs"]
+    assert runs[0]["skipped"] and "skipped" not in runs[1]  # inner was wrapped first
+
+    class _Busy:
+        def enable(self) -> None:
+            raise ValueError("Another profiling tool is already active")
+
+    monkeypatch.setattr("speaksee.profiling.cProfile.Profile", _Busy)
+    assert p.wrap("stt", _transcribe)(b"\x02") == "2"
+    assert p.status()["runs"][2]["skipped"] == "Another profiling tool is already active"
+
+
+def test_torch_profiler_failures_never_fail_the_call(cfg: Config, monkeypatch: pytest.MonkeyPatch) -> None:
+    class _Broken:
+        def __init__(self, fail_on: str) -> None:
+            self.fail_on = fail_on
+
+        def __enter__(self) -> None:
+            if self.fail_on == "enter":
+                raise RuntimeError("profiler already running")
+
+        def __exit__(self, *exc) -> None:
+            if self.fail_on == "exit":
+                raise RuntimeError("could not collect")
+
+    p = Profiler(cfg)
+    p.arm(generate=2)
+    for fail_on in ("enter", "exit"):
+        monkeypatch.setattr(Profiler, "_torch_profiler", staticmethod(lambda: _Broken(fail_on)))
+        assert p.wrap("generate", _transcribe)(b"\x03") == "3"
+    runs = p.status()["runs"]
+    assert runs[0]["skipped"].startswith("could not start")
+    assert "skipped" not in runs[1] and "elapsed_s" in runs[1]
+    assert [Path(a).suffix for a in p.status()["artifacts"]] == [".pstats"]  # no torch export
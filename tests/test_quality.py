@@ -0,0 +1,75 @@
+
+import pytest
+
+from speaksee.config import Config
+from speaksee.quality import QualityController
+
+
+@pytest.fixture
+def cfg(make_cfg) -> Config:
+    return make_cfg(latency_target_s=1.5)
+
+
+def _observe(q: QualityController, step_s: float, overhead_s: float = 0.0) -> None:
+    # One 512x512, 4-step generation.
+    q.observe("m", "cuda", steps_run=4, width=512, height=512, elapsed_s=4 * step_s + overhead_s, step_s=step_s)
+
+
+def test_uses_ceiling_until_measured(cfg: Config) -> None:
+    q = QualityController(cfg)
+    c = q.choose("m", "cuda", steps=4, width=512, height=512)
+    assert (c.steps, c.width, c.height, c.mode) == (4, 512, 512, "adaptive")
+    assert c.predicted_s == 0.0
+
+
+def test_fast_device_keeps_full_quality(cfg: Config) -> None:
+    q = QualityController(cfg)
+    _observe(q, step_s=0.1, overhead_s=0.2)
+    c = q.choose("m", "cuda", steps=4, width=512, height=512)
+    assert (c.steps, c.width, c.height) == (4, 512, 512)
+    assert abs(c.predicted_s - 0.6) < 1e-6
+
+
+def test_slow_device_trades_steps_and_resolution(cfg: Config) -> None:
+    q = QualityController(cfg)
+    _observe(q, step_s=0.6)  # 2.4s at full quality
+    c = q.choose("m", "cuda", steps=4, width=512, height=512)
+    assert c.predicted_s <= 1.5
+    assert (c.width, c.height) == (512, 512) and c.steps == 2  # resolution first
+
+    q = QualityController(cfg)
+    _observe(q, step_s=3.0)  # even one full-size step misses the target
+    c = q.choose("m", "cuda", steps=4, width=512, height=512)
+    assert c.width < 512 and c.width % 8 == 0 and c.width >= 256
+
+
+def test_queue_wait_counts_against_target(cfg: Config) -> None:
+    q = QualityController(cfg)
+    _observe(q, step_s=0.15)  # 0.6s per image
+    with q.running(), q.running():
+        c = q.choose("m", "cuda", steps=4, width=512, height=512)
+    assert c.queue_depth == 2
+    assert c.steps < 4 or c.width < 512
+
+
+def test_disabled_is_fixed(make_cfg) -> None:
+    q = QualityController(make_cfg())  # off by default
+    _observe(q, step_s=5.0)
+    c = q.choose("m", "cuda", steps=4, width=512, height=512)
+    assert (c.steps, c.width, c.height, c.mode) == (4, 512, 512, "fixed")
+
+
+def test_preview_is_small_and_cheap(make_cfg) -> None:
+    q = QualityController(make_cfg(latency_target_s=1.5, preview_side=256))
+    planned = q.choose("m", "cuda", steps=4, width=768, height=512)
+    c = q.preview("m", "cuda", planned, steps=4, width=768, height=512)
+    assert (c.steps, c.width, c.height, c.mode) == (1, 256, 168, "preview")
+
+    # Not worth a second render: already at preview size with too few steps to cut...
+    assert q.preview("m", "cuda", planned, steps=2, width=256, height=256) is None
+    assert q.preview("m", "cuda", planned, steps=4, width=256, height=256) is not None
+    # ... or the full image is predicted to arrive within the target anyway.
+    _observe(q, step_s=0.1)
+    fast = q.choose("m", "cuda", steps=4, width=512, height=512)
+    assert fast.predicted_s <= 1.5
+    assert q.preview("m", "cuda", fast, steps=4, width=512, height=512) is None
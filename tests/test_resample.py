@@ -0,0 +1,50 @@
+import numpy as np
+
+from speaksee.audio_codec import create_decoder
+from speaksee.resample import StreamingResampler, resample_pcm16
+
+
+def _sine_pcm16(rate: int, freq: float, seconds: float = 1.0) -> bytes:
+    t = np.arange(int(rate * seconds)) / rate
+    return (0.5 * np.sin(2 * np.pi * freq * t) * 32767).astype(np.int16).tobytes()
+
+
+def _rms(pcm16: bytes) -> float:
+    a = np.frombuffer(pcm16, dtype=np.int16).astype(np.float64) / 32768.0
+    a = a[200:-200]  # skip filter warm-up / tail
+    return float(np.sqrt(np.mean(a * a)))
+
+
+def test_streaming_matches_one_shot_for_odd_chunks():
+    pcm = _sine_pcm16(44100, 1000.0)
+    r = StreamingResampler(44100, 16000)
+    out = bytearray()
+    for i in range(0, len(pcm), 1001):  # odd sizes split samples across chunks
+        out += r.process(pcm[i : i + 1001])
+    out += r.flush()
+    assert bytes(out) == resample_pcm16(pcm, 44100, 16000)
+
+
+def test_resample_length_and_passband():
+    out = resample_pcm16(_sine_pcm16(48000, 1000.0), 48000, 16000)
+    n = len(out) // 2
+    assert abs(n - 16000) < 64
+    assert abs(_rms(out) - 0.3535) < 0.01
+
+
+def test_resample_rejects_aliasing_tone():
+    out = resample_pcm16(_sine_pcm16(48000, 11000.0), 48000, 16000)
+    assert _rms(out) < 0.02
+
+
+def test_passthrough_at_target_rate():
+    pcm = _sine_pcm16(16000, 440.0, 0.1)
+    assert StreamingResampler(16000, 16000).process(pcm) == pcm
+
+
+def test_pcm16_decoder_resamples_and_downmixes_stereo():
+    mono = np.frombuffer(_sine_pcm16(48000, 1000.0), dtype=np.int16)
+    stereo = np.repeat(mono, 2).tobytes()
+    dec = create_decoder("pcm16", 48000, channels=2, target_rate=16000)
+    out = dec.decode(stereo[:1001]) + dec.decode(stereo[1001:]) + dec.flush()
+    assert abs(len(out) // 2 - 16000) < 64
@@ -0,0 +1,78 @@
+import gzip
+import json
+from dataclasses import replace
+
+from speaksee.config import Config
+from speaksee.session_record import (
+    KIND_IN_BYTES,
+    KIND_IN_TEXT,
+    KIND_META,
+    KIND_OUT_TEXT,
+    Record,
+    SessionRecorder,
+    diff_sessions,
+    read_records,
+)
+
+
+def test_off_by_default(cfg: Config) -> None:
+    assert SessionRecorder.create(cfg) is None
+
+
+def test_roundtrip(cfg: Config) -> None:
+    rec = SessionRecorder.create(replace(cfg, session_record=True))
+    assert rec is not None
+    rec.incoming_text(json.dumps({"type": "audio_start"}))
+    rec.incoming_bytes(b"\x01\x00" * 320)
+    rec.outgoing(json.dumps({"type": "status", "phase": "recording"}))
+    rec.close()
+    assert rec.path.parent == cfg.data_dir / "logs" / "sessions"
+
+    records = list(read_records(rec.path))
+    assert [r.kind for r in records] == [KIND_META, KIND_IN_TEXT, KIND_IN_BYTES, KIND_OUT_TEXT]
+    assert records[0].message()["sd_model"] == "fake"
+    assert records[2].data == b"\x01\x00" * 320
+    assert records[3].message()["phase"] == "recording"
+    assert records[1].t <= records[2].t <= records[3].t
+
+
+def test_truncated_recording_is_readable(cfg: Config) -> None:
+    rec = SessionRecorder.create(replace(cfg, session_record=True))
+    assert rec is not None
+    rec.incoming_text(json.dumps({"type": "hello"}))
+    rec.close()
+    data = gzip.decompress(rec.path.read_bytes())
+    rec.path.write_bytes(gzip.compress(data + b"\x03\x00"))  # half a header, as after a crash
+    assert [r.kind for r in read_records(rec.path)] == [KIND_META, KIND_IN_TEXT]
+
+
+def _session(final_text: str, final_at: float, result_at: float) -> list[Record]:
+    def out(t: float, **msg: object) -> Record:
+        return Record(KIND_OUT_TEXT, t, json.dumps(msg))
+
+    def inp(t: float, **msg: object) -> Record:
+        return Record(KIND_IN_TEXT, t, json.dumps(msg))
+
+    return [
+        inp(0.0, type="audio_start"),
+        out(0.5, type="transcript_partial", text="a c"),
+        inp(1.0, type="audio_stop"),
+        out(final_at, type="transcript_final", text=final_text, command=None, trace_id="x"),
+        inp(final_at + 0.1, type="generate", prompt=final_text),
+        out(result_at, type="gen_result", id="img", seed=1, prompt=final_text),
+    ]
+
+
+def test_diff_reports_timings_and_content() -> None:
+    recorded = _session("a cat", 1.3, 2.4)
+    same = diff_sessions(recorded, _session("a cat", 1.2, 3.3))
+    assert same["mismatches"] == [] and same["count_mismatches"] == []
+    timings = {t["type"]: t for t in same["timings"]}
+    assert timings["transcript_final"]["recorded_ms"] == 300.0
+    assert timings["transcript_final"]["replayed_ms"] == 200.0
+    assert timings["gen_result"]["delta_ms"] == 1000.0
+
+    changed = diff_sessions(recorded, _session("a hat", 1.3, 2.4))
+    assert {m["type"] for m in changed["mismatches"]} == {"transcript_final", "gen_result"}
+    missing = diff_sessions(recorded, _session("a cat", 1.3, 2.4)[:-1])
+    assert missing["count_mismatches"] == ["gen_result"]
@@ -1,38 +1,18 @@
 import io
 import os
-from pathlib import Path
 
 import pytest
 from fastapi.testclient import TestClient
 from PIL import Image
 
-from speaksee.config import Config
 from speaksee.server import create_app
 
 
-def _cfg(tmp_path: Path) -> Config:
-    data_dir = tmp_path / "data"
-    gallery_dir = data_dir / "gallery"
-    saved_dir = data_dir / "saved"
-    hf_home = data_dir / "hf"
-    gallery_dir.mkdir(parents=True, exist_ok=True)
-    saved_dir.mkdir(parents=True, exist_ok=True)
-    hf_home.mkdir(parents=True, exist_ok=True)
-    return Config(
-        root_dir=tmp_path,
-        host="127.0.0.1",
-        port=7860,
-        data_dir=data_dir,
-        gallery_dir=gallery_dir,
-        saved_dir=saved_dir,
-        hf_home=hf_home,
-        sd_model="hf-internal-testing/tiny-stable-diffusion-pipe",
-        whisper_model="Systran/faster-whisper-base",
-        steps=1,
-        width=64,
-        height=64,
-        device_preference="cpu",
-    )
+_MODELS = dict(
+    sd_model="hf-internal-testing/tiny-stable-diffusion-pipe",
+    whisper_model="Systran/faster-whisper-base",
+    steps=1,
+)
 
 
 def _assert_not_all_black_png(png_bytes: bytes) -> None:
@@ -42,11 +22,11 @@ def _assert_not_all_black_png(png_bytes: bytes) -> None:
     assert any(mx > 0 for _mn, mx in extrema), f"image looks all-black: extrema={extrema}"
 
 
-def test_smoke_ws_generate_and_save(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+def test_smoke_ws_generate_and_save(make_cfg, monkeypatch: pytest.MonkeyPatch) -> None:
     if os.getenv("SPEAKSEE_OFFLINE", "").strip() in ("1", "true", "yes", "on"):
         pytest.skip("SPEAKSEE_OFFLINE set")
 
-    cfg = _cfg(tmp_path)
+    cfg = make_cfg(**_MODELS)
     monkeypatch.setenv("HF_HUB_DISABLE_TELEMETRY", "1")
     monkeypatch.setenv("HF_HUB_DISABLE_PROGRESS_BARS", "1")
 
@@ -83,3 +63,34 @@ def test_smoke_ws_generate_and_save(tmp_path: Path, monkeypatch: pytest.MonkeyPa
                 raise AssertionError(msg)
         assert saved is not None, "did not receive saved"
         assert (cfg.saved_dir / f"{saved['id']}.png").exists()
+
+
+def test_smoke_ws_two_pass_preview_then_refine(make_cfg, monkeypatch: pytest.MonkeyPatch) -> None:
+    if os.getenv("SPEAKSEE_OFFLINE", "").strip() in ("1", "true", "yes", "on"):
+        pytest.skip("SPEAKSEE_OFFLINE set")
+
+    cfg = make_cfg(**_MODELS, two_pass=True, width=128, height=128, preview_side=64)
+    monkeypatch.setenv("HF_HUB_DISABLE_TELEMETRY", "1")
+    monkeypatch.setenv("HF_HUB_DISABLE_PROGRESS_BARS", "1")
+
+    client = TestClient(create_app(cfg))
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"type": "generate", "prompt": "a cat sitting on a chair"})
+
+        seen = []
+        for _ in range(400):
+            msg = ws.receive_json()
+            if msg.get("type") == "error":
+                raise AssertionError(msg)
+            if msg.get("type") in ("gen_preview", "gen_result"):
+                seen.append(msg)
+                if msg["type"] == "gen_result":
+                    break
+        assert [m["type"] for m in seen] == ["gen_preview", "gen_result"]
+        preview, result = seen
+        assert preview["url"].startswith("data:image/") and (preview["width"], preview["height"]) == (64, 64)
+        assert result["quality"] == "final" and result["seed"] == preview["seed"]
+
+        img_resp = client.get(result["url"])
+        assert img_resp.status_code == 200
+        assert Image.open(io.BytesIO(img_resp.content)).size == (128, 128)
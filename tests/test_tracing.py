@@ -0,0 +1,69 @@
+import asyncio
+import json
+import threading
+
+from speaksee.tracing import Tracer, new_trace_id, set_trace
+
+
+def test_spans_outside_a_trace_are_not_recorded() -> None:
+    t = Tracer()
+    set_trace(None)
+    with t.span("idle"):
+        pass
+    assert t.spans() == []
+
+
+def test_trace_follows_tasks_and_worker_threads() -> None:
+    t = Tracer()
+
+    def decode() -> str:
+        with t.span("stt.decode", kind="final"):
+            return threading.current_thread().name
+
+    async def utterance() -> str:
+        set_trace(new_trace_id())
+        with t.span("stt.final"):
+            return await asyncio.to_thread(decode)
+
+    worker = asyncio.run(utterance())
+    spans = t.spans()
+    assert [s.name for s in spans] == ["stt.final", "stt.decode"]
+    assert spans[0].trace_id == spans[1].trace_id
+    assert spans[1].thread_name == worker != spans[0].thread_name
+    assert spans[1].args == {"kind": "final"}
+
+
+def test_chrome_trace_format() -> None:
+    t = Tracer()
+    a, b = new_trace_id(), new_trace_id()
+    t.add("utterance", 1.0, 1.5, trace_id=a)
+    t.add("generate", 1.5, 2.0, trace_id=a, steps=4)
+    t.add("generate", 3.0, 3.1, trace_id=b)
+
+    events = t.chrome_trace(a)["traceEvents"]
+    spans = [e for e in events if e["ph"] == "X"]
+    assert [e["name"] for e in spans] == ["utterance", "generate"]
+    assert spans[1]["dur"] == 500000.0
+    assert spans[1]["args"] == {"trace_id": a, "steps": 4}
+    assert {e["name"] for e in events if e["ph"] == "M"} == {"process_name", "thread_name"}
+    json.dumps(t.chrome_trace())  # serializable as-is
+
+
+def test_jsonl_log_and_buffer_limit(make_cfg) -> None:
+    cfg = make_cfg(trace_buffer=2, trace_log=True)
+    t = Tracer()
+    t.configure(cfg)
+    trace_id = new_trace_id()
+    for i in range(3):
+        t.add(f"span{i}", float(i), i + 0.25, trace_id=trace_id)
+    assert [s.name for s in t.spans()] == ["span1", "span2"]
+    lines = (cfg.data_dir / "logs" / "traces.jsonl").read_text().splitlines()
+    assert len(lines) == 3
+    assert json.loads(lines[0])["dur_ms"] == 250.0
+
+
+def test_disabled_tracer_records_nothing(make_cfg) -> None:
+    t = Tracer()
+    t.configure(make_cfg(trace_buffer=0))
+    t.add("x", 0.0, 1.0, trace_id=new_trace_id())
+    assert t.spans() == []
@@ -0,0 +1,87 @@
+import threading
+from pathlib import Path
+
+from speaksee.config import Config
+from speaksee.tts import TtsWorker, audio_mime
+
+
+class _FakeEngine:
+    def __init__(self) -> None:
+        self.said = []
+        self.saved = []
+        self.queued = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def getProperty(self, name):
+        return {"voice": "v1", "rate": 200}[name]
+
+    def say(self, text):
+        self.queued.append(("say", text, None))
+
+    def save_to_file(self, text, path):
+        self.queued.append(("save", text, path))
+
+    def runAndWait(self):
+        self.gate.wait(5)
+        for kind, text, path in self.queued:
+            if kind == "say":
+                self.said.append(text)
+            else:
+                self.saved.append(text)
+                Path(path).write_bytes(b"RIFF" + text.encode())
+        self.queued = []
+
+
+def test_one_engine_and_duplicates_coalesced(make_cfg) -> None:
+    engines = []
+
+    def factory():
+        engines.append(_FakeEngine())
+        engines[-1].gate.clear()
+        return engines[-1]
+
+    tts = TtsWorker(make_cfg(tts="speaker"), engine_factory=factory)
+    first = tts.speak("Busy")
+    while not engines or not engines[0].queued:
+        threading.Event().wait(0.01)
+    # While "Busy" is being said, repeats of a waiting phrase join it.
+    a, b, c = tts.speak("Saved"), tts.speak("Saved "), tts.speak("Regenerating")
+    assert a is b and a is not c
+    engines[0].gate.set()
+    for f in (first, a, c):
+        assert f.result(5) is None
+    assert engines[0].said == ["Busy", "Saved", "Regenerating"]
+    tts.speak("Saved").result(5)
+    assert len(engines) == 1
+    tts.close()
+
+
+def test_render_is_cached_on_disk_and_in_memory(cfg: Config) -> None:
+    engine = _FakeEngine()
+    tts = TtsWorker(cfg, engine_factory=lambda: engine)
+    assert tts.render("Saved").result(5) == b"RIFFSaved"
+    done = tts.render("Saved")
+    assert done.done() and done.result() == b"RIFFSaved"
+    assert engine.saved == ["Saved"]
+    assert [p.suffix for p in (cfg.data_dir / "cache" / "tts").iterdir()] == [".wav"]
+    tts.close()
+
+    # A new process renders nothing it already has on disk.
+    again = _FakeEngine()
+    tts = TtsWorker(cfg, engine_factory=lambda: again)
+    assert tts.render("Saved").result(5) == b"RIFFSaved"
+    assert again.saved == []
+    assert audio_mime(b"RIFFSaved") == "audio/wav" and audio_mime(b"FORM....AIFF") == "audio/aiff"
+    tts.close()
+
+
+def test_unavailable_engine_resolves_to_none(cfg: Config) -> None:
+    def broken():
+        raise RuntimeError("no audio driver")
+
+    tts = TtsWorker(cfg, engine_factory=broken)
+    assert tts.render("Saved").result(5) is None
+    assert tts.speak("Saved").result(5) is None
+    tts.close()
+    assert tts.render("More abstract").result(5) is None
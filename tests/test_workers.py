@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from speaksee.image_sd import GenerationCancelled, ImageGenResult
+from speaksee.workers import DistributedImageModels, GenerationWorker, NoWorkers, WorkerPool
+
+
+class _FakeGen:
+    def __init__(self, device: str, loaded=None) -> None:
+        self.device = device
+        self._loaded = dict(loaded or {})
+        self.prompts = []
+        self.release = threading.Event()
+        self.release.set()
+        self.on_start = None
+
+    def loaded(self):
+        return dict(self._loaded)
+
+    def generate(self, *, model_id, prompt, width, height, seed, on_progress, should_cancel, init_image=None, **kw):
+        self.prompts.append(prompt)
+        if self.on_start is not None:
+            self.on_start()
+        on_progress(1, 2)
+        while not self.release.wait(0.01):
+            if should_cancel():
+                raise GenerationCancelled()
+        on_progress(2, 2)
+        self._loaded[model_id] = "device"
+        color = "red" if init_image is None else init_image.getpixel((0, 0))
+        return ImageGenResult(
+            image=Image.new("RGB", (width, height), color), seed=seed, device=self.device, width=width,
+            height=height, model_id=model_id, steps_run=2,
+        )
+
+
+@pytest.fixture
+def cluster(make_cfg):
+    cfg = make_cfg(sd_model="m1", worker_listen="127.0.0.1:0", worker_key="secret", worker_wait_s=1.0)
+    pool = WorkerPool(cfg).start()
+    started = []
+
+    def add_worker(name: str, gen: _FakeGen) -> GenerationWorker:
+        w = GenerationWorker(cfg, gen, name=name)
+        threading.Thread(target=w.run, args=(pool.address, b"secret"), daemon=True).start()
+        started.append(w)
+        deadline = time.monotonic() + 5
+        while name not in {x.name for x in pool.workers()}:
+            assert time.monotonic() < deadline, f"{name} never registered"
+            time.sleep(0.01)
+        return w
+
+    yield cfg, pool, add_worker
+    for w in started:
+        w.stop()
+    pool.close()
+
+
+def _generate(models: DistributedImageModels, prompt: str, **kw) -> ImageGenResult:
+    return models.generate(prompt=prompt, negative_prompt="", steps=2, width=16, height=8, seed=1, **kw)
+
+
+def test_dispatch_prefers_loaded_model_then_free_workers(cluster) -> None:
+    cfg, pool, add_worker = cluster
+    cold, warm = _FakeGen("cpu"), _FakeGen("cuda:0", loaded={"m1": "device"})
+    add_worker("cold", cold)
+    add_worker("warm", warm)
+    models = DistributedImageModels(cfg, pool)
+
+    steps = []
+    res = _generate(models, "first", on_progress=lambda i, n: steps.append((i, n)), init_image=Image.new("RGB", (4, 4), "blue"))
+    assert warm.prompts == ["first"] and cold.prompts == []
+    assert steps == [(1, 2), (2, 2)]
+    assert res.image.size == (16, 8) and res.image.getpixel((0, 0)) == (0, 0, 255)
+    assert models.device == "cuda:0" and models.devices() == {"m1@warm": "cuda:0"}
+
+    # While "warm" is busy, the next generation goes to the free worker instead of waiting.
+    warm.release.clear()
+    busy = threading.Thread(target=_generate, args=(models, "slow"))
+    busy.start()
+    while not pool.snapshot() or max(w["inflight"] for w in pool.snapshot()) == 0:
+        time.sleep(0.01)
+    _generate(models, "second")
+    assert cold.prompts == ["second"]
+    warm.release.set()
+    busy.join()
+
+
+def test_lost_worker_is_retried_elsewhere(cluster) -> None:
+    cfg, pool, add_worker = cluster
+    doomed_gen, backup = _FakeGen("cuda:0", loaded={"m1": "device"}), _FakeGen("cuda:1")
+    doomed = add_worker("doomed", doomed_gen)
+    add_worker("backup", backup)
+    doomed_gen.release.clear()
+    doomed_gen.on_start = doomed.stop  # the worker dies mid-generation
+
+    res = _generate(DistributedImageModels(cfg, pool), "x")
+    assert doomed_gen.prompts == ["x"] and backup.prompts == ["x"]
+    assert res.device == "cuda:1"
+    assert [w["name"] for w in pool.snapshot()] == ["backup"]
+
+
+def test_cancel_and_missing_workers(cluster) -> None:
+    cfg, pool, add_worker = cluster
+    models = DistributedImageModels(cfg, pool)
+    with pytest.raises(NoWorkers):
+        _generate(models, "nobody home")
+
+    gen = _FakeGen("cpu")
+    gen.release.clear()
+    add_worker("w", gen)
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+    with pytest.raises(GenerationCancelled):
+        _generate(models, "slow", should_cancel=cancel.is_set)
+    assert pool.snapshot()[0]["inflight"] == 0